@@ -11,9 +11,12 @@ of each trial of each phase is also provided below the table. Note that the phas
 numbers used here differ from those used in the final manuscript; the order and 
 descriptions remain equatable.
 
-This code is entirely self-contained and requires no additional data or dependencies
-other than Python3 and an empty "data" folder at the same directory as this
-Python script. All graphics are built from scratch using Python's tkinter library.
+This code requires no additional data or dependencies other than Python3, an
+empty "data" folder at the same directory as this Python script, and the
+companion modules that sit alongside it (e.g., session_data.py, which writes
+the session data files, trial_generator.py, which lays out each trial, and
+arena_scene.py, which keeps the objects drawn on the canvas).
+All graphics are built from scratch using Python's tkinter library.
 
 This code was generated piece-by-piece, starting with phases 1-3. The order of
 several components (e.g., functions) is reflected by this.
@@ -267,13 +270,20 @@ operant_box_version = False
 
 # Then, import the necessary libraries to run:
 from tkinter import Tk, Label, Button, StringVar, OptionMenu, IntVar, \
-    Radiobutton, Toplevel, Canvas, PIESLICE, BOTH
-from math import copysign
-from datetime import datetime, date
-from csv import writer, QUOTE_MINIMAL
-from random import randint, choice
-from os import getcwd, mkdir, path as os_path
+    Radiobutton, Toplevel, Canvas, BOTH
+from random import Random
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from os import devnull, getcwd, mkdir, path as os_path
 from sys import setrecursionlimit, path as sys_path
+from time import perf_counter
+# Companion modules (found in the same directory as this script)
+from arena_scene import ArenaScene, MoveAnimator
+from session_data import BackgroundEventLogger, OnsetTimer, SessionClock, SessionColumnWriter, \
+    SessionCSVWriter, SessionEventBuffer, ONSET_METRICS_SUFFIX, TRIAL_LAYOUTS_HEADER, \
+    TRIAL_LAYOUTS_SUFFIX, format_offset_ns
+from trial_generator import TRAINING_PHASE_NAMES, TrialGenerator, new_session_seed, session_rngs, \
+    trial_layout_row
 
 # Import hopper/other specific libraries from files on operant box computers
 if operant_box_version:
@@ -331,30 +341,8 @@ class ExperimenterControlPanel(object):
         Label(self.control_window,
               text = "Select training").pack()
         self.training_phase_variable = IntVar()
-        self.training_phase_name_list = ["1.a: Fixed pacman position",
-                                    "1.b: Variable pacman position",
-                                    "2.a: Single cursor",
-                                    "2.b: Multiple cursors",
-                                    "3.a: Single cursor, one move",
-                                    "3.b: Multiple cursors, one move",
-                                    "3.b TEST",
-                                    "3.c: Single cursor, two moves",
-                                    "3.d: Multiple cursors, two moves",
-                                    "3.d TEST",
-                                    "4.a: Diagnal",
-                                    "4.a TEST",
-                                    "4.b: Random locations",
-                                    "5.a: Left single barrier",
-                                    "5.b: Right single barrier",
-                                    "5.c: Left double barrier",
-                                    "5.d: Right double barrier",
-                                    "5 TEST",
-                                    # "6.a: Portal training, one move",
-                                    # "6.b: Portal training, multiple moves",
-                                    # "6.c: Portal training, barrier (OPTIONAL)",
-                                    "6: Portal, green dot",
-                                    "7 TEST: Insight"
-                                    ]
+        # (The phases and their descriptions are listed in trial_generator.py)
+        self.training_phase_name_list = list(TRAINING_PHASE_NAMES)
         self.training_phase_variable = StringVar(self.control_window)
         self.training_phase_menu = OptionMenu(self.control_window,
                                   self.training_phase_variable,
@@ -374,6 +362,21 @@ class ExperimenterControlPanel(object):
                     text = "No",
                     value = False).pack()
         self.record_data_variable.set(True) # CHANGE Default set to True
+        # Binary data variable. If selected, the session data is ALSO written
+        # as a folder of binary NumPy (.npy) columns next to the .csv, which
+        # is much faster to load for analysis.
+        Label(self.control_window,
+              text = "Also record binary (.npy) data?").pack()
+        self.record_binary_data_variable = IntVar()
+        Radiobutton(self.control_window,
+                    variable = self.record_binary_data_variable,
+                    text = "Yes",
+                    value = True).pack()
+        Radiobutton(self.control_window,
+                    variable = self.record_binary_data_variable,
+                    text = "No",
+                    value = False).pack()
+        self.record_binary_data_variable.set(False) # Default set to False
         # Start/exit buttons
         Button(self.control_window,
                text = 'Start program',
@@ -417,6 +420,7 @@ class ExperimenterControlPanel(object):
                 training_phase_str, # Which training phase (as string)
                 self.record_data_variable.get(), # T/F to record data
                 self.data_folder_directory, # Directory to data folder
+                self.record_binary_data_variable.get(), # T/F to also record binary data
                 )
         else:
             if not self.subject_ID_variable.get() in self.pigeon_name_list:
@@ -428,24 +432,39 @@ class ExperimenterControlPanel(object):
 
 class MainScreen(object):
     # The Mainscreen object is passed the Hopper object, subject_ID (string),
-    # training phase (number 0 - 1), and the record data value (T/F) in that
-    # order.
-    def __init__(self, Hopper, ID, training_phase, record_data, data_folder_directory):
+    # training phase (number 0 - 1), the record data value (T/F), the data
+    # folder directory, and whether binary data is also recorded (T/F) in 
+    # that order. To run a session without a window (and with a simulated
+    # subject), it can also be passed a VirtualRoot as "headless" (see 
+    # headless_session.py and run_headless_session() below). Everything
+    # random in the session comes from its seed, which is new every session
+    # unless one is passed in (e.g., to run the exact same trials again).
+    def __init__(self, Hopper, ID, training_phase, record_data, data_folder_directory,
+                 record_binary_data=False, headless=None, seed=None):
         # First set the passed variables to be inherent variables within the
         # newly created MainScreen object
         self.Hopper = Hopper
         self.training_phase = training_phase
         self.record_data = record_data
+        self.record_binary_data = record_binary_data # Also write .npy columns alongside the .csv
         self.data_folder_directory = data_folder_directory
         self.subject = ID # Name of each subject
+        self.headless = headless
         # Then, set up the required tkinter objects/variables required to build
         # the GUI screen and to keybind any functions
-        self.root = Toplevel()
+        if headless is not None:
+            self.root = headless # The virtual root runs the session instead of Tk
+            headless.screen = self
+        else:
+            self.root = Toplevel()
         self.root.title("P032a: Insight Task Training") # this is the title of the windows
         self.mainscreen_height = 600 # height of the experimental canvas screen
         self.mainscreen_width = 800 # width of the experimental canvas screen
         self.root.bind("<Escape>", self.exit_program) # bind exit program to the "esc" key
-        if operant_box_version: 
+        if headless is not None:
+            # Nothing is drawn in a headless session (see headless_session.py)
+            self.mastercanvas = headless.canvas
+        elif operant_box_version: 
             # Keybind relevant keys
             self.cursor_visible = True # Cursor starts on...
             self.change_cursor_state("event") # turn off cursor UNCOMMENT
@@ -482,14 +501,22 @@ class MainScreen(object):
         self.banana_direction = None # this is the banana direction (NESW) from the pacman for phases 4 and 6
         self.move_keys = ["w", "d","s","a"] # Keybound arrows to move pacman N/E/S/W
         self.move_distance = 120 # this is the distance (in pixels) the pacman moves
-        self.movement_resolution = 2 # The number of pixels moved per loop iteration
-        self.ms_per_pixel_speed = 8 * self.movement_resolution # This is the pacman movement speed in ms per pixel
+        self.movement_resolution = 2 # Pacman speed: this many pixels moved...
+        self.ms_per_pixel_speed = 8 * self.movement_resolution # ...every this many ms
         # Pacman-specific variables
         self.pacman_color = "red" # the color of the pacman object
         self.pacman_size = 60 # length and width of pacman object
         self.pacman_move_delay = 600 # Delay in ms for pacman after oval is pecked
+        # The pacman's location is kept as a grid location (see 
+        # convert_grid_to_coordinate()); its pixel coordinates onscreen are
+        # always worked out from it, never read back from the canvas.
+        self.pacman_grid_location = None # Set when the pacman is built (and after each move)
+        self.pacman_destination = None # Where the pacman is moving to (or last moved to)
+        self.pacman_coords = None # Pixel coordinates of self.pacman_grid_location
         self.goal_coords = None # The coordinates for the goal will be reset later
+        self.goal_grid_location = None
         self.green_dot_coords = None
+        self.green_dot_grid_location = None
         # Timing variables (in milliseconds)
         self.reinforcer_interval = 3 * 1000 # Length of reinforcer access
         self.ITI_duration = 5 * 1000 # Inter-trial interval duration
@@ -502,7 +529,7 @@ class MainScreen(object):
         # the same across trials within each session type
         if self.training_phase in ["1.a", "1.b", "2.a", "2.b", "6.a","6.b", "6.c", "6"]: # If there's no goal
             self.trial_par = None
-        self._ideal_strategy = "nonportal" # Default strategy is not to use a portal
+        self.ideal_strategy = "nonportal" # Default strategy is not to use a portal
     
         # Below is a counter for the current moves in each trial. If it exceeds 
         # the trial_par value declared above, then the trial ends and results
@@ -512,17 +539,31 @@ class MainScreen(object):
         
         ## All the code related to data collection is seted bellow. By the end of each
         # trial, a different csv document is created, with the corresponding data. 
-        self.start_time = datetime.now() # This is where the beggining time of the trial is seted 
-        self.local_trial_timer = datetime.now() # Tracks time w/in each trial
-        # The following matrix corresponds to the initial and empty matrix that will be
-        # completed with the data from the trial. The first list (or "row" in
-        # the matrix are the column header values).
-        self.session_data_matrix =  [["Time", "EventType", "Xcord", "Ycord",
-                                    "TransformedXcord", "TransformedYcord",
-                                    "PacmanXcord", "PacmanYcord",
-                                    "TrialNum", "MoveCounter","TrialPar",
-                                    "TrialTime", "Subject", "TrainingPhase",
-                                    "Date", "InsightTrialType"]]
+        # All event times are measured by a single monotonic session clock,
+        # in nanoseconds since the start of the session and of each trial.
+        if headless is not None:
+            self.session_clock = SessionClock(headless.virtual_time_ns)
+        else:
+            self.session_clock = SessionClock()
+        self.start_time = self.session_clock.session_start_time # This is where the beggining time of the trial is seted 
+        # The following buffer holds the most recent data from the session,
+        # one row per event (the column headers are in SESSION_DATA_HEADER).
+        # It has a fixed size: whenever it fills up (or a trial ends), its
+        # rows are moved out to the data file so that memory use stays the
+        # same regardless of session length.
+        self.session_data_buffer = SessionEventBuffer(spill = self.spill_session_data)
+        # The data file itself is only opened once the session begins (see
+        # open_data_file()). Rows are appended to it as they leave the buffer.
+        self.data_file_writer = None
+        self.binary_data_writer = None # Only used if record_binary_data
+        self.layout_file_writer = None # The layout of every trial (see set_up_trial())
+        # Events are formatted and written by a background thread, so that
+        # the tkinter callbacks never have to wait on printing or the disk.
+        # (In a headless session, events come much faster than in real time, 
+        # so there is no limit on how many can wait to be written.)
+        self.event_logger = BackgroundEventLogger(self.record_event,
+                                                  self.save_data_file,
+                                                  max_queued = 0 if headless is not None else 10000)
         
         ## BARRIERS AND BORDERS:
         # This is where any barrier dimensions are stated in the matrix below, or 
@@ -556,6 +597,18 @@ class MainScreen(object):
         # used to assign locations of objects.
         self.horizontal_moves_in_arena = (self.mainscreen_width - self.border_depth_dict["left"] - self.border_depth_dict["right"] - self.pacman_size) // self.move_distance
         self.vertical_moves_in_arena = (self.mainscreen_height - self.border_depth_dict["bottom"] - self.border_depth_dict["top"]- self.pacman_size) // self.move_distance
+        # The layout of each trial is generated outside of tkinter (see
+        # trial_generator.py), for an arena of this many columns and rows.
+        # Its random numbers (and those of the cursor chosen in 2.a) all come
+        # from the session seed, which is written to the data file so that
+        # the session can be replayed later (see replay_session.py).
+        self.session_seed = seed if seed is not None else new_session_seed()
+        print(f"Session seed: {self.session_seed}")
+        layout_rng, self.cursor_rng = session_rngs(self.session_seed)
+        self.trial_generator = TrialGenerator(self.training_phase,
+                                              layout_rng,
+                                              self.horizontal_moves_in_arena + 1,
+                                              self.vertical_moves_in_arena + 1)
         # These are the base banana dimensions. They are further calculated
         # from the goal coordinates (when determined)
         self.base_banana_dimensions = [11, 0, 12, 1, 13, 2, 12, 4, 12, 5, 11,
@@ -572,34 +625,54 @@ class MainScreen(object):
                                              26, 32, 24, 32, 22, 31, 19, 29, 17,
                                              28, 14, 25, 12, 23, 10, 20, 8, 16,
                                             7, 14]
-        # A list of all the objects in "preset" insight levels
-        self.insight_trial_dictionaries = [{"Trial Type": 7.1,
-                                            "Pacman Grid Location":[0,2],
-                                                "Banana Grid Location": [5,0],
-                                                "Barrier Grid Matrix":[[1,2],[4,0],[4,1], [4,2]],
-                                                "Portal Grid Matrix":[[2,3],[6,1]]},
-                                           {"Trial Type": 7.2,
-                                                "Pacman Grid Location":[5,0],
-                                                "Banana Grid Location": [0,2],
-                                                "Barrier Grid Matrix":[[1,2], [3,0],[3,1],[3,2]],
-                                                "Portal Grid Matrix":[[2,3],[6,2]]},
-                                           {"Trial Type": 7.3,
-                                                "Pacman Grid Location":[2,2],
-                                                "Banana Grid Location": [5,0],
-                                                "Barrier Grid Matrix":[[1,2], [4,0],[4,1],[4,2]],
-                                                "Portal Grid Matrix":[[0,3],[6,1]]},
-                                           {"Trial Type": 7.4,
-                                                "Pacman Grid Location":[5,0],
-                                                "Banana Grid Location": [2,2],
-                                                "Barrier Grid Matrix":[[1,2], [3,0],[3,1],[3,2]],
-                                                "Portal Grid Matrix":[[0,3],[6,2]]},
-                                           {"Trial Type": 7.5,
-                                                "Pacman Grid Location":[2,1],
-                                                "Banana Grid Location": [5,2],
-                                                "Barrier Grid Matrix":[[1,2],[3,1],[3,2]],
-                                                "Portal Grid Matrix":[[0,3],[-1,0]]}
-                                           ]
+        # The preset insight levels (7 TEST) are in trial_generator.py
         self.insight_trial_type = None # This will be changed
+        # Every object on the canvas (including the cursor ovals) is built
+        # once, here, and then reused every trial (see arena_scene.py). Their
+        # tags only need to be bound to their functions this one time.
+        self.scene = ArenaScene(self.mastercanvas,
+                                self.mainscreen_width,
+                                self.mainscreen_height,
+                                self.border_dimensions_matrix,
+                                self.pacman_color,
+                                self.oval_tags,
+                                batched = headless is None)
+        self.background = self.scene.background
+        self.pacman = self.scene.pacman
+        self.pacman_bkgrd = self.scene.pacman_bkgrd
+        for tag, event_type in [("background_tag", "BackgroundPeck"),
+                                ("banana_func", "BananaPeck"),
+                                ("green_dot_tag", "GreenDotPeck")]:
+            self.mastercanvas.tag_bind(tag,
+                          "<Button-1>",
+                          lambda event,
+                          event_type = event_type:
+                          self.write_event_data(event_type,event.x,event.y))
+        self.mastercanvas.tag_bind("pacman_tag",
+                      "<Button-1>",
+                      self.pacman_pressed)
+        # The pacman (and its background) are moved by the pacman animator.
+        # When headless, there is nothing to animate, so each move is a 
+        # single "frame" at the end of the move.
+        self.pacman_animator = MoveAnimator(self.root, self.mastercanvas, "pacman_tag",
+                                            frame_interval = 16 if headless is None else 60000,
+                                            clock = self.session_clock.clock)
+        # The same goes for the four cursor ovals (and their move keys)
+        self.ovals_shown = [] # Tags of the ovals currently onscreen
+        for oval_tag, move_key in zip(self.oval_tags, self.move_keys):
+            self.mastercanvas.tag_bind(oval_tag,
+                          "<Button-1>",
+                          lambda event,
+                          oval_tag = oval_tag:
+                          self.cursor_pressed(event, oval_tag))
+            self.root.bind(move_key,
+                           lambda event,
+                           oval_tag = oval_tag:
+                           self.cursor_pressed(event, oval_tag))
+        self.prepared_trial = None # The next trial, once prepared (see prepare_trial())
+        # The onset timer measures how late each stage of the trial (e.g.,
+        # the trial itself, or the ITI) actually appears onscreen
+        self.onset_timer = OnsetTimer(self.session_clock)
         self.portal_accessed = False
         # Below is are the functions that are called to first kick-off the 
         # program for the first trial. 
@@ -620,21 +693,22 @@ class MainScreen(object):
             # objects off the mnainscreen (making it blank), unbinds the spacebar to 
             # the first_ITI link, followed by a 30s pause before the first trial to 
             # let birds settle in and acclimate.
-            self.start_time = datetime.now() # reset when first trial actually starts
-            self.mastercanvas.delete("all")
+            self.start_time = self.session_clock.start_session() # reset when first trial actually starts
+            self.open_data_file() # The data file is named after the start time
+            self.scene.clear()
+            self.scene.flush()
             self.root.unbind("<space>")
             # After that's established, we can start setting up the first trial
             if self.subject == "TEST": # If test, don't worry about first ITI delay
-                self.root.after(3, lambda: self.set_up_trial())
+                self.schedule_trial(3)
             else:
-                self.root.after(30000, lambda: self.set_up_trial())
+                self.schedule_trial(30000)
         
         if operant_box_version:
             self.root.bind("<space>", first_ITI) # bind cursor state to "space" key
-            self.mastercanvas.create_text(350,300,
-                                          fill="white",
-                                          font="Times 20 italic bold",
-                                          text=f"Place bird in box, then press space \n Subject: {self.subject} \n Training Phase: {self.training_phase}")
+            self.scene.show_message(f"Place bird in box, then press space \n Subject: {self.subject} \n Training Phase: {self.training_phase}",
+                                    fill = "white")
+            self.scene.flush()
         else:
             first_ITI("event")
         
@@ -738,18 +812,34 @@ class MainScreen(object):
 
         return [bkgrd, portal]
         
-    def set_up_trial (self):
-        # This is the first function called to set up each trial. It builds
-        # all the objects for each trial and is pretty lengthy. Note that it
-        # asks for the self.training_phase to determine which objects should
-        # be built.
-        
-        def rand_grid_location():
-            # This just returns a random x/y location on the 6x3 grid of
-            # active space.
-            return ([randint(0, self.horizontal_moves_in_arena),
-                     randint(0, self.vertical_moves_in_arena)
-                ])
+    def schedule(self, delay, stage):
+        # Schedules a stage of the trial (e.g., self.ITI) to start after
+        # "delay" ms, and tells the onset timer when it should start
+        self.onset_timer.schedule(stage.__name__, delay)
+        self.root.after(delay, stage)
+
+    def stage_drawn(self, stage_name):
+        # Called at the end of each stage. Everything the stage drew is sent
+        # to Tk (see arena_scene.py) and forced onto the screen 
+        # (update_idletasks), and then the onset timer records how late 
+        # (and how long to draw) the stage was.
+        self.scene.flush()
+        self.mastercanvas.update_idletasks()
+        return self.onset_timer.drawn(stage_name)
+
+    def schedule_trial(self, delay):
+        # Schedules the next trial to appear after "delay" ms. The next
+        # trial's layout (and everything about it that can be worked out
+        # ahead of time) is prepared right away in an idle callback, while
+        # the screen is still showing the reinforcer/ITI, so that very
+        # little is left to do at the moment the trial should appear.
+        self.schedule(delay, self.set_up_trial)
+        self.root.after_idle(self.prepare_trial)
+
+    def prepare_trial(self):
+        # This builds the layout of the next trial and converts it into the
+        # pixel coordinates of every object, without drawing anything. The
+        # result is kept in self.prepared_trial until set_up_trial() uses it.
         
         def calculate_banana_dims(x, y, coordinate_list):
             # This function calculates the new banana dimensions based on the 
@@ -769,727 +859,161 @@ class MainScreen(object):
                 is_x = not is_x
             return new_dimensions
         
-        def banana_location_from_pacman():
-            # This function randomly determines the orientation of banana to
-            # the goal based on the number of steps between them. It takes the
-            # training phase and returns the grid location of the banana.
-            location_determined = False
-            if self.training_phase in ["3.a","3.b","3.b TEST"]:
-                # This is true for phases in which the banana is a single step
-                # away from the pacman.
-                number_of_steps = 1
-            elif self.training_phase in ["3.c", "3.d", "3.d TEST"]:
-                # This is true for phases in which the banana is a two steps
-                # away from the pacman. 
-                number_of_steps = 2
-            while not location_determined:
-                banana_location = [0,0]
-                # As long as the projected location of the banana is not
-                # negative (e.g., it is within the bounds of the active space)
-                if self.training_phase in ["4.a","4.a TEST"]:
-                    # When the banana is at a diagnal from the pacman
-                    random_direction = choice(["northeast",
-                                               "southeast",
-                                               "southwest",
-                                               "northwest"])
-                else:
-                    random_direction = choice(["north",
-                                                "east",
-                                                "south",
-                                                "west"])
-                # Test if that direction is within the bounds...
-                if random_direction == "north":
-                    banana_location[0] = pacman_grid_location[0]
-                    banana_location[1] = pacman_grid_location[1] - number_of_steps
-                elif random_direction == "east":
-                    banana_location[0] = pacman_grid_location[0] + number_of_steps
-                    banana_location[1] = pacman_grid_location[1]
-                elif random_direction == "south":
-                    banana_location[0] = pacman_grid_location[0]
-                    banana_location[1] = pacman_grid_location[1] + number_of_steps
-                elif random_direction == "west":
-                    banana_location[0] = pacman_grid_location[0] - number_of_steps
-                    banana_location[1] = pacman_grid_location[1]
-                elif random_direction == "northeast":
-                    banana_location[0] = pacman_grid_location[0] + 1
-                    banana_location[1] = pacman_grid_location[1] - 1
-                elif random_direction == "southeast":
-                    banana_location[0] = pacman_grid_location[0] + 1
-                    banana_location[1] = pacman_grid_location[1] + 1
-                elif random_direction == "southwest":
-                    banana_location[0] = pacman_grid_location[0] - 1
-                    banana_location[1] = pacman_grid_location[1] + 1
-                elif random_direction == "northwest":
-                    banana_location[0] = pacman_grid_location[0] - 1
-                    banana_location[1] = pacman_grid_location[1] - 1
-                    
-                if 0 <= banana_location[0] <= self.horizontal_moves_in_arena and 0 <= banana_location[1] <= self.vertical_moves_in_arena:
-                    self.banana_direction = random_direction
-                    location_determined = True  
-        
-            return banana_location
-
-        def get_trial_par(pac_grid_list, ban_grid_list, bar_grid_list, portal_grid_matrix):
-            
-            # First, we build a matrix that represents all the possible moves in the arena.
-            # Dimensions of the arena matrix are calculated as the num. of columns equal
-            # to the number of possible horizontal moves plus two (to account for left/right
-            # borders) and rows equal to verical moves plus two (top/bottom borders).
-            # Each cell in this matrix will either be a 1 (representing a border or wall)
-            # or a 0 (open or "moveable" space). Below is an example of a 8c x 5r arena
-            # matrix representing a 6 x 3 movement arena.
-            # 
-            #         [[1, 1, 1, 1, 1, 1, 1, 1],
-            #          [1, 0, 0, 0, 0, 0, 0, 1], 
-            #          [1, 0, 0, 0, 0, 0, 0, 1], 
-            #          [1, 0, 0, 0, 0, 0, 0, 1],
-            #          [1, 1, 1, 1, 1, 1, 1, 1]]
-            # 
-            arena_matrix = [
-                 [1, 1, 1, 1, 1, 1, 1, 1],
-                 [1, 0, 0, 0, 0, 0, 0, 1], 
-                 [1, 0, 0, 0, 0, 0, 0, 1], 
-                 [1, 0, 0, 0, 0, 0, 0, 1],
-                 [1, 1, 1, 1, 1, 1, 1, 1]
-                 ]
-            
-            # Next up, lets create a function just prints a matrix passed to it
-            # (for testing)
-            def print_m(m):
-                for i in range(len(m)):
-                    for j in range(len(m[i])):
-                        print( str(m[i][j]).ljust(2),end=' ')
-                    print()
-            
-            # Next, we can add "barriers" into the arena. For example, let's put two
-            # barriers into the arena  at grid locations (x: 3, y: 2) and (x: 3, y: 3).
-            # Note that, for the arena matrix, this would actually be changing values at
-            # [2+1][3 + 1] and [3+1][3+1] because of the borders.
-            # 
-            #         [[1, 1, 1, 1, 1, 1, 1],
-            #          [1, 0, 0, 0, 0, 0, 1], 
-            #          [1, 0, 0, 1, 0, 0, 1], 
-            #          [1, 0, 0, 1, 0, 0, 1],
-            #          [1, 1, 1, 1, 1, 1, 1]]
-            # 
-            # Note that this algorithm will only work if there is a solution to the 
-            # maze (e.g., a path from pacman --> banana).
-            for c_list in bar_grid_list:
-                arena_matrix[c_list[1]+1][c_list[0]+1] = 1
-            
-            # print(" Arena matrix with borders/barriers:")
-            # print_m(arena_matrix)
-            # After we declare the arena matrix for this trial, we can declare the
-            # start location of the pacman and banana goal. For this example, we can place
-            # the pacman at (3,2)--bottom left side of the barrier--and the banana goal
-            # at (3,4)--bottom right of the barrier. For purely visualizition sake,
-            # locations of each are given below (note that these values are not actually
-            # changed in the matrix, which is always made up of zeros and ones):
-            #
-            #         1  1  1  1  1  1  1
-            #         1  0  0  0  0  0  1 
-            #         1  0  0  1  0  0  1 
-            #         1  0  P  1  B  0  1
-            #         1  1  1  1  1  1  1
-            #
-            # Additionally note that the xy coordinate order is reversed when 
-            # indicing a matrix when compared to our grid randomizer
-            
-            pacman_location = (pac_grid_list[1] + 1, pac_grid_list[0] + 1)
-            banana_location = (ban_grid_list[1] + 1, ban_grid_list[0] + 1)
-            
-            
-            # This code below builds another matrix that is full of zeros, except for the
-            # pacman starting point location that is filled in with a "1". It looks like: 
-            # 
-            #       0  0  0  0  0  0  0  
-            #       0  0  0  0  0  0  0   
-            #       0  0  0  0  0  0  0  
-            #       0  0  1  0  0  0  0  
-            #       0  0  0  0  0  0  0  
-            
-            move_matrix = []
-            for i in range(len(arena_matrix)):
-                move_matrix.append([])
-                for j in range(len(arena_matrix[i])):
-                    move_matrix[-1].append(0)
-            i,j = pacman_location
-            move_matrix[i][j] = 1
-            
-            # Next, we define a function that "makes a move" from the pacman starting
-            # point. The function starts by taking the new matrix above with a "1" pacman 
-            # starting point. Each point surrounding that start point that is not a 
-            # border/barrier in the original arena matrix (e.g., a potential "move") is
-            # then labeled with a "2." Next, every potential move surrounding those "2"s
-            # that are not a border/barrier or already filled will be filled in with a "3."
-            #  3's are then surrounded with 4's, etc. until finally a number is placed in
-            # the provided banana location. A visual representation of the end of this
-            # process for the matrix example above is:
-            #   
-            #       0  0  0  0  0  0  0  
-            #       0  4  3  4  5  6  0  
-            #       0  3  2  0  6  7  0  
-            #       0  2  1  0  7  0  0  
-            #       0  0  0  0  0  0  0  
-            
-            def make_move(k):
-              for i in range(len(move_matrix)): # For each row
-                for j in range(len(move_matrix[i])): # For each column
-                  if move_matrix[i][j] == k:
-                    if i>0 and move_matrix[i-1][j] == 0 and arena_matrix[i-1][j] == 0:
-                      move_matrix[i-1][j] = k + 1
-                    if j>0 and move_matrix[i][j-1] == 0 and arena_matrix[i][j-1] == 0:
-                      move_matrix[i][j-1] = k + 1
-                    if i<len(move_matrix)-1 and move_matrix[i+1][j] == 0 and arena_matrix[i+1][j] == 0:
-                      move_matrix[i+1][j] = k + 1
-                    if j<len(move_matrix[i])-1 and move_matrix[i][j+1] == 0 and arena_matrix[i][j+1] == 0:
-                       move_matrix[i][j+1] = k + 1
-            
-            # The k variable below the "move" count that we are currently on. It
-            # incrementally cycles through the make_move() function above until the 
-            # banana goal location value is changed from zero to another value.
-            # Also, there's a safety counter that will break the loop if 
-            # there's no solution.
-            k = 1
-            safety_counter = self.vertical_moves_in_arena * self.horizontal_moves_in_arena
-            while move_matrix[banana_location[0]][banana_location[1]] == 0:
-                make_move(k)
-                k += 1
-                safety_counter -= 1
-                if safety_counter < 0:
-                    print("No non-portal solution to maze")
-                    break
-            
-            if safety_counter > 0:    
-                print(f"Par (n = {k-1}) non-portal solution as matrix:")
-                print_m(move_matrix)
-                
-            # If the phase does NOT include portals, then we're done...
-            if portal_grid_matrix == None:
-                    return k-1
-            # if it does have portals, we perform the same thing EXCEPT now we
-            # include the portals in the arena matrix 
-            else:
-                portal1_location = (portal_grid_matrix[0][1] + 1,
-                                    portal_grid_matrix[0][0] + 1)
-                portal2_location = (portal_grid_matrix[1][1] + 1,
-                    portal_grid_matrix[1][0] + 1)
-                    
-                arena_matrix[portal1_location[0]][portal1_location[1]] = 2
-                arena_matrix[portal2_location[0]][portal2_location[1]] = 2
-    
-                
-                p_move_matrix = []
-                for i in range(len(arena_matrix)):
-                    p_move_matrix.append([])
-                    for j in range(len(arena_matrix[i])):
-                        p_move_matrix[-1].append(0)
-                i,j = pacman_location
-                p_move_matrix[i][j] = 1
-                
-                
-                def make_move_with_portal(m):
-                    p = False # tracks if portal was moved into
-                    for i in range(len(p_move_matrix)): # For each row
-                        for j in range(len(p_move_matrix[i])): # For each column
-                            if p_move_matrix[i][j] == m:
-                                if i>0 and p_move_matrix[i-1][j] == 0 and arena_matrix[i-1][j] != 1:
-                                    p_move_matrix[i-1][j] = m + 1
-                                    if arena_matrix[i-1][j] == 2:
-                                        p = True
-                                        coords = (i -1, j)
-                                if j>0 and p_move_matrix[i][j-1] == 0 and arena_matrix[i][j-1] != 1:
-                                    p_move_matrix[i][j-1] = m + 1
-                                    if arena_matrix[i][j-1] == 2:
-                                        p = True
-                                        coords = (i, j - 1)
-                                if i<len(p_move_matrix)-1 and p_move_matrix[i+1][j] == 0 and arena_matrix[i+1][j] != 1:
-                                    p_move_matrix[i+1][j] = m + 1
-                                    if arena_matrix[i+1][j] == 2:
-                                        p = True
-                                        coords = (i + 1, j)
-                                if j<len(p_move_matrix[i])-1 and p_move_matrix[i][j+1] == 0 and arena_matrix[i][j+1] != 1:
-                                    p_move_matrix[i][j+1] = m + 1
-                                    if arena_matrix[i][j+1] == 2:
-                                        p = True
-                                        coords = (i, j + 1)
-                                # Change portal values (if needed)        
-                                if p:
-                                    if coords == portal1_location:
-                                        p_move_matrix[portal2_location[0]][portal2_location[1]] = m 
-                                    elif coords == portal2_location:
-                                        p_move_matrix[portal1_location[0]][portal1_location[1]] = m 
-                    return p # True or false if portal was accessed
-                
-                # The m variable below the "move" count that we are currently on. It
-                # incrementally cycles through the make_move() function above until the 
-                # banana goal location value is changed from zero to another value.
-                # Also, there's a safety counter that will break the loop if 
-                # there's no solution.
-                m = 1
-                safety_counter = self.vertical_moves_in_arena * self.horizontal_moves_in_arena
-                while p_move_matrix[banana_location[0]][banana_location[1]] == 0:
-                    portal_accessed = make_move_with_portal(m)
-                    if not portal_accessed:
-                        m += 1
-                    safety_counter -= 1
-                    if safety_counter < 1:
-                        print("ERROR: Actually no solution to maze")
-                        break
-                    
-                # Then print...
-                if safety_counter > 0:    
-                    print(f"Par (n = {m-1}) solution as matrix:")
-                    print_m(p_move_matrix)
-                
-                # Determine ideal strategy (non-portal vs. portal)
-                if m < k: 
-                    self.ideal_strategy = "portal"
-                else:
-                    self.ideal_strategy = "nonportal"
+        if self.prepared_trial is not None: # Already prepared
+            return
+        # Where everything goes (in grid units), as well as the trial par, is
+        # decided by the trial generator (see trial_generator.py). In phases
+        # 2.a and 2.b, it is told where the pacman was left last trial.
+        previous_pacman_grid_location = None
+        if self.pacman_grid_location is not None:
+            previous_pacman_grid_location = list(self.pacman_grid_location)
+        trial = self.trial_generator.next_trial(previous_pacman_grid_location)
+        prepared = {"trial": trial,
+                    "pacman_coords": self.convert_grid_to_coordinate(*trial.pacman),
+                    "barrier_dimension_matrix": [],
+                    "barrier_rectangles": [],
+                    "portal_dims": None,
+                    "goal_coords": None,
+                    "green_dot_coords": None}
+        # After the grid locations are determined, everything is converted to
+        # coordinate units in order to be built. Here, we blow up the barrier 
+        # size to 2x the size of the pacman or (more importantly) half the 
+        # size of a move plus the pacman size. Additionally, we shrink the 
+        # width (x values) very slightly to account for aesthetic overlap with
+        # adjacent portals (or widen it, in phase 6 where barriers fill the
+        # arena).
+        if self.training_phase in ["6"]:
+            width_multiplier = 0.25
+        else:
+            width_multiplier = 0.15
+        for grid_coord in trial.barriers:
+            prepared["barrier_dimension_matrix"].append(self.convert_grid_to_coordinate(*grid_coord))
+        for barrier_dim in prepared["barrier_dimension_matrix"]:
+            prepared["barrier_rectangles"].append([barrier_dim[0] - int(self.move_distance * width_multiplier),
+                                                   barrier_dim[1] - int(self.move_distance * 0.25),
+                                                   barrier_dim[2] + int(self.move_distance * width_multiplier),
+                                                   barrier_dim[3] + int(self.move_distance * 0.25)])
+        # Portals are converted from grid units to the pixel units of both
+        # of their parts (see portal_grid_to_coordinate())
+        if trial.portals is not None:
+            prepared["portal_dims"] = [self.portal_grid_to_coordinate(*grid_list)
+                                       for grid_list in trial.portals]
+        # The banana's outline and stain are calculated from the goal
+        # coordinates
+        if trial.banana is not None:
+            prepared["goal_coords"] = self.convert_grid_to_coordinate(*trial.banana)
+            prepared["banana_dims"] = calculate_banana_dims(*prepared["goal_coords"][0:2],
+                                                            self.base_banana_dimensions)
+            prepared["banana_brown_dims"] = calculate_banana_dims(*prepared["goal_coords"][0:2],
+                                                                  self.base_banana_brown_dimensions)
+        if trial.green_dot is not None:
+            prepared["green_dot_coords"] = self.convert_grid_to_coordinate(*trial.green_dot)
+        # Finally, the barrier grid locations are kept as a set, and each
+        # portal is mapped to the portal at its other end, so that the
+        # pacman's moves can be checked with quick lookups
+        prepared["barrier_grid_locations"] = set(tuple(grid_coord) for grid_coord in trial.barriers)
+        prepared["portal_partners"] = {}
+        if trial.portals is not None:
+            first_portal, second_portal = [tuple(grid_list) for grid_list in trial.portals]
+            prepared["portal_partners"] = {first_portal: second_portal,
+                                           second_portal: first_portal}
+        self.prepared_trial = prepared
 
-            # Now that we've found all the potential paths from the banana to the pacman,
-            # we could potentially  isolate the shortest path form the banana to 
-            # the pacman. This isn't required of the current experiment (so is 
-            # commented out), but may be useful in the future! Note that the current 
-            # form isn't compatible with the portals (just a navigation maze), so it
-            # may need to be tweaked to work correctly. We can do this by working backwards
-            # from the banana goal: similarly to the make_move() function, we first look 
-            # around the end point for a value equal to the endpoint value minus one (in 
-            # the example matrix, it would be the "6" value north of (3, 4) at (2, 4).
-            # This will repeat until the k variable reaches the pacman start location. 
-            # A visual representaiton of this shortest path is below:
-            # 
-            #       0  0  0  0  0  0  0  
-            #       0  0  3  4  5  0  0  
-            #       0  0  2  0  6  0  0  
-            #       0  0  1  0  7  0  0  
-            #       0  0  0  0  0  0  0  
-            #
-            # As each step of the shortest path is found, the respective coordinate is
-            # appended to the "the_path" list. Additionally, a number of moves counter
-            # "n_moves" will incrementally increase by 1. After this while loop ends, the 
-            # "the_path" list holds each of the points in the path and the n_moves 
-            # counter will equal the par for that arena setup. 
-            # i, j = banana_location
-            # k = move_matrix[i][j]
-            # the_path = [(i,j)]
-            # n_moves = 0
-            # while k > 1:
-            #  if i > 0 and move_matrix[i - 1][j] == k-1:
-            #    i, j = i-1, j
-            #    the_path.append((i, j))
-            #    n_moves += 1
-            #    k-=1
-            #  elif j > 0 and move_matrix[i][j - 1] == k-1:
-            #    i, j = i, j-1
-            #    the_path.append((i, j))
-            #    n_moves += 1
-            #   k-=1
-            #  elif i < len(move_matrix) - 1 and move_matrix[i + 1][j] == k-1:
-            #    i, j = i+1, j
-            #    the_path.append((i, j))
-            #    n_moves += 1
-            #    k-=1
-            #  elif j < len(move_matrix[i]) - 1 and move_matrix[i][j + 1] == k-1:
-            #    i, j = i, j+1
-            #    the_path.append((i, j))
-            #    n_moves += 1
-            #   k -= 1
-            
-            # Finally, return the minimum number of moves required in the
-            # portal algorithm
-            return m-1
-            
-        ## Now set up objects in the arena:
-        
-        # 1) BARRIERS
-        self.barrier_dimension_matrix = [] # First clear existing matrix...
-        barrier_grid_coords = [] # And grid matrix
-        # In 5.a, 5.b (single), 6.a, and 6.b, there is at least one barrier
-        # built somewhere in the "middle" of the arena (e.g., x location
-        # between 2 and 5) and in any y location. First, the initial barrier
-        # is built...
-        if self.training_phase in ["5.a", "5.b", "5.c", "5.d", "5 TEST"]:
-            barrier_grid_coords.append([randint(1, self.horizontal_moves_in_arena - 1),
-                                        randint(0, self.vertical_moves_in_arena)])
-            width_multiplier = 0.15 # This value very slightly shrinks the width of barriers to aesthetically fit 
-        # Next, in 5.c and 5.d, there will be an additional barrier vertically
-        # aligned with the first barrier. It is either above or below (but
-        # the x-grid location) the first barrier. In the 5 TEST phase, there 
-        # is a 50:50 chance of a second barrier being built.
-        if self.training_phase in ["5.c", "5.d"] or (self.training_phase == "5 TEST" and choice([True, False])):
-            y_locations = list(range(0, self.vertical_moves_in_arena + 1)) # All possible vertical locations
-            y_locations.remove(barrier_grid_coords[0][1]) # Remove the vertical location of the existing barrier
-            barrier_grid_coords.append([barrier_grid_coords[0][0],
-                                       choice(y_locations)]) # Add new barrier to list
-        elif self.training_phase == "6.c":
-            xcord = randint(1, self.horizontal_moves_in_arena - 1)
-            for ycord in list(range(0, self.vertical_moves_in_arena + 1)):
-                barrier_grid_coords.append([xcord, ycord])    
-        # Next, if the training phase is 7 TEST then the barrier should be completely
-        # blocking access to the banana
-        elif self.training_phase in ["7 TEST"]:
-            width_multiplier = 0.15 # This value very slightly shrinks the width of barriers to aesthetically fit 
-            if self.trial_number <= len(self.insight_trial_dictionaries)*2:
-                object_location_dict = self.insight_trial_dictionaries[0]
-                self.insight_trial_dictionaries.remove(object_location_dict)
-                self.insight_trial_dictionaries.append(object_location_dict)
-            else:
-                object_location_dict = choice(self.insight_trial_dictionaries)
-            
-            self.insight_trial_type = object_location_dict["Trial Type"]
-            
-            barrier_grid_coords = object_location_dict["Barrier Grid Matrix"]
-        
-        elif self.training_phase in ["6"]:
-            for r in list(range(0, self.vertical_moves_in_arena + 1)):
-                for c in list(range(0, self.horizontal_moves_in_arena + 1)):
-                    barrier_grid_coords.append([c, r])
-            width_multiplier = 0.25 # This value very slightly widens the width of barriers to aesthetically fit
-        
-        ## 2) Portals
-        self.portal_grid_locations = None # For phases w/o portals
-        if self.training_phase in ["6.a", "6.b", "6.c", "6", "7 TEST"]:
-            # First, we determine every border location that a portal could
-            # potentially be built. We are only using the l/r/bottom borders
-            # (because the pigeons could not reach the top of the screen), and
-            # because our arena is 3 x 6 moves, we have a matrix of 12 possible
-            # xy coordinates (3*2 + 6), as follows:
-            #               [[-1,0],[-1,1], [-1,2],
-            #         [0,3],[1,3], [2,3], [3,3], [4,3], [5,3],
-            #                 [6,0],[6,1], [6,2]]
-            # We can create this matrix by:
-            possible_portal_location_matrix = []
-            for y in list(range(0,self.vertical_moves_in_arena)):
-                possible_portal_location_matrix.append([-1, y])
-                possible_portal_location_matrix.append([self.horizontal_moves_in_arena +1,y])
-            for x in list(range(0, self.horizontal_moves_in_arena)):
-                if self.training_phase == "6.c":
-                    if x != barrier_grid_coords[0][0]:
-                        possible_portal_location_matrix.append([x, self.vertical_moves_in_arena + 1])
-                elif self.training_phase == "6":
-                    if x in [0, self.horizontal_moves_in_arena]:
-                        possible_portal_location_matrix.append([x, self.vertical_moves_in_arena + 1])
-                else:
-                    possible_portal_location_matrix.append([x, self.vertical_moves_in_arena + 1])
-            # After the list is created/trimmed, we can choose the locations
-            # the two portals starting with the first:
-            choice1 = choice(possible_portal_location_matrix) # First portal can be anywhere
-            possible_portal_location_matrix.remove(choice1) # Remove from choices
-            # Next up, we have to make sure that the portals fall on either 
-            # side of the barriers (if there are barriers)
-            second_portal_found = False
-            # For 6.a, portals shouldn't be adjacent...
-            if self.training_phase in ["6.a", "6.b"]: # No barriers
-                if self.training_phase == "6.a":
-                    min_portal_dist = 1
-                elif self.training_phase == "6.b":
-                    min_portal_dist = 2
-                while not second_portal_found:
-                    choice2 = choice(possible_portal_location_matrix) # First portal can be anywhere
-                    if (choice2[0] > choice1[0] + min_portal_dist) or (choice2[0] < choice1[0] - min_portal_dist) or (choice2[1] > choice1[1] + min_portal_dist) or (choice2[1] < choice1[1] - min_portal_dist):
-                        second_portal_found = True 
-                self.portal_grid_locations = [choice1, choice2]# This should always be two elements long
-                
-            elif self.training_phase in ["6.c"]: # When barriers exist, should be on either side
-                while not second_portal_found:
-                    choice2 = choice(possible_portal_location_matrix)
-                    if (choice1[0] < barrier_grid_coords[0][0] and choice2[0] > barrier_grid_coords[0][0]) or (choice1[0] > barrier_grid_coords[0][0] and choice2[0] < barrier_grid_coords[0][0]):
-                        second_portal_found = True    
-                        self.portal_grid_locations = [choice1, choice2]# This should always be two elements long
-                
-            
-            elif self.training_phase == "6":
-                while not second_portal_found:
-                    choice2 = choice(possible_portal_location_matrix) # First portal can be anywhere
-                    if choice2[0] != choice1[0]  and choice2[0] -1 != choice1[0] and choice2[0] +1 != choice1[0]:
-                        second_portal_found = True 
-                self.portal_grid_locations = [choice1, choice2]# This should always be two elements long
-                
-            elif self.training_phase == "7 TEST":
-                self.portal_grid_locations = object_location_dict["Portal Grid Matrix"]
-                
-            
-        ## 2) PACMAN
-        if self.training_phase == "1.a":
-            # If the training phase is 1.a, then the pacman should just be 
-            # centered in the middle of the screen.
-            pacman_grid_location = [2, 1]
-        elif self.training_phase in ["2.a", "2.b"]:
-            # If the training phase is 2.a or 2.b, the pacman is built in the
-            # same location it was after moving in the prior trial. First trial
-            # is in a random location. If it is not the first trial, it will
-            # keep its previous value set in the "build_ovals" function
-            if self.trial_number == 1:
-                pacman_grid_location = rand_grid_location()
-        # Next up are phases built in relation to barriers
-        elif self.training_phase in ["5.a", "5.c"]: # Pacman is built LEFT of barrier(s)
-            pacman_grid_location = [barrier_grid_coords[0][0] - 1,
-                                    randint(0, self.vertical_moves_in_arena)]
-        elif self.training_phase in ["5.b", "5.d"]: # Pacman is built RIGHT of barrier(s)
-                pacman_grid_location = [barrier_grid_coords[0][0] + 1,
-                                randint(0, self.vertical_moves_in_arena)]
-        elif self.training_phase in ["5 TEST", "6.c"]:
-            if choice([True, False]):
-                pacman_LR = "Left" 
-                pacman_grid_location = [randint(0, barrier_grid_coords[0][0]-1),
-                                        randint(0, self.vertical_moves_in_arena)]
-            else:
-                pacman_LR = "Right" 
-                pacman_grid_location = [randint(barrier_grid_coords[0][0]+1, self.horizontal_moves_in_arena),
-                                        randint(0, self.vertical_moves_in_arena)]
-        # For 6.a, the pacman should be in front of portal choice number one
-        elif self.training_phase in ["6.a", "6"]:
-            if self.portal_grid_locations[0][0] < 0: # Portal is on left barrier
-                pacman_grid_location = [0, self.portal_grid_locations[0][1]]
-                self.portal_direction = "west"
-            elif self.portal_grid_locations[0][0] > self.horizontal_moves_in_arena: # Portal on right barrier
-                pacman_grid_location = [self.horizontal_moves_in_arena,
-                                        self.portal_grid_locations[0][1]]
-                self.portal_direction = "east"
-            elif self.portal_grid_locations[0][1] > self.vertical_moves_in_arena: # horizontal portal
-                pacman_grid_location = [self.portal_grid_locations[0][0],
-                        self.vertical_moves_in_arena]
-                self.portal_direction = "south"
-            if self.training_phase in ["6"]:
-                barrier_grid_coords.remove(pacman_grid_location)
-                barriers_to_remove = [[pacman_grid_location[0]+1, pacman_grid_location[1]],
-                                      [pacman_grid_location[0]-1, pacman_grid_location[1]],
-                                      [pacman_grid_location[0], pacman_grid_location[1]-1],
-                                      [pacman_grid_location[0], pacman_grid_location[1]+1],
-                                      [self.portal_grid_locations[1][0] +1, self.portal_grid_locations[1][1]],
-                                      [self.portal_grid_locations[1][0] -1, self.portal_grid_locations[1][1]],
-                                      [self.portal_grid_locations[1][0], self.portal_grid_locations[1][1] - 1],
-                                      [self.portal_grid_locations[1][0], self.portal_grid_locations[1][1] + 1]
-                                      ]
-                possible_green_dot_grid_locations = []
-                for b in barriers_to_remove:
-                    if b in barrier_grid_coords:
-                        barrier_grid_coords.remove(b)
-                        possible_green_dot_grid_locations.append(b)
-                
-        elif self.training_phase == "7 TEST":
-            pacman_grid_location = object_location_dict["Pacman Grid Location"]
-       # These base coordinates are randomly determined (for 6.b)
-        else: 
-            pacman_grid_location = rand_grid_location()
-            
-        self.pacman_coords = self.convert_grid_to_coordinate(*pacman_grid_location)
-         
+    def set_up_trial (self):
+        # This is the first function called to set up each trial. It builds
+        # all the objects for each trial and is pretty lengthy. Note that it
+        # asks for the self.training_phase to determine which objects should
+        # be built. The layout itself should already have been worked out
+        # by prepare_trial() during the ITI (if not, it is done now).
+        self.onset_timer.start("set_up_trial")
+        prepared_ahead = self.prepared_trial is not None
+        self.prepare_trial()
+        prepared = self.prepared_trial
+        self.prepared_trial = None
+        trial = prepared["trial"]
+        self.barrier_dimension_matrix = prepared["barrier_dimension_matrix"]
+        self.portal_grid_locations = trial.portals # None for phases w/o portals
+        self.portal_dims = prepared["portal_dims"]
+        self.barrier_grid_locations = prepared["barrier_grid_locations"]
+        self.portal_partners = prepared["portal_partners"]
+        self.insight_trial_type = trial.insight_trial_type
+        if trial.banana_direction is not None:
+            self.banana_direction = trial.banana_direction
+        if trial.portal_direction is not None:
+            self.portal_direction = trial.portal_direction
+        self.pacman_grid_location = tuple(trial.pacman)
+        self.pacman_destination = self.pacman_grid_location
+        self.pacman_coords = prepared["pacman_coords"]
+        if trial.banana is not None:
+            self.goal_grid_location = tuple(trial.banana)
+        if trial.green_dot is not None:
+            self.green_dot_grid_location = tuple(trial.green_dot)
+        # The layout is logged once, as the trial appears (it is only
+        # handed to the file during the ITI; see write_data_csv())
+        if self.layout_file_writer is not None:
+            self.layout_file_writer.write_row(trial_layout_row(trial))
 
-        # 3) BANANA
-        # Then, build the objects that aren't included in every training 
-        # phase (e.g., the banana). That includes phases 3.a through 4.a (4-8).
-        # This "if" statement asks if the banana is present in training. 
-        if self.training_phase not in ["1.a", "1.b", "2.a", "2.b", "6.a", "6.b", "6.c"]:
-            # For training phases without a barrier:
-            if self.training_phase in ["1.a", "1.b", "2.a", "2.b",
-                                       "3.a", "3.b", "3.c", "3.d", "4.a",
-                                       "3.b TEST", "3.d TEST", "4.a TEST"]:
-                # This function then determines the goal (banana) coordinates for
-                # this trial and phase number
-                banana_grid_location = banana_location_from_pacman()
-            elif self.training_phase in ["4.b"]:
-                # In 4.b, banana is in a random place (that is not the pacman)
-                banana_loc_determined = False
-                while not banana_loc_determined:
-                    banana_grid_location = rand_grid_location()
-                    self.goal_coords = self.convert_grid_to_coordinate(*banana_grid_location)
-                    if self.goal_coords != self.pacman_coords:
-                        banana_loc_determined = True
-                
-            # Next up are phases when the banana is built in relation to barriers
-            elif self.training_phase in ["5.a", "5.c"]: # Banana is built RIGHT of barrier(s)
-                banana_grid_location = [barrier_grid_coords[0][0] + 1,
-                                        randint(0, self.vertical_moves_in_arena)]
-            elif self.training_phase in ["5.b", "5.d"]: # Banana is built LEFT of barrier(s)
-                    banana_grid_location = [barrier_grid_coords[0][0] - 1,
-                                    randint(0, self.vertical_moves_in_arena)]
-            elif self.training_phase in ["5 TEST"]: # Banana can be L or R, depending on pacman
-                if pacman_LR == "Left": # Build banana right
-                    banana_grid_location = [randint(barrier_grid_coords[0][0]+1, self.horizontal_moves_in_arena),
-                        randint(0, self.vertical_moves_in_arena)]
-                else: # Left
-                    banana_grid_location = [randint(0, barrier_grid_coords[0][0]-1),
-                        randint(0, self.vertical_moves_in_arena)]
-             # Or if the banana should be in front of portal two       
-            # elif self.training_phase in ["6.a"]:
-            #     if self.portal_grid_locations[1][0] < 0: # Portal is on left barrier
-            #         banana_grid_location = [0, self.portal_grid_locations[1][1]]
-            #     elif self.portal_grid_locations[1][0] > self.horizontal_moves_in_arena: # Portal on right barrier
-            #         banana_grid_location = [self.horizontal_moves_in_arena,
-            #                                 self.portal_grid_locations[1][1]]
-            #     elif self.portal_grid_locations[1][1] > self.vertical_moves_in_arena: # horizontal portal
-            #         banana_grid_location = [self.portal_grid_locations[1][0],
-            #                                 self.vertical_moves_in_arena]
-            elif self.training_phase == "7 TEST":
-                banana_grid_location = object_location_dict["Banana Grid Location"]
-                    
-        # 4) GREEN DOT
-        if self.training_phase in ["6"]:       
-            green_dot_grid_location = choice(possible_green_dot_grid_locations)
-            
-        # After all the functions within the "setup_trail()" function are 
-        # declared, make sure canvas is cleaned and trial time is reset
-        self.mastercanvas.delete("all") 
+        # After the trial's layout is in hand, the trial time is reset
         print("*" * 75) # spacer
-        self.local_trial_timer = datetime.now()
+        self.session_clock.start_trial() # Trial time is reset
         
         
-        ## Then, the "base" widgets on top of that canvas are created (including the 
+        ## Then, the "base" widgets of the canvas are put in place (including the 
         # background, pacman, banana, and any barriers/borders that are previously
-        # stated). Note that the order in which widgets are created is correlated with
-        # with the order (or "layer") that the object is created onscreen.
+        # stated). These objects are only ever built once (see arena_scene.py);
+        # each trial, they are just moved to their new locations and shown.
+        # Their stacking order is the order in which they were first built.
         
-        # The background object is built first, and is tagged with a function
-        # that records a X/Y peck data point to the cumuilative dataframe.
-        self.background = self.mastercanvas.create_rectangle(0, 0,
-                                                             self.mainscreen_width,
-                                                             self.mainscreen_height,
-                                      fill = "black",
-                                      outline = "white",
-                                      width = 10,
-                                      tag = "background_tag")
-        # This function ties the background_tag tag to the write_event_data func 
-        self.mastercanvas.tag_bind("background_tag",
-                      "<Button-1>",
-                      lambda event,
-                      event_type = "BackgroundPeck":
-                      self.write_event_data(event_type,event.x,event.y))
-            
-        # Then the four borders are built on top of the background (North,
-        # East, South, and West).
-        for border_dim in self.border_dimensions_matrix:
-            self.mastercanvas.create_rectangle(border_dim,
-                                      fill = "white",
-                                      outline = "white")
+        # The background and borders go first, which also hides everything
+        # left over from the last trial. The background is tagged with a
+        # function that records a X/Y peck data point to the cumuilative
+        # dataframe (bound in __init__).
+        self.scene.show_arena()
 
-        # After the grid locations are determined, everything is converted to
-        # coordinate units in order to be built. Here, we blow up the barrier 
-        # size to 2x the size of the pacman or (more importantly) half the 
-        # size of a move plus the pacman size. Additionally, we shrink the 
-        # width (x values) very slightly to account for aesthetic overlap with
-        # adjacent portals.
-        for grid_coord in barrier_grid_coords:
-            self.barrier_dimension_matrix.append(self.convert_grid_to_coordinate(*grid_coord))
-        for barrier_dim in self.barrier_dimension_matrix:
-            self.mastercanvas.create_rectangle([barrier_dim[0] - int(self.move_distance * width_multiplier),
-                                                barrier_dim[1] - int(self.move_distance * 0.25),
-                                                barrier_dim[2] + int(self.move_distance * width_multiplier),
-                                                barrier_dim[3] + int(self.move_distance * 0.25)],
-                                               fill = "white",
-                                               outline = "white")
+        # The barriers (already converted to coordinate units) are next
+        self.scene.show_barriers(prepared["barrier_rectangles"])
             
         if self.training_phase in ["6.a", "6.b", "6.c", "6", "7 TEST"]:
-            # After the grid locations of both portals are determined, we
-            # need to convert the grid units to pixel units to actually 
-            # build the portals on the canvas.
-            self.portal_dims = [] # This is the actual coordinates of the portals
-            for grid_list in self.portal_grid_locations:
-                self.portal_dims.append(self.portal_grid_to_coordinate(*grid_list)) # Fills in the portal_dims list
-            # Finally, after we've determined the grid locations and calcualted the
-            # onscreen coordinates, we build the two-part portals:
-            for dim in self.portal_dims:
-                # Black square tunnel
-                self.mastercanvas.create_rectangle(dim[0],
-                                                   fill = "black",
-                                                   outline = "black") 
-                # Oval at the end of the tunnel
-                self.mastercanvas.create_oval(dim[1],
-                                              outline = "green",
-                                              tag = "portal",
-                                              fill = "#03fceb")
+            # After we've determined the grid locations and calcualted the
+            # onscreen coordinates, we show the two-part portals
+            self.scene.show_portals(self.portal_dims)
         
-        # The pacman background is just a blank square around the pacman to 
-        # track pecks and act as a reference point for the pacman object.
-        self.pacman_bkgrd = self.mastercanvas.create_rectangle(self.pacman_coords,
-                                      fill = "black",
-                                      outline = "black",
-                                      tag = "pacman_tag")
-        
-        # This is the actual pacman
-        self.pacman = self.mastercanvas.create_arc(self.pacman_coords,
-                                 fill= self.pacman_color,
-                                 outline = "white",
-                                 style=PIESLICE,
-                                 start=45,
-                                 extent=270,
-                                 tag = "pacman_tag")
-        # Bind tag to pacman function
-        self.mastercanvas.tag_bind("pacman_tag",
-                      "<Button-1>",
-                      self.pacman_pressed)
+        # The pacman (and its background, which is just a blank square around
+        # the pacman to track pecks and act as a reference point for the
+        # pacman object)
+        self.scene.show_pacman(self.pacman_coords)
         
         # Banana
         if self.training_phase not in ["1.a", "1.b", "2.a", "2.b", "6.a", "6.b", "6.c", "6"]:     
-            # After the banana grid location is set, we can calculate the actual 
-            # coordinates needed to build the banana
-            self.goal_coords = self.convert_grid_to_coordinate(*banana_grid_location)
-            
-            # After the goal coordinates are determined, we can then build the
+            # After the goal coordinates are determined, we can then show the
             # banana object
-            trial_banana_dims = calculate_banana_dims(*self.goal_coords[0:2],
-                                                      self.base_banana_dimensions)
-            trial_banana_brown_dims = calculate_banana_dims(*self.goal_coords[0:2],
-                                                      self.base_banana_brown_dimensions)
-            
-            self.banana_goal = self.mastercanvas.create_rectangle(self.goal_coords,
-                                          fill = "black",
-                                          outline = "black")
-
-            self.banana = self.mastercanvas.create_polygon(trial_banana_dims,
-                                                 fill = "yellow",
-                                                 outline = "white",
-                                                 tag = "banana_func")
-        
-            self.banana_brown = self.mastercanvas.create_polygon(trial_banana_brown_dims,
-                                                 fill = "brown",
-                                                 outline = "black",
-                                                 tag = "banana_func")
-
-            self.mastercanvas.tag_bind("banana_func",
-                          "<Button-1>",
-                          lambda event,
-                          event_type = "BananaPeck":
-                          self.write_event_data(event_type,event.x,event.y))
-                
+            self.goal_coords = prepared["goal_coords"]
+            self.scene.show_banana(self.goal_coords,
+                                   prepared["banana_dims"],
+                                   prepared["banana_brown_dims"])
                                 
-            # After the pacman and banana are built, we can find the number of 
-            # moves required to get reach the banana goal, or what we're calling
-            # the "par" for a trial. Note that this only applies to conditions
+            # The number of moves required to get reach the banana goal, or
+            # what we're calling the "par" for a trial, was found by the
+            # trial generator. Note that this only applies to conditions
             # with a banana.
-            self.trial_par = get_trial_par(pacman_grid_location,
-                                           banana_grid_location,
-                                           barrier_grid_coords,
-                                           self.portal_grid_locations)
+            if trial.par is None:
+                print("ERROR: No solution to maze")
+            else:
+                print(f"Par (n = {trial.par}) {trial.ideal_strategy} solution: {trial.path}")
+            self.trial_par = trial.par
+            self.ideal_strategy = trial.ideal_strategy
             
         elif self.training_phase in ["6"]:    
-            self.green_dot_coords = self.convert_grid_to_coordinate(*green_dot_grid_location)
+            self.green_dot_coords = prepared["green_dot_coords"]
             gdot_pixel_shrink_factor = 15
-            self.green_dot_bkgrd = self.mastercanvas.create_oval(self.green_dot_coords,
-                                          fill = "black",
-                                          outline = "black",
-                                          tag = "green_dot_tag")
-            self.green_dot = self.mastercanvas.create_oval([self.green_dot_coords[0] + gdot_pixel_shrink_factor,
-                                                                 self.green_dot_coords[1] + gdot_pixel_shrink_factor,
-                                                                 self.green_dot_coords[2] - gdot_pixel_shrink_factor,
-                                                                 self.green_dot_coords[3] - gdot_pixel_shrink_factor],
-                                          fill = "green",
-                                          outline = "black",
-                                          tag = "green_dot_tag")
-            # Bind tag to pacman function
-            self.mastercanvas.tag_bind("green_dot_tag",
-                          "<Button-1>",
-                          lambda event,
-                          event_type = "GreenDotPeck":
-                          self.write_event_data(event_type,event.x,event.y))
+            self.scene.show_green_dot(self.green_dot_coords, gdot_pixel_shrink_factor)
                 
-            
-        
-        
-        # Lastly, we need to bring the pacman to the front (above the banana)
-        self.mastercanvas.tag_raise(self.pacman)
+        # Lastly, log how late the trial appeared compared to when it was
+        # scheduled to (and whether its layout was ready ahead of time)
+        callback_latency_ns, draw_ns, onset_latency_ns = self.stage_drawn("set_up_trial")
+        print(f"Trial onset latency: {onset_latency_ns / 1000000:.2f} ms "
+              f"(callback {callback_latency_ns / 1000000:.2f} ms, draw {draw_ns / 1000000:.2f} ms, "
+              f"prepared ahead: {prepared_ahead})")
 
     
 # After the base widgets are initially created, the necessary functions are 
@@ -1502,35 +1026,33 @@ class MainScreen(object):
         # banana goal. Note that, except in test session tyes where "incorrect" 
         # choices are punished, this function is always called at the very 
         # end of every trial.
-        self.mastercanvas.delete("all") # Delete all objects
+        self.onset_timer.start("begin_reinforcement")
+        self.scene.clear() # Hide all objects
         self.write_event_data("reinforcement", None, None)
         self.reinforcers_provided += 1 # A reinforcer is provided
         if operant_box_version:
             self.Hopper.change_hopper_state("On")
         else:
-            self.mastercanvas.create_text(350,300,
-                                          fill="red",
-                                          font="Times 20 italic bold",
-                                          text = ("Reinforcer for %ss" % int(self.reinforcer_interval/1000)))
-        self.root.after(self.reinforcer_interval, self.ITI)
+            self.scene.show_message("Reinforcer for %ss" % int(self.reinforcer_interval/1000))
+        self.stage_drawn("begin_reinforcement")
+        self.schedule(self.reinforcer_interval, self.ITI)
     
     def ITI(self):
         # The ITI not only functions as an intertrial interval delay, but also 
         # is where the trial to trial variables are reset prior to the next trial
         # because it is ALWAYS called between trials, regardless of non/reinforced 
         # behavior  
+        self.onset_timer.start("ITI")
         if operant_box_version:
             self.Hopper.change_hopper_state("Off")
         else:
-            self.mastercanvas.delete("all") # Delete all objects
-            self.mastercanvas.create_text(350,300,
-                                     fill="red",
-                                     font="Times 20 italic bold",
-                                     text=f"Trial {self.trial_number}: ITI for {int(self.ITI_duration/1000)}s")
+            self.scene.show_message(f"Trial {self.trial_number}: ITI for {int(self.ITI_duration/1000)}s")
+        self.stage_drawn("ITI")
         self.trial_number += 1
         self.current_trial_moves = 0
         self.portal_accessed = False
         self.ovals_onscreen = False
+        self.ovals_shown = []
         if self.reinforcers_provided >= self.max_reinforcers_per_session:
             # This exits the GUI screen and writes all the session data
             # that was collected to a final .csv document
@@ -1538,7 +1060,7 @@ class MainScreen(object):
 
         else:
             self.write_data_csv(False) # Update .csv data file with that trial's data
-            self.root.after(self.ITI_duration, self.set_up_trial)
+            self.schedule_trial(self.ITI_duration)
 
     def TO_period(self):
         # The timeout contingency is called only within "test" phases 3.b (5), 
@@ -1547,15 +1069,14 @@ class MainScreen(object):
         # match the banana coords after one move, they are punished with a TO. In 
         # 3.d and 4.a, they have two opportunitites to reach the banana (even if
         # then first is incorrect).
-        self.mastercanvas.delete("all")
+        self.onset_timer.start("TO_period")
+        self.scene.clear()
         self.write_event_data("TimeOutPeriod", None, None)
         if not operant_box_version:
-            self.mastercanvas.create_text(350,300,
-                             fill="red",
-                             font="Times 20 italic bold",
-                             text = ("INCORRECT CHOICE(S) \nTimeout for %ss") %
-                             int(self.TO_duration/1000))
-        self.root.after(self.TO_duration, self.ITI)
+            self.scene.show_message(("INCORRECT CHOICE(S) \nTimeout for %ss") %
+                                    int(self.TO_duration/1000))
+        self.stage_drawn("TO_period")
+        self.schedule(self.TO_duration, self.ITI)
         
             
     def pacman_pressed(self,event):
@@ -1579,8 +1100,8 @@ class MainScreen(object):
         # the pacman after it is pecked for the first time or after the pacman 
         # has moved. It calculates which ovals should be built around the
         # pacman in its current location (depending on proximity of barriers
-        # or borders). The build_oval function also contains all the movement
-        # and animation functions that are tied to each of the ovals.
+        # or borders). The ovals themselves are built only once (see 
+        # arena_scene.py) and are just moved into place and shown here.
         
         def get_oval_dim (oval_type, x1, y1, x2, y2):
             # This function returns relative dimensions of an oval based on the
@@ -1611,204 +1132,50 @@ class MainScreen(object):
                         x1 - self.oval_pacman_gap,
                         y1 + (y2 - y1)/2 + self.oval_width/2]
  
-        def convert_pacman_to_x_y(tag):
-            # This function converts the pacman tag string to the projected
-            # x and y coordinate movement that each pacman oval will have.
-            if tag == "north_oval_pacman":
-                return 0, -self.move_distance
-            elif tag == "east_oval_pacman":
-                return self.move_distance, 0
-            elif tag == "south_oval_pacman":
-                return 0, self.move_distance
-            elif tag == "west_oval_pacman":
-                return -self.move_distance, 0
-        
-        def check_for_overlap(x1, y1, x2, y2, move_x, move_y):
-            # The check_for_overlap function is passed six arguments:
-            #       1-4) the current dimensions of the existing curosor object:
-            #               x1, y1, x2, y2
-            #       5-6) any movement to the existing x or y paramters
-            # Then, the function creates a new set of "ghost" dimensions at the 
-            # projected space, given the move alterations.
-            x1 = int(x1 + move_x)
-            x2 = int(x2 + move_x)
-            y1 = int(y1 + move_y)
-            y2 = int(y2 + move_y)
-            # The overlap boolean (below) is a True/False value that tracks if
-            # there will be ANY overlap between the projected curosr coordinates
-            # and any barriers or borders, using the nested "FOR" loops below:
-            overlap = False
-            # First, before we look for overlap with walls or barriers, we
-            # should check if the projected location is bordering a portal
-            # for phases with portals
-            if self.training_phase in ["6.a", "6.b", "6.c", "6", "7 TEST"]:
-                for x in [x1, x2]:
-                    for portal in self.portal_dims:
-                        if x >= portal[0][0] and x <= portal[0][2]:
-                            for y in [y1, y2]:
-                                if y >= portal[0][1] and y <= portal[0][3]:
-                                    return False #overlap w/ portal
-            # "Combined matrix" combines any existing barrier coordinate lists with
-            # the border dimensions (in order to treat borders the same way as 
-            # barriers)
-            combined_matrix  = []
-            for dims in self.border_dimensions_matrix + self.barrier_dimension_matrix:
-                combined_matrix.append(dims)
-            # Next, this function checks for overlap between the curosr and borders/
-            # barrier x coordinates and y coordintes
-            for barrier_dimension_vector in combined_matrix:
-                for x in [x1, x2]:
-                    if x >= barrier_dimension_vector[0] and x <= barrier_dimension_vector[2]:
-                        for y in [y1, y2]:
-                            if y >= barrier_dimension_vector[1] and y <= barrier_dimension_vector[3]:
-                                overlap = True 
-                                break # If overlap exists, the for loop is broken
-            return overlap # This returns "True" if there is overlap and "False" if not
-        
-        
-        def animate_pacman(counter, location_x, location_y):
-            # First things first, quickly "raise" all the portal outlines
-            # just in case the pacman needs to pass through them
-            self.mastercanvas.tag_raise("portal")
-            # This function creates the animated movement of the pacman. The 
-            # counter loop continues to loop while the distance between pacman
-            # and the estimated distance of the movement (the counter) is
-            # larger than 0. When it reaches zero, the location is reached and
-            # the loop concludes.
-            if counter > 0: 
-                if location_x == 0: # move up/down
-                    self.mastercanvas.move(self.pacman,
-                                           0,
-                                           self.movement_resolution * int(copysign(1, location_y)))
-                    self.mastercanvas.move(self.pacman_bkgrd,
-                                           0,
-                                           self.movement_resolution * int(copysign(1, location_y)))
-                elif location_y == 0: # move left/right
-                    self.mastercanvas.move(self.pacman,
-                                           self.movement_resolution * int(copysign(1, location_x)), 0)
-                    self.mastercanvas.move(self.pacman_bkgrd,
-                                           self.movement_resolution * int(copysign(1, location_x)), 0)
-                counter -= 1 #As the pacman moves, the counter is reduced by one in each movement
-                             # indicating that the pacman is getting near to the estimated position of the hole movement
-                self.root.after(self.ms_per_pixel_speed,
-                                lambda: animate_pacman(counter, location_x, location_y))
-                
-            else: # the moving pacman has arrived at its stopping location
-                portal_exited = False
-                # First up, we should check if the pacman moved into a portal 
-                # (for portal phases)
-                if not self.training_phase in ["6.a", "6.b", "6.c", "6", "7 TEST"]:
-                    portal_exited = True # No portal to exit
-                else: # Phases with a portal...
-                    pac_coords = self.mastercanvas.coords(self.pacman)
-                    overlapping_portal = None
-                    for portal in self.portal_dims:
-                        for x in [pac_coords[0], pac_coords[2]]:
-                                if x >= portal[0][0] and x <= portal[0][2]:
-                                    for y in [pac_coords[1], pac_coords[3]]:
-                                        if y >= portal[0][1] and y <= portal[0][3]:
-                                            overlapping_portal = portal[0]
-                    # If the pacman is not inside a portal...
-                    if overlapping_portal == None:
-                        portal_exited = True
-                    # Else if the pacman IS in a portal, then find the new portal
-                    # grid location that the pacman should be transported to...
-                    else:
-                        # But first we should write it to the data sheet
-                        self.write_event_data("PortalActivated", None, None)
-                        new_portal_grid_location = None
-                        self.portal_accessed = True
-                        for grid_portal in self.portal_grid_locations:
-                            if self.portal_grid_to_coordinate(*grid_portal)[0] != overlapping_portal:
-                                new_portal_grid_location = grid_portal
-                        # With the new grid location discovered, we can move the
-                        # existing pacman to the new location inside the other portal
-                        new_pacman_coords = self.convert_grid_to_coordinate(*new_portal_grid_location)
-                        self.mastercanvas.coords(self.pacman, *new_pacman_coords)
-                        self.mastercanvas.coords(self.pacman_bkgrd, *new_pacman_coords)
-                        # Finally, once the pacman is moved to the other portal 
-                        # location, it should be moved back into the arena. We
-                        # need to find WHERE that is depending on the location
-                        # of the portal...
-                        if new_portal_grid_location[0] < 0: # Vertical portal on left moving right
-                            x, y = convert_pacman_to_x_y("east_oval_pacman")
-                        elif new_portal_grid_location[0] > self.horizontal_moves_in_arena:
-                            x, y = convert_pacman_to_x_y("west_oval_pacman")
-                        elif new_portal_grid_location[1] > self.vertical_moves_in_arena:
-                            x, y = convert_pacman_to_x_y("north_oval_pacman")
-                        # Once the new destination is determined, we again pass
-                        # this info back to this same "animate pacman" function
-                        animate_pacman(abs(x + y)/self.movement_resolution,
-                           x,
-                           y)
-                # Finally, if the destination has been reached AND that
-                # destination is not inside of a portal...   
-                if portal_exited:                                  
-                    self.build_oval() #By the end of the pacman's movement, the ovals are created again
-                
-        def move (event, passed_tag, passed_x, passed_y):
-            # Once built, each of the ovals is bound to this move functions
-            # with different tags and passed_x/y values. This is the function 
-            # that is called when an oval is pressed.
-            self.current_trial_moves += 1 # Add a move to the trial movement counter
-            self.write_event_data(passed_tag, event.x, event.y)
-            # First, delete all the ovals from the pacman (before moving)
-            for t in self.oval_tags:
-                self.mastercanvas.delete(t)
-            # Then unbind the keys...
-            for k in self.move_keys:
-                self.root.unbind(k)
-            # Next, move the pacman
-            animate_pacman(abs(passed_x + passed_y)/self.movement_resolution,
-                           passed_x,
-                           passed_y)
-                                        
     # After the functions are declared, then the code begins...
-        # First, update the pacman_coords variable. If the pacman is deleted
-        # off the screen between trials, the pacman_coords variable will
-        # track the previous pacman's coordinates.
-        self.pacman_coords = self.mastercanvas.coords(self.pacman)
+        # First, update the pacman's location to where it just moved. If the
+        # pacman is hidden between trials, these variables will track the
+        # previous pacman's location.
+        self.pacman_grid_location = self.pacman_destination
+        self.pacman_coords = self.convert_grid_to_coordinate(*self.pacman_grid_location)
         # Second, ALWAYS check if pacman has reached banana
-        if self.mastercanvas.coords(self.pacman) ==  self.goal_coords:
+        if self.pacman_grid_location == self.goal_grid_location:
             self.write_event_data("BananaReached", None, None)
-            self.mastercanvas.delete("pacman_tag")
-            self.mastercanvas.delete("banana_func")
-            self.mastercanvas.create_oval(self.goal_coords,
-                                     fill = self.pacman_color,
-                                     outline= "white")
-            self.root.after(750, self.begin_reinforcement)
+            self.scene.show_pacman_at_goal(self.goal_coords)
+            self.scene.flush()
+            self.schedule(750, self.begin_reinforcement)
         # Third, if the training phase is 2.a and 2.b (in which a peck on the
         # pacman followed by a peck on the cursor is reinforced), then the 
         # ovals are NOT built after the pacman is moved and reinforced .75s
         # after the pacman reaches its location
         elif self.training_phase in ["2.a", "2.b"] and self.current_trial_moves == 1:
-            self.root.after(750, self.begin_reinforcement)
+            self.schedule(750, self.begin_reinforcement)
         # Fourth, check if the trial par has been reached for test session 
         # types 3.b, 3.d, and 4.a. If the two values are equal, then the 
         # trial ends and results in a timeout after a brief (1s) pause with
         # no ovals onscreen. self.pacman_coords is saved for the next session
         elif self.training_phase in ["3.b", "3.d", "4.a"] and self.current_trial_moves == self.trial_par:
-            self.root.after(1000, self.TO_period)
+            self.schedule(1000, self.TO_period)
         # Fifth, in phases where usage of the portal is reinforced, check to see
         # if portal was acessed
         elif self.training_phase in ["6.a", "6.b", "6.c"] and self.portal_accessed:
-                self.root.after(750, self.begin_reinforcement)
-        elif self.training_phase in ["6"] and self.pacman_coords == self.green_dot_coords:
+                self.schedule(750, self.begin_reinforcement)
+        elif self.training_phase in ["6"] and self.pacman_grid_location == self.green_dot_grid_location:
                 self.write_event_data("GreenDotReached", None, None)
-                self.root.after(500, self.begin_reinforcement)
+                self.schedule(500, self.begin_reinforcement)
         # If neither of these are true, then we continue to build ovals 
         # around the pacman (e.g., start the next opportunity to move)
         else:
             #if not self.ovals_onscreen or rebuild:
             tags_of_ovals_to_build = []
+            current_pacman_coords = self.pacman_coords
+            current_grid_location = self.pacman_grid_location
             for tag in self.oval_tags:
                 # First, gather the ovals that should be built (e.g., not
-                # the ovals that overlap with the borders or barriers)
-                current_pacman_coords = self.mastercanvas.coords(self.pacman)
-                # And, get the projected pacman oval coordinates:
-                projected_x, projected_y = convert_pacman_to_x_y(tag)
-                # Second, check for potential overlap with that pacman oval:
-                if not check_for_overlap(*current_pacman_coords,  projected_x, projected_y):
+                # the ovals that would move the pacman into the borders or
+                # barriers)
+                projected_x, projected_y = self.convert_pacman_to_x_y(tag)
+                if not self.direction_blocked(*current_grid_location, projected_x, projected_y):
                     tags_of_ovals_to_build.append(tag)
                     
             if self.training_phase in ["2.a","3.a","3.c", "6.a"]:
@@ -1817,7 +1184,7 @@ class MainScreen(object):
                 # banana (or the portal, for 6.a)
                 correct_oval_tag_list = []
                 if self.training_phase == "2.a": # random direction
-                    correct_oval_tag_list.append(choice(tags_of_ovals_to_build))
+                    correct_oval_tag_list.append(self.cursor_rng.choice(tags_of_ovals_to_build))
                 else: # If oval direction is dependent upon banana or portal...
                     if self.training_phase == "6.a":
                         correct_direction = self.portal_direction
@@ -1842,61 +1209,168 @@ class MainScreen(object):
                        oval_dims[1]+(self.oval_width/2 - 4),
                        oval_dims[2]-(self.oval_width/2 - 4),
                        oval_dims[3]-(self.oval_width/2 - 4)]
-                #Finally, create the pacman oval objects and tie the move function 
-                # to each (but with a different input)
-                self.mastercanvas.create_oval(oval_outline_dims,
-                                         fill = "black",
-                                         outline = "black",
-                                         tag = each_tag)
-                self.mastercanvas.create_oval(oval_dims,
-                                         fill = "gray",
-                                         outline = "gray",
-                                         tag = each_tag)
-                self.mastercanvas.create_oval(oval_center_dims,
-                                         fill = "black",
-                                         outline = "white",
-                                         width = 2,
-                                         tag = each_tag)  
-                
-                x, y = convert_pacman_to_x_y(each_tag)
-                # CHANGE
-                # we have to recreate variables here, as otherwise all ovals
-                # will move like the last oval built
-                self.mastercanvas.tag_bind(each_tag,
-                                      "<Button-1>",
-                                      lambda event,
-                                      oval_tag = str(each_tag),
-                                      proj_x = int(x),
-                                      proj_y = int(y): 
-                                          move(event, oval_tag, proj_x, proj_y))
-                    
-                self.root.bind(str(self.move_keys[self.oval_tags.index(each_tag)]),
-                               lambda event,
-                               oval_tag = str(each_tag),
-                               proj_x = int(x),
-                               proj_y = int(y):
-                                   move(event, oval_tag, proj_x, proj_y))
-                # self.mastercanvas.tag_lower(each_tag) # drop pacman to bottom
+                #Finally, move the pacman oval objects into place and show
+                # them (their move function is already bound; see __init__)
+                self.scene.show_cursor(each_tag,
+                                       oval_outline_dims,
+                                       oval_dims,
+                                       oval_center_dims)
+                self.ovals_shown.append(each_tag)
+            self.scene.flush() # All the ovals are drawn at once
                 
             self.ovals_onscreen = True
                 
+    def direction_blocked(self, xgrid, ygrid, move_x, move_y):
+        # Returns True if moving the pacman from this grid location by 
+        # move_x/move_y pixels would run it into a border or barrier. Moving
+        # into a portal (which sits just outside the arena) is never blocked.
+        # The barriers and portals of each trial are kept as sets/lookups of
+        # grid locations (see prepare_trial()), so this needs no pixel math.
+        projected_location = (xgrid + move_x // self.move_distance,
+                              ygrid + move_y // self.move_distance)
+        if projected_location in self.portal_partners:
+            return False
+        if not (0 <= projected_location[0] <= self.horizontal_moves_in_arena and
+                0 <= projected_location[1] <= self.vertical_moves_in_arena):
+            return True # Border
+        return projected_location in self.barrier_grid_locations
+
+    def convert_pacman_to_x_y(self, tag):
+        # This function converts the pacman tag string to the projected
+        # x and y coordinate movement that each pacman oval will have.
+        if tag == "north_oval_pacman":
+            return 0, -self.move_distance
+        elif tag == "east_oval_pacman":
+            return self.move_distance, 0
+        elif tag == "south_oval_pacman":
+            return 0, self.move_distance
+        elif tag == "west_oval_pacman":
+            return -self.move_distance, 0
+
+    def animate_pacman(self, location_x, location_y):
+        # First things first, quickly "raise" all the portal outlines
+        # just in case the pacman needs to pass through them
+        self.mastercanvas.tag_raise("portal")
+        # This function starts the animated movement of the pacman (and its
+        # background) by location_x/location_y pixels. The move takes the
+        # same amount of time as moving movement_resolution pixels every
+        # ms_per_pixel_speed ms, but the pacman's position is worked out
+        # from the time elapsed, so the move always takes the same time (see
+        # MoveAnimator in arena_scene.py). Once the pacman arrives,
+        # pacman_arrived() is called.
+        self.pacman_destination = (self.pacman_destination[0] + location_x // self.move_distance,
+                                   self.pacman_destination[1] + location_y // self.move_distance)
+        move_duration = abs(location_x + location_y) / self.movement_resolution * self.ms_per_pixel_speed
+        self.pacman_animator.start(location_x, location_y, move_duration, self.pacman_arrived)
+
+    def pacman_arrived(self):
+        # This is called once the moving pacman has arrived at its stopping
+        # location
+        portal_exited = False
+        # First up, we should check if the pacman moved into a portal 
+        # (for portal phases)
+        if not self.training_phase in ["6.a", "6.b", "6.c", "6", "7 TEST"]:
+            portal_exited = True # No portal to exit
+        else: # Phases with a portal...
+            # If the pacman is not inside a portal...
+            if self.pacman_destination not in self.portal_partners:
+                portal_exited = True
+            # Else if the pacman IS in a portal, then find the new portal
+            # grid location that the pacman should be transported to (the
+            # other end of the portal)...
+            else:
+                # But first we should write it to the data sheet
+                self.write_event_data("PortalActivated", None, None)
+                self.portal_accessed = True
+                new_portal_grid_location = self.portal_partners[self.pacman_destination]
+                # With the new grid location discovered, we can move the
+                # existing pacman to the new location inside the other portal
+                self.pacman_destination = new_portal_grid_location
+                new_pacman_coords = self.convert_grid_to_coordinate(*new_portal_grid_location)
+                self.scene.show_pacman(new_pacman_coords)
+                self.scene.flush()
+                # Finally, once the pacman is moved to the other portal 
+                # location, it should be moved back into the arena. We
+                # need to find WHERE that is depending on the location
+                # of the portal...
+                if new_portal_grid_location[0] < 0: # Vertical portal on left moving right
+                    x, y = self.convert_pacman_to_x_y("east_oval_pacman")
+                elif new_portal_grid_location[0] > self.horizontal_moves_in_arena:
+                    x, y = self.convert_pacman_to_x_y("west_oval_pacman")
+                elif new_portal_grid_location[1] > self.vertical_moves_in_arena:
+                    x, y = self.convert_pacman_to_x_y("north_oval_pacman")
+                # Once the new destination is determined, we again pass
+                # this info back to this same "animate pacman" function
+                self.animate_pacman(x, y)
+        # Finally, if the destination has been reached AND that
+        # destination is not inside of a portal...   
+        if portal_exited:                                  
+            self.build_oval() #By the end of the pacman's movement, the ovals are created again
+
+    def cursor_pressed(self, event, oval_tag):
+        # Each oval (and its move key) is bound to this function once, in 
+        # __init__. A peck or key press only moves the pacman if that oval
+        # is currently onscreen.
+        if oval_tag in self.ovals_shown:
+            proj_x, proj_y = self.convert_pacman_to_x_y(oval_tag)
+            self.move_pacman(event, oval_tag, proj_x, proj_y)
+
+    def move_pacman(self, event, passed_tag, passed_x, passed_y):
+        # This is the function that is called when an oval is pressed, with
+        # the oval's tag and passed_x/y values.
+        self.current_trial_moves += 1 # Add a move to the trial movement counter
+        self.write_event_data(passed_tag, event.x, event.y)
+        # First, hide all the ovals from the pacman (before moving), which
+        # also turns off their move keys
+        self.scene.hide_cursors()
+        self.scene.flush()
+        self.ovals_shown = []
+        # Next, move the pacman
+        self.animate_pacman(passed_x, passed_y)
+
     ## These functions write session data
 
     def write_event_data (self, event_type, x, y):
+        # This function is called every time an event happens (e.g., a peck
+        # or reinforcement). Because it is called from inside the tkinter 
+        # callbacks, it only captures the raw values of the event "as they
+        # are" right now and hands them to the background event logger. All
+        # of the formatting, printing, and writing is then done on the 
+        # logger's own thread (see record_event below) so that the canvas
+        # normally doesn't wait on it.
+        # Note that the clock is read only once, so the Time and TrialTime of
+        # each event are from the exact same instant.
+        session_ns, trial_ns = self.session_clock.read() # When the event happened
+        self.event_logger.log(session_ns,
+                              trial_ns,
+                              event_type,
+                              x,
+                              y,
+                              getattr(self, "pacman_coords", None), # Pacman doesn't exist before first trial
+                              self.trial_number,
+                              self.current_trial_moves,
+                              self.trial_par,
+                              self.insight_trial_type)
+
+    def record_event(self, session_ns, trial_ns, event_type, x, y, 
+                     pacman_coords, trial_number, trial_moves, trial_par,
+                     insight_trial_type):
         # The following function defines what type of data is suposed to be
-        # writen in each cell of the previous empty matrix. Each time the 
+        # writen in each cell of the session data. Each time the 
         # function is called, a new list (or line in the final .csv) is added
-        # to the matrix dataframe. All data entries should be identically
+        # to the data buffer. All data entries should be identically
         # formatted via the variables below. This data format is created to be
         # compatible with R's "tidydata" format in order to make the data
         # pipeline from sessions --> R as seamless as possible. The first
         # series of equations calculate a transformed x and y values that
         # treat the center of the pacman as the center of the screen, such
-        # that pecking variability around the pacman can consistent.
-        try:
-            local_pacman_center = [int(self.pacman_coords[2]-(self.pacman_size/2)),
-                                   int(self.pacman_coords[3]-(self.pacman_size/2))]
-        except AttributeError: # if pacman doesn't exist (before first trial)
+        # that pecking variability around the pacman can consistent. Note
+        # that this runs on the background logger thread, so it should only
+        # use the values passed to it (not the current state of the trial).
+        if pacman_coords is not None:
+            local_pacman_center = [int(pacman_coords[2]-(self.pacman_size/2)),
+                                   int(pacman_coords[3]-(self.pacman_size/2))]
+        else: # if pacman doesn't exist (before first trial)
             local_pacman_center = [None, None]
         if x != None:
             distance_from_center = [int(self.mainscreen_width/2 - local_pacman_center[0]),
@@ -1905,52 +1379,120 @@ class MainScreen(object):
             transformed_y = distance_from_center[1] + y
         else:
             x, y, transformed_x, transformed_y = "NA", "NA", "NA", "NA"
-        time_stamp = str(datetime.now() - self.start_time) # time_stamp is the corresponding time when each event happens
-        print(f"{event_type:>20} | x: {x: ^3} y: {y:^3} | {str(datetime.now() - self.start_time)}")
+        # Times are kept as integer nanoseconds (since the start of the
+        # session and trial); they are only turned into text for the .csv.
+        print(f"{event_type:>20} | x: {x: ^3} y: {y:^3} | {format_offset_ns(session_ns)}")
         ID = self.subject # Subject is the name of the pigeon
-        self.session_data_matrix.append([time_stamp,
-                                    event_type,
-                                    x,
-                                    y,
-                                    transformed_x,
-                                    transformed_y,
-                                    local_pacman_center[0],
-                                    local_pacman_center[1],
-                                    self.trial_number,
-                                    self.current_trial_moves,
-                                    self.trial_par,
-                                    datetime.now() - self.local_trial_timer, 
-                                    ID,
-                                    self.training_phase,
-                                    date.today(),
-                                    self.insight_trial_type])
+        event_row = [session_ns, # time_stamp is the corresponding time when each event happens
+                     event_type,
+                     x,
+                     y,
+                     transformed_x,
+                     transformed_y,
+                     local_pacman_center[0],
+                     local_pacman_center[1],
+                     trial_number,
+                     trial_moves,
+                     trial_par,
+                     trial_ns, 
+                     ID,
+                     self.training_phase,
+                     self.session_clock.wall_time(session_ns).date(),
+                     insight_trial_type]
+        self.session_data_buffer.append(event_row)
 
-    def write_data_csv(self, SessionEnded):
+    def spill_session_data(self, buffer):
+        # This function is handed the session data buffer whenever it is 
+        # emptied, and passes its rows on to the data file(s) (if there are
+        # any): the .csv gets the rows as text, while the optional binary
+        # columns get the raw typed values.
+        if self.data_file_writer is not None:
+            self.data_file_writer.write_rows(buffer.rows())
+        if self.binary_data_writer is not None:
+            self.binary_data_writer.write_columns(buffer.columns)
+
+    def open_data_file(self):
+        # This function opens the .csv data document for the session, named
+        # after the subject, start time, and training phase. The header is
+        # written once here; after that, rows are only ever appended to the
+        # end of the file (rather than re-writing the whole session after
+        # each trial). If the data folder can't be found, the file is written
+        # to the same folder as the program instead. If binary data is also
+        # being recorded, a folder of .npy column files (with the same name
+        # as the .csv, plus "_columns") is made right next to it.
         if not self.record_data:
             return
-        # The following function creates a .csv data document. It is either 
-        # called after each trial during the ITI (SessionEnded ==False) or 
-        # one the session finishes (SessionEnded). If the first time the 
-        # function is called, it will produce a new .csv out of the
-        # session_data_matrix variable, named after the subject, date, and
-        # training phase. Consecutive iterations of the function will simply
-        # write over the existing document.
+        file_stem = f"P032a_data_{self.subject}_{self.start_time.strftime('%Y-%m-%d_%H.%M.%S')}_phase-{self.training_phase}"
+        data_directory = f"{self.data_folder_directory}/{self.subject}"
+        if not os_path.isdir(data_directory):
+            print("\nERROR: Data folder not found (during session.\n Data will be written to same folder as program instead\n")
+            data_directory = getcwd()
+        self.data_file_stem = f"{data_directory}/{file_stem}" # location of written .csv (minus the extension)
+        # Along with the clock, the metadata records the session seed and
+        # the size of the arena (everything needed to lay out the trials
+        # again; see replay_session.py)
+        metadata = self.session_clock.session_metadata()
+        metadata["SessionSeed"] = self.session_seed
+        metadata["Arena"] = f"{self.trial_generator.columns}x{self.trial_generator.rows}"
+        self.data_file_writer = SessionCSVWriter(self.data_file_stem + ".csv",
+                                                 metadata = metadata).open()
+        if self.record_binary_data:
+            self.binary_data_writer = SessionColumnWriter(self.data_file_stem + "_columns",
+                                                          metadata = metadata).open()
+        # The layout of each trial is written to a sidecar file next to the
+        # .csv (with the same metadata), so the session can be re-scored
+        # later (see rescore_sessions.py)
+        self.layout_file_writer = SessionCSVWriter(self.data_file_stem + TRIAL_LAYOUTS_SUFFIX,
+                                                   header = TRIAL_LAYOUTS_HEADER,
+                                                   metadata = metadata).open()
+
+    def write_data_csv(self, SessionEnded):
+        # The following function makes sure all the data collected so far is
+        # safely on the disk. It is either called after each trial during the
+        # ITI (SessionEnded == False) or once the session finishes 
+        # (SessionEnded). Rows have already been appended to the file as 
+        # they happened (see write_event_data), so this just asks the
+        # background logger to write any remaining rows and force them to
+        # the disk once it has caught up (see save_data_file). At the end 
+        # of the session, we wait for the logger to finish everything. The
+        # logger is flushed (and closed) even if no data are being recorded,
+        # so that its thread always stops; only the file writes (in 
+        # save_data_file) depend on the RadioButton.
         if SessionEnded:
             self.write_event_data("SessionEnds", None, None) # Writes end of session to df
+            self.event_logger.close(SessionEnded)
+        else:
+            self.event_logger.flush(SessionEnded)
+        # The trial layouts are only ever written from here (never from
+        # the logger's thread), and are only forced onto the disk once the
+        # session is over
+        if self.layout_file_writer is not None:
+            if SessionEnded:
+                self.layout_file_writer.close()
+            else:
+                self.layout_file_writer.flush()
+
+    def save_data_file(self, SessionEnded):
+        # This is called by the background logger (on its own thread) after
+        # every event logged before write_data_csv() has been recorded. The
+        # data buffer is emptied into the file, which is then forced onto
+        # the disk (and closed at the end of the session).
+        self.session_data_buffer.spill_to_disk()
         # Data recording is contingent on the RadioButton being selected...
-        if self.record_data:
-            try:
-                myFile_loc = f"{self.data_folder_directory}/{self.subject}/P032a_data_{self.subject}_{self.start_time.strftime('%Y-%m-%d_%H.%M.%S')}_phase-{self.training_phase}.csv" # location of written .csv
-                edit_MyFile = open(myFile_loc, 'w', newline = '')
-            except FileNotFoundError:
-                print("\nERROR: Data folder not found (during session.\n Data will be written to same folder as program instead\n")
-                myFile_loc = f"{getcwd()}/P032a_data_{self.subject}_{self.start_time.strftime('%Y-%m-%d_%H.%M.%S')}_phase-{self.training_phase}.csv" # location of written .csv
-                edit_MyFile = open(myFile_loc, 'w', newline = '')
-            # Next, once the data file location is found and opened...
-            with edit_MyFile as MyFile:
-                w = writer(MyFile, quoting=QUOTE_MINIMAL)
-                w.writerows(self.session_data_matrix) # Write all event/trial data        
-        print("Data written")
+        if self.data_file_writer is not None:
+            if SessionEnded:
+                self.data_file_writer.close()
+            else:
+                self.data_file_writer.flush(sync = True)
+            print("Data written")
+        if self.binary_data_writer is not None:
+            # The binary writer also needs the dictionaries of codes for the 
+            # interned columns (e.g., EventType)
+            if SessionEnded:
+                self.binary_data_writer.close(self.session_data_buffer.values)
+            else:
+                self.binary_data_writer.flush(sync = True,
+                                              dictionaries = self.session_data_buffer.values)
         
     def exit_program(self, event):
         # This function is called either when the session ends naturally (e.g.,
@@ -1964,6 +1506,19 @@ class MainScreen(object):
             if not self.cursor_visible:
             	self.change_cursor_state("event") # turn cursor back on, if applicable
         self.write_data_csv(True)
+        self.event_logger.close() # Waits for any events still queued to be written
+        print(f"Events logged: {self.event_logger.events_queued} (waited on a full queue: "
+              f"{self.event_logger.events_waited}, lost: {self.event_logger.events_dropped})")
+        print(f"Par cache: {self.trial_generator.par_cache.hits} hits, {self.trial_generator.par_cache.misses} misses")
+        moves, median_overrun, max_overrun, dropped_frames = self.pacman_animator.summary()
+        print(f"Pacman moves: {moves} (took {median_overrun:.2f} ms longer than intended on median, "
+              f"{max_overrun:.2f} ms at most; {dropped_frames} dropped frames)")
+        # The percentiles of the onset timing of each stage are printed and
+        # written to a "sidecar" file next to the session data
+        for stage, measure, count, median, p90, p99, maximum in self.onset_timer.summary():
+            print(f"{stage} {measure} (n = {count}): median {median} ms, 90% {p90} ms, 99% {p99} ms, max {maximum} ms")
+        if self.data_file_writer is not None:
+            self.onset_timer.write_csv(self.data_file_stem + ONSET_METRICS_SUFFIX)
         self.root.after(10, self.root.destroy) # Give time for the .csv to be written
         print("\n You may now exit the terminal and operater windows now.")
         # Once the experimental sessions end, they should cycle over to the 
@@ -1972,6 +1527,67 @@ class MainScreen(object):
         if operant_box_version:
             random_pigeon_paint.Paint(self.subject)
 
-# %% Finally, this is the code that actually kick starts the whole process
+def run_headless_session(training_phase, subject, record_data=False,
+                         data_folder_directory=None, subject_ID="SIM",
+                         time_limit=None, seed=None):
+    # Runs a whole session of a training phase without a window, with a
+    # simulated subject (e.g., a RandomSubject; see headless_session.py) on
+    # a virtual clock. If record_data, the session is written to the data
+    # folder (by default, data/ in the current directory) just like a real
+    # session (under the subject_ID). The seed is the session seed (see
+    # MainScreen). It returns the finished MainScreen.
+    from headless_session import VirtualRoot # Only needed for headless sessions
+    if data_folder_directory is None:
+        data_folder_directory = getcwd() + "/data/"
+    if record_data and os_path.isdir(data_folder_directory) and \
+            not os_path.isdir(os_path.join(data_folder_directory, subject_ID)):
+        mkdir(os_path.join(data_folder_directory, subject_ID))
+    return MainScreen(None, # No hopper
+                      subject_ID,
+                      training_phase,
+                      record_data,
+                      data_folder_directory,
+                      headless = VirtualRoot(subject, time_limit),
+                      seed = seed)
 
-cp = ExperimenterControlPanel()
+# %% Finally, this is the code that actually kick starts the whole process.
+# Run with --simulate (and a training phase) to run a headless session with
+# a simulated subject instead of opening the control panel.
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description = "P032a insight task")
+    parser.add_argument("--simulate", metavar = "PHASE",
+                        help = 'Run a headless session of this training phase (e.g., "7 TEST")')
+    parser.add_argument("--subject", default = "random",
+                        help = "Simulated subject to run (see SIMULATED_SUBJECTS in headless_session.py; default: random)")
+    parser.add_argument("--seed", type = int,
+                        help = "Seed for the session and simulated subject (for repeatable sessions)")
+    parser.add_argument("--record-data", action = "store_true",
+                        help = "Write the simulated session to data/SIM/")
+    parser.add_argument("--verbose", action = "store_true",
+                        help = "Print every event (as in a real session)")
+    arguments = parser.parse_args()
+    if arguments.simulate:
+        from headless_session import SIMULATED_SUBJECTS
+        if arguments.subject not in SIMULATED_SUBJECTS:
+            parser.error(f"--subject must be one of: {', '.join(sorted(SIMULATED_SUBJECTS))}")
+        operant_box_version = False # Simulated sessions never use the hopper
+        # The subject's random stream is kept separate from the session's
+        subject_rng = Random(None if arguments.seed is None else f"{arguments.seed}:subject")
+        subject = SIMULATED_SUBJECTS[arguments.subject](subject_rng)
+        start_time = perf_counter()
+        if arguments.verbose:
+            MS = run_headless_session(arguments.simulate, subject, arguments.record_data,
+                                      seed = arguments.seed)
+        else:
+            with open(devnull, "w") as quiet, redirect_stdout(quiet):
+                MS = run_headless_session(arguments.simulate, subject, arguments.record_data,
+                                          seed = arguments.seed)
+        elapsed_time = perf_counter() - start_time
+        print(f"Simulated {arguments.simulate} session ({arguments.subject} subject): "
+              f"{MS.reinforcers_provided} reinforcers in {MS.trial_number - 1} trials "
+              f"(session seed {MS.session_seed}), "
+              f"{MS.root.pecks} pecks, {MS.session_clock.read()[0] / 60000000000:.1f} virtual minutes "
+              f"({elapsed_time * 1000:.0f} ms)")
+    else:
+        cp = ExperimenterControlPanel()
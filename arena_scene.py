@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Retained canvas "scene" for the P032a insight task.
+
+Originally, every trial (and every reinforcement, ITI, and TO) deleted every
+object on the canvas and then created the background, borders, barriers,
+portals, pacman, and banana all over again. The ArenaScene instead creates
+each of these canvas objects once, at the start of the session, and then
+only moves them (coords) and shows/hides them (itemconfigure "state") from
+trial to trial. Barriers and portals are kept in "pools" that grow to the
+largest number ever needed at once; any extras are simply hidden.
+
+Because the objects are never deleted, their tags (e.g., "pacman_tag") can
+be bound to their functions once (see MainScreen.__init__), and the
+stacking order of the objects (which is set by the order they are created)
+is the same every trial:
+    background, borders, barriers, portals, pacman background, banana
+    goal, banana, green dot, pacman, pacman-at-goal oval, cursor ovals,
+    message text
+
+Each Python call to a canvas method is a separate round trip into the Tcl
+interpreter that runs Tk. By default, the scene collects its changes in a
+CanvasBatch and sends them all as a single Tcl script when flush() is
+called (see arena_scene_benchmark.py for a comparison).
+
+This file also holds the MoveAnimator, which animates the pacman's moves
+from the elapsed time (rather than a fixed number of steps).
+"""
+from math import ceil
+from time import perf_counter_ns
+from tkinter import HIDDEN, NORMAL, PIESLICE
+
+MESSAGE_FONT = "Times 20 italic bold"
+
+
+def tcl_word(value):
+    # Turns a Python value into a single word of a Tcl command. Anything
+    # with spaces (or other special characters) is put inside braces.
+    text = str(value)
+    if text and not any(character in text for character in " \t\n\"$[];"):
+        return text
+    if any(character in text for character in "{}\\"):
+        raise ValueError(f"Cannot batch the canvas value {text!r}")
+    return "{" + text + "}"
+
+
+class CanvasBatch(object):
+    # The CanvasBatch stands in for a canvas's coords, itemconfigure, move,
+    # tag_raise, and tag_lower methods. Instead of calling into Tk right
+    # away, each call is added as a line of a Tcl script, and flush() sends
+    # the whole script to Tk in a single eval (in the order the calls were
+    # made). Objects still have to be created on the canvas itself, since
+    # their ids are needed right away.
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.commands = []
+        self.commands_sent = 0 # Number of canvas commands sent to Tk
+        self.flushes = 0 # Number of evals (round trips) it took to send them
+
+    def add(self, *words):
+        self.commands.append(" ".join([self.canvas._w] + [tcl_word(word) for word in words]))
+
+    def coords(self, item, *coords):
+        if len(coords) == 1: # A list of coordinates
+            coords = coords[0]
+        self.add("coords", item, *coords)
+
+    def itemconfigure(self, item, **options):
+        words = []
+        for option, value in options.items():
+            words += ["-" + option, value]
+        self.add("itemconfigure", item, *words)
+
+    def move(self, item, move_x, move_y):
+        self.add("move", item, move_x, move_y)
+
+    def tag_raise(self, item, above=None):
+        self.add("raise", item, *([] if above is None else [above]))
+
+    def tag_lower(self, item, below=None):
+        self.add("lower", item, *([] if below is None else [below]))
+
+    def flush(self):
+        if self.commands:
+            self.canvas.tk.eval("\n".join(self.commands))
+            self.commands_sent += len(self.commands)
+            self.flushes += 1
+            self.commands = []
+
+
+class ArenaScene(object):
+    # The objects of each part of the scene share a tag (e.g., "arena" or
+    # "banana_func"), so each part can be shown/hidden or bound at once.
+    # If batched is True, every change to the scene after it is built is
+    # collected by a CanvasBatch and only sent to Tk when flush() is called
+    # (so, e.g., a whole trial is drawn with a single call into Tk).
+    def __init__(self, canvas, width, height, border_dimensions, pacman_color,
+                 cursor_tags, message_location=(350, 300), batched=True):
+        self.canvas = canvas
+        self.batched = batched
+        # The CanvasBatch has the same drawing methods as the canvas itself
+        self.draw = CanvasBatch(canvas) if batched else canvas
+        self.pacman_color = pacman_color
+        # The background and borders never change, so they are the "arena"
+        self.background = canvas.create_rectangle(0, 0, width, height,
+                                                  fill = "black",
+                                                  outline = "white",
+                                                  width = 10,
+                                                  state = HIDDEN,
+                                                  tags = ("arena", "background_tag"))
+        for border_dim in border_dimensions:
+            canvas.create_rectangle(border_dim,
+                                    fill = "white",
+                                    outline = "white",
+                                    state = HIDDEN,
+                                    tags = ("arena", "border"))
+        self.barriers = [] # Pool of barrier rectangles
+        self.portals = [] # Pool of [tunnel, oval] pairs
+        # Everything else is built with placeholder coordinates; they are
+        # moved into place before they are ever shown
+        placeholder = [0, 0, 0, 0]
+        self.pacman_bkgrd = canvas.create_rectangle(placeholder,
+                                                    fill = "black",
+                                                    outline = "black",
+                                                    state = HIDDEN,
+                                                    tags = "pacman_tag")
+        self.banana_goal = canvas.create_rectangle(placeholder,
+                                                   fill = "black",
+                                                   outline = "black",
+                                                   state = HIDDEN,
+                                                   tags = "banana_goal")
+        self.banana = canvas.create_polygon(placeholder + [0, 0],
+                                            fill = "yellow",
+                                            outline = "white",
+                                            state = HIDDEN,
+                                            tags = "banana_func")
+        self.banana_brown = canvas.create_polygon(placeholder + [0, 0],
+                                                  fill = "brown",
+                                                  outline = "black",
+                                                  state = HIDDEN,
+                                                  tags = "banana_func")
+        self.green_dot_bkgrd = canvas.create_oval(placeholder,
+                                                  fill = "black",
+                                                  outline = "black",
+                                                  state = HIDDEN,
+                                                  tags = "green_dot_tag")
+        self.green_dot = canvas.create_oval(placeholder,
+                                            fill = "green",
+                                            outline = "black",
+                                            state = HIDDEN,
+                                            tags = "green_dot_tag")
+        self.pacman = canvas.create_arc(placeholder,
+                                        fill = pacman_color,
+                                        outline = "white",
+                                        style = PIESLICE,
+                                        start = 45,
+                                        extent = 270,
+                                        state = HIDDEN,
+                                        tags = "pacman_tag")
+        # Once the banana is reached, the pacman (and banana) are swapped for
+        # a plain oval of the pacman's color on the banana
+        self.pacman_at_goal = canvas.create_oval(placeholder,
+                                                 fill = pacman_color,
+                                                 outline = "white",
+                                                 state = HIDDEN)
+        # Each of the four cursors (one per direction) is three ovals (a
+        # black outline, the gray oval, and its black center), all sharing
+        # the cursor's tag (e.g., "north_oval_pacman") and the "cursor" tag
+        self.cursors = {}
+        for cursor_tag in cursor_tags:
+            self.cursors[cursor_tag] = [
+                canvas.create_oval(placeholder,
+                                   fill = "black",
+                                   outline = "black",
+                                   state = HIDDEN,
+                                   tags = (cursor_tag, "cursor")),
+                canvas.create_oval(placeholder,
+                                   fill = "gray",
+                                   outline = "gray",
+                                   state = HIDDEN,
+                                   tags = (cursor_tag, "cursor")),
+                canvas.create_oval(placeholder,
+                                   fill = "black",
+                                   outline = "white",
+                                   width = 2,
+                                   state = HIDDEN,
+                                   tags = (cursor_tag, "cursor"))]
+        self.message = canvas.create_text(*message_location,
+                                          fill = "white",
+                                          font = MESSAGE_FONT,
+                                          text = "",
+                                          state = HIDDEN)
+
+    def flush(self):
+        # Sends any drawing commands waiting in the batch to Tk
+        if self.batched:
+            self.draw.flush()
+
+    def show(self, item, coords):
+        self.draw.coords(item, *coords)
+        self.draw.itemconfigure(item, state = NORMAL)
+
+    def clear(self):
+        # Hides everything (the equivalent of the old delete("all"))
+        self.draw.itemconfigure("all", state = HIDDEN)
+
+    def show_message(self, text, fill="red"):
+        # Blanks the screen and shows a single line (or lines) of text
+        self.clear()
+        self.draw.itemconfigure(self.message, text = text, fill = fill, state = NORMAL)
+
+    def show_arena(self):
+        # Hides anything left over from the last trial and shows the
+        # background and borders
+        self.clear()
+        self.draw.itemconfigure("arena", state = NORMAL)
+
+    def show_barriers(self, barrier_rectangles):
+        # New barrier rectangles are placed just above the borders (and so
+        # below the portals, pacman, and banana)
+        while len(self.barriers) < len(barrier_rectangles):
+            barrier = self.canvas.create_rectangle(barrier_rectangles[len(self.barriers)],
+                                                   fill = "white",
+                                                   outline = "white",
+                                                   state = HIDDEN,
+                                                   tags = "barrier")
+            self.draw.tag_raise(barrier, "border")
+            self.barriers.append(barrier)
+        for barrier, barrier_rectangle in zip(self.barriers, barrier_rectangles):
+            self.show(barrier, barrier_rectangle)
+
+    def show_portals(self, portal_dims):
+        # Each portal is a black square tunnel with an oval at the end of it
+        # (see MainScreen.portal_grid_to_coordinate()). The ovals are tagged
+        # "portal" so they can be raised above the pacman as it passes
+        # through; here they are put back below the pacman.
+        while len(self.portals) < len(portal_dims):
+            tunnel = self.canvas.create_rectangle(portal_dims[len(self.portals)][0],
+                                                  fill = "black",
+                                                  outline = "black",
+                                                  state = HIDDEN)
+            oval = self.canvas.create_oval(portal_dims[len(self.portals)][1],
+                                           outline = "green",
+                                           fill = "#03fceb",
+                                           state = HIDDEN,
+                                           tags = "portal")
+            self.portals.append([tunnel, oval])
+        for (tunnel, oval), dim in zip(self.portals, portal_dims):
+            self.draw.tag_lower(tunnel, self.pacman_bkgrd)
+            self.draw.tag_lower(oval, self.pacman_bkgrd)
+            self.show(tunnel, dim[0])
+            self.show(oval, dim[1])
+
+    def show_pacman(self, pacman_coords):
+        self.show(self.pacman_bkgrd, pacman_coords)
+        self.show(self.pacman, pacman_coords)
+
+    def show_banana(self, goal_coords, banana_dims, banana_brown_dims):
+        self.show(self.banana_goal, goal_coords)
+        self.show(self.banana, banana_dims)
+        self.show(self.banana_brown, banana_brown_dims)
+
+    def show_green_dot(self, green_dot_coords, shrink):
+        # The green dot is a green oval ("shrink" pixels smaller on each
+        # side) on a black oval
+        self.show(self.green_dot_bkgrd, green_dot_coords)
+        self.show(self.green_dot, [green_dot_coords[0] + shrink,
+                                   green_dot_coords[1] + shrink,
+                                   green_dot_coords[2] - shrink,
+                                   green_dot_coords[3] - shrink])
+
+    def show_cursor(self, cursor_tag, outline_dims, oval_dims, center_dims):
+        for item, dims in zip(self.cursors[cursor_tag], [outline_dims, oval_dims, center_dims]):
+            self.draw.coords(item, *dims)
+        self.draw.itemconfigure(cursor_tag, state = NORMAL)
+
+    def hide_cursors(self):
+        self.draw.itemconfigure("cursor", state = HIDDEN)
+
+    def show_pacman_at_goal(self, goal_coords):
+        self.draw.itemconfigure("pacman_tag", state = HIDDEN)
+        self.draw.itemconfigure("banana_func", state = HIDDEN)
+        self.show(self.pacman_at_goal, goal_coords)
+
+
+class MoveAnimator(object):
+    # The MoveAnimator slides every canvas object with a tag (e.g., the
+    # pacman and its background, "pacman_tag") a set distance over a set
+    # duration. Rather than moving a fixed number of pixels per callback
+    # (where any late callback makes the whole move later), each frame works
+    # out where the objects should be from the time elapsed since the move
+    # started (on a monotonic clock) and moves them there. The last frame is
+    # scheduled for the move's deadline, where the objects are put exactly
+    # at their destination.
+    # For every move, the intended and actual durations (in ms), the number
+    # of frames drawn, and the number of frames dropped (i.e., frame
+    # intervals that passed with no frame, because a callback was late) are
+    # kept in move_stats.
+    def __init__(self, root, canvas, tag, frame_interval=16, clock=perf_counter_ns):
+        self.root = root
+        self.canvas = canvas
+        self.tag = tag
+        self.frame_interval = frame_interval # ms between frames (~60 per second)
+        self.clock = clock
+        self.move_stats = [] # [intended ms, actual ms, frames, dropped frames] per move
+        self.animating = False
+
+    def start(self, move_x, move_y, duration, on_finished):
+        # Starts moving the objects by move_x/move_y pixels over "duration"
+        # ms, then calls on_finished()
+        self.move_x = move_x
+        self.move_y = move_y
+        self.duration_ns = max(int(duration * 1000000), 1)
+        self.on_finished = on_finished
+        self.moved_x = 0 # How far the objects have been moved so far
+        self.moved_y = 0
+        self.frames = 0
+        self.dropped_frames = 0
+        self.animating = True
+        self.start_ns = self.clock()
+        self.last_frame_ns = self.start_ns
+        self.root.after(min(self.frame_interval, ceil(duration)), self.frame)
+
+    def frame(self):
+        now_ns = self.clock()
+        elapsed_ns = now_ns - self.start_ns
+        frame_interval_ns = self.frame_interval * 1000000
+        self.dropped_frames += max((now_ns - self.last_frame_ns) // frame_interval_ns - 1, 0)
+        self.last_frame_ns = now_ns
+        self.frames += 1
+        fraction = min(elapsed_ns / self.duration_ns, 1)
+        target_x = round(self.move_x * fraction)
+        target_y = round(self.move_y * fraction)
+        if (target_x, target_y) != (self.moved_x, self.moved_y):
+            self.canvas.move(self.tag, target_x - self.moved_x, target_y - self.moved_y)
+            self.moved_x, self.moved_y = target_x, target_y
+        if fraction < 1:
+            remaining_ms = (self.duration_ns - elapsed_ns) / 1000000
+            self.root.after(min(self.frame_interval, ceil(remaining_ms)), self.frame)
+        else:
+            self.animating = False
+            self.move_stats.append([self.duration_ns / 1000000, elapsed_ns / 1000000,
+                                    self.frames, self.dropped_frames])
+            self.on_finished()
+
+    def summary(self):
+        # Returns the number of moves, the median and max of how much longer
+        # the moves took than intended (in ms), and the total dropped frames
+        if not self.move_stats:
+            return 0, 0, 0, 0
+        overruns = sorted(actual - intended for intended, actual, _, _ in self.move_stats)
+        return (len(overruns), overruns[len(overruns) // 2], overruns[-1],
+                sum(stats[3] for stats in self.move_stats))
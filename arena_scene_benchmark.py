@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Timing checks for arena_scene.py.
+
+This draws the same set of random 7 TEST trials (the arena, barriers,
+portals, pacman, banana, and then the cursor ovals, as the experimental
+program does) twice: once with an ArenaScene that calls into Tk for every
+change, and once with one that batches its changes into a single Tcl script
+per flush (the default). For each, it prints the number of round trips into
+the Tcl interpreter and the time it took per trial.
+
+This opens a (small) Tk window, so it needs a display to run.
+
+Example usage (from the same folder as this script):
+    python arena_scene_benchmark.py
+    python arena_scene_benchmark.py --trials 1000
+"""
+from argparse import ArgumentParser
+from math import cos, pi, sin
+from random import Random
+from time import perf_counter
+from tkinter import Canvas, Tk
+
+from arena_scene import ArenaScene
+from trial_generator import BOTTOM, CURSOR_DISTANCE, CURSOR_STEPS, GAP, LEFT, MOVE_DISTANCE, PACMAN_SIZE, RIGHT, \
+    SCREEN_HEIGHT, SCREEN_WIDTH, TOP, TrialGenerator
+
+CURSOR_TAGS = list(CURSOR_STEPS)
+
+
+class CountingTk(object):
+    # Stands in for a widget's Tcl interpreter, counting every call or eval
+    # made into it (i.e., every round trip from Python into Tcl)
+    def __init__(self, tk):
+        self.tk = tk
+        self.round_trips = 0
+
+    def call(self, *args):
+        self.round_trips += 1
+        return self.tk.call(*args)
+
+    def eval(self, script):
+        self.round_trips += 1
+        return self.tk.eval(script)
+
+    def __getattr__(self, name):
+        return getattr(self.tk, name)
+
+
+def grid_to_coordinate(xgrid, ygrid):
+    x = LEFT + GAP + MOVE_DISTANCE * xgrid
+    y = TOP + GAP + MOVE_DISTANCE * ygrid
+    return [x, y, x + PACMAN_SIZE, y + PACMAN_SIZE]
+
+
+def trial_drawings(count, rng):
+    # Works out the pixel coordinates of everything drawn in "count" random
+    # 7 TEST trials (outside of the timing)
+    border_dimensions = [[0, 0, LEFT, SCREEN_HEIGHT],
+                         [SCREEN_WIDTH - RIGHT, 0, SCREEN_WIDTH, SCREEN_HEIGHT],
+                         [0, SCREEN_HEIGHT - BOTTOM, SCREEN_WIDTH, SCREEN_HEIGHT],
+                         [0, 0, SCREEN_WIDTH, TOP]]
+    generator = TrialGenerator("7 TEST", rng)
+    drawings = []
+    for trial in generator.generate(count):
+        goal_coords = grid_to_coordinate(*trial.banana)
+        # A rough banana-shaped polygon with as many points as the real one
+        banana_dims = []
+        for index in range(55):
+            angle = index * pi / 27
+            banana_dims += [goal_coords[0] + 30 + 25 * cos(angle), goal_coords[1] + 30 + 15 * sin(angle)]
+        portal_dims = []
+        for portal in trial.portals or []:
+            tunnel = grid_to_coordinate(*portal)
+            portal_dims.append([tunnel, [tunnel[0] - 15, tunnel[1], tunnel[0] + 15, tunnel[3]]])
+        pacman_coords = grid_to_coordinate(*trial.pacman)
+        cursors = []
+        for cursor_tag in CURSOR_TAGS:
+            x, y = CURSOR_STEPS[cursor_tag]
+            dims = [pacman_coords[0] + 15 + CURSOR_DISTANCE * x, pacman_coords[1] + 15 + CURSOR_DISTANCE * y,
+                    pacman_coords[0] + 45 + CURSOR_DISTANCE * x, pacman_coords[1] + 45 + CURSOR_DISTANCE * y]
+            cursors.append((cursor_tag,
+                            [dims[0] - 2, dims[1] - 2, dims[2] + 2, dims[3] + 2],
+                            dims,
+                            [dims[0] + 11, dims[1] + 11, dims[2] - 11, dims[3] - 11]))
+        drawings.append(([grid_to_coordinate(*barrier) for barrier in trial.barriers],
+                         portal_dims, pacman_coords, goal_coords, banana_dims, cursors))
+    return border_dimensions, drawings
+
+
+def time_scene(root, border_dimensions, drawings, batched):
+    # Draws every trial with a new scene, returning the round trips into
+    # Tcl and the time (in ms) per trial
+    canvas = Canvas(root, bg = "black", height = SCREEN_HEIGHT, width = SCREEN_WIDTH)
+    canvas.pack()
+    scene = ArenaScene(canvas, SCREEN_WIDTH, SCREEN_HEIGHT, border_dimensions, "red",
+                       CURSOR_TAGS, batched = batched)
+    root.update()
+    counting_tk = CountingTk(canvas.tk)
+    canvas.tk = counting_tk
+    start_time = perf_counter()
+    for barrier_rectangles, portal_dims, pacman_coords, goal_coords, banana_dims, cursors in drawings:
+        scene.show_arena()
+        scene.show_barriers(barrier_rectangles)
+        scene.show_portals(portal_dims)
+        scene.show_pacman(pacman_coords)
+        scene.show_banana(goal_coords, banana_dims, banana_dims)
+        scene.flush()
+        canvas.update_idletasks()
+        for cursor in cursors:
+            scene.show_cursor(*cursor)
+        scene.flush()
+        canvas.update_idletasks()
+        scene.hide_cursors()
+        scene.show_message("Reinforcer for 3s")
+        scene.flush()
+        canvas.update_idletasks()
+    elapsed_time = perf_counter() - start_time
+    canvas.destroy()
+    return counting_tk.round_trips / len(drawings), elapsed_time * 1000 / len(drawings)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description = "Compare batched and unbatched drawing of the arena scene.")
+    parser.add_argument("--trials", type = int, default = 500, help = "Number of trials to draw")
+    arguments = parser.parse_args()
+    border_dimensions, drawings = trial_drawings(arguments.trials, Random(0))
+    root = Tk()
+    print(f"Drawing {arguments.trials} random 7 TEST trials (arena, then cursors, then reinforcer):")
+    for description, batched in [("One Tk call per change", False), ("Batched (one Tcl eval per flush)", True)]:
+        round_trips, trial_time = time_scene(root, border_dimensions, drawings, batched)
+        print(f"  {description}: {round_trips:.1f} round trips and {trial_time:.3f} ms per trial")
+    root.destroy()
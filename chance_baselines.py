@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Chance-level baselines for every training phase of the P032a insight task.
+
+This runs the random walk model (see random_walk_model.py) over every phase
+offered by the experimental program's control panel, with enough sessions
+to get millions of simulated trials per phase, and summarizes how a subject
+pecking cursors at random would do: its moves per trial and moves over par,
+how often it uses a portal, and its reinforcement rate.
+
+The sessions of each phase are split into "shards" (of --shard-sessions
+sessions each), which are simulated in separate processes (a
+ProcessPoolExecutor, one worker per core by default). Every shard gets its
+own independent random stream, spawned from the one seed in a fixed order.
+Rather than sending back every trial, each shard sends back only running
+totals: histograms and running means and variances (RunningStats), which
+are merged in the order the shards were submitted. The results therefore
+only depend on the seed (not on the number of workers or the order the
+shards finish in), down to the last bit. Shards never wait on each other,
+so the run time falls in proportion to the number of cores. This requires
+NumPy.
+
+The summary is printed and, if --output is given, written as two .csv
+files: <output>_summary.csv (one row per phase and measure) and
+<output>_histograms.csv (the count of every value of every measure).
+
+Example usage (from the same folder as this script):
+    python chance_baselines.py --sessions 200
+    python chance_baselines.py --sessions 20000 --seed 32 --output RWM_baselines
+    python chance_baselines.py --phases "3.b TEST" "7 TEST" --sessions 5000 --workers 8
+"""
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from csv import writer, QUOTE_MINIMAL
+from itertools import chain, zip_longest
+from time import perf_counter
+
+from random_walk_model import RandomWalkModel, numpy
+from trial_generator import TRAINING_PHASE_NAMES
+
+# Every phase in the control panel (the part of the name before the colon)
+CONTROL_PANEL_PHASES = [name.split(":")[0] for name in TRAINING_PHASE_NAMES]
+# Largest value counted separately in each histogram; anything larger is
+# counted in the last bin
+HISTOGRAM_MAX = 1000
+# The summary .csv has one row per phase and measure
+BASELINE_SUMMARY_HEADER = ["Phase", "Measure", "Count", "Mean", "SD", "Median", "P90", "P99", "Max"]
+
+
+class RunningStats(object):
+    # The count, mean, and variance of a stream of values, without keeping
+    # the values. Batches are added (or other RunningStats merged in) with
+    # Chan et al.'s parallel form of Welford's algorithm, which stays
+    # accurate even with very many values.
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.sum_squares = 0.0 # Sum of squared differences from the mean
+        self.maximum = float("nan")
+
+    def add(self, values):
+        values = numpy.asarray(values, dtype = float)
+        if values.size:
+            batch = RunningStats()
+            batch.count = values.size
+            batch.mean = values.mean()
+            batch.sum_squares = ((values - batch.mean) ** 2).sum()
+            batch.maximum = values.max()
+            self.merge(batch)
+
+    def merge(self, other):
+        if not other.count:
+            return
+        if not self.count:
+            self.count, self.mean = other.count, other.mean
+            self.sum_squares, self.maximum = other.sum_squares, other.maximum
+            return
+        count = self.count + other.count
+        difference = other.mean - self.mean
+        self.mean += difference * other.count / count
+        self.sum_squares += other.sum_squares + difference ** 2 * self.count * other.count / count
+        self.count = count
+        self.maximum = max(self.maximum, other.maximum)
+
+    def variance(self):
+        return self.sum_squares / (self.count - 1) if self.count > 1 else float("nan")
+
+
+class Histogram(object):
+    # Counts of the whole numbers 0 to HISTOGRAM_MAX (anything larger is
+    # counted as HISTOGRAM_MAX). Histograms are merged by adding them.
+    def __init__(self):
+        self.counts = numpy.zeros(HISTOGRAM_MAX + 1, dtype = numpy.int64)
+
+    def add(self, values):
+        clipped = numpy.clip(numpy.asarray(values, dtype = numpy.int64), 0, HISTOGRAM_MAX)
+        self.counts += numpy.bincount(clipped, minlength = HISTOGRAM_MAX + 1)
+
+    def merge(self, other):
+        self.counts += other.counts
+
+    def percentile(self, fraction):
+        # Nearest-rank percentile (as in session_data.percentile())
+        total = self.counts.sum()
+        if not total:
+            return float("nan")
+        rank = max(int(numpy.ceil(fraction * total)), 1)
+        return int(numpy.searchsorted(numpy.cumsum(self.counts), rank))
+
+
+class PhaseBaseline(object):
+    # The running totals of one phase (or one shard of it). Each measure
+    # has RunningStats, and the whole-number measures also a Histogram:
+    #   Moves           - moves made in each trial
+    #   MovesOverPar    - moves over par in each trial that reached the
+    #                     banana (phases with a banana)
+    #   Reinforced      - 1 for each reinforced trial, 0 for each TO
+    #   PortalUsed      - 1 for each trial where a portal was used
+    #   TrialsPerSession
+    #   SessionMinutes  - length of each session (from the first ITI to
+    #                     the end of the last reinforcer)
+    #   ReinforcersPerHour - reinforcers per hour of each session
+    MEASURES = ["Moves", "MovesOverPar", "Reinforced", "PortalUsed",
+                "TrialsPerSession", "SessionMinutes", "ReinforcersPerHour"]
+    HISTOGRAM_MEASURES = ["Moves", "MovesOverPar", "TrialsPerSession"]
+
+    def __init__(self, training_phase):
+        self.training_phase = training_phase
+        self.sessions = 0
+        self.stats = {measure: RunningStats() for measure in self.MEASURES}
+        self.histograms = {measure: Histogram() for measure in self.HISTOGRAM_MEASURES}
+
+    def add(self, measure, values):
+        self.stats[measure].add(values)
+        if measure in self.histograms:
+            self.histograms[measure].add(values)
+
+    def add_model(self, model):
+        # Adds the trials and sessions of a finished RandomWalkModel
+        trial_table = model.trial_table()
+        reached_banana = trial_table["reinforced"] & (trial_table["par"] >= 0)
+        self.add("Moves", trial_table["moves"])
+        self.add("MovesOverPar", (trial_table["moves"] - trial_table["par"])[reached_banana])
+        self.add("Reinforced", trial_table["reinforced"])
+        self.add("PortalUsed", trial_table["portal_used"])
+        self.add("TrialsPerSession", model.trial_number - 1)
+        session_minutes = model.time / 60000
+        self.add("SessionMinutes", session_minutes)
+        self.add("ReinforcersPerHour", model.reinforcers_provided / (session_minutes / 60))
+        self.sessions += len(model.trials)
+
+    def merge(self, other):
+        self.sessions += other.sessions
+        for measure in self.MEASURES:
+            self.stats[measure].merge(other.stats[measure])
+        for measure in self.HISTOGRAM_MEASURES:
+            self.histograms[measure].merge(other.histograms[measure])
+
+    def summary(self):
+        # Returns a row of BASELINE_SUMMARY_HEADER for every measure with
+        # any values (the percentiles are only for histogram measures)
+        summary_rows = []
+        for measure in self.MEASURES:
+            stats = self.stats[measure]
+            if not stats.count:
+                continue
+            percentiles = ["NA", "NA", "NA"]
+            if measure in self.histograms:
+                percentiles = [self.histograms[measure].percentile(fraction) for fraction in [0.5, 0.9, 0.99]]
+            summary_rows.append([self.training_phase, measure, stats.count, round(stats.mean, 4),
+                                 round(stats.variance() ** 0.5, 4)] + percentiles + [round(stats.maximum, 4)])
+        return summary_rows
+
+
+def simulate_shard(training_phase, seed_sequence, sessions, reinforcers=75):
+    # Simulates one shard (in a worker process) and returns its PhaseBaseline
+    model = RandomWalkModel(training_phase, sessions, 1, seed_sequence, reinforcers,
+                            record_events = False).run()
+    shard_baseline = PhaseBaseline(training_phase)
+    shard_baseline.add_model(model)
+    return shard_baseline
+
+
+def run_baselines(phases, sessions, shard_sessions=100, seed=None, workers=None, reinforcers=75):
+    # Simulates "sessions" sessions of every phase (split into shards of
+    # shard_sessions) across a pool of worker processes, and returns a
+    # dictionary of phase --> merged PhaseBaseline
+    if numpy is None:
+        raise ModuleNotFoundError("NumPy is required for the chance baselines")
+    phase_seeds = numpy.random.SeedSequence(seed).spawn(len(phases))
+    shards_by_phase = []
+    for phase, phase_seed in zip(phases, phase_seeds):
+        shard_sizes = [shard_sessions] * (sessions // shard_sessions)
+        if sessions % shard_sessions:
+            shard_sizes.append(sessions % shard_sessions)
+        shards_by_phase.append([(phase, shard_seed, shard_size) for shard_seed, shard_size
+                                in zip(phase_seed.spawn(len(shard_sizes)), shard_sizes)])
+    baselines = {phase: PhaseBaseline(phase) for phase in phases}
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+        # The phases' shards are interleaved, so that the slowest phases
+        # aren't all left until the end. They are merged in that same order
+        # (waiting on each in turn), so that the floating-point sums come
+        # out the same every time.
+        futures = [executor.submit(simulate_shard, *shard, reinforcers)
+                   for shard in chain.from_iterable(zip_longest(*shards_by_phase))
+                   if shard is not None]
+        for future in futures:
+            shard_baseline = future.result()
+            baselines[shard_baseline.training_phase].merge(shard_baseline)
+    return baselines
+
+
+def write_baselines(baselines, output_stem):
+    with open(output_stem + "_summary.csv", 'w', newline = '') as summary_file:
+        csv_writer = writer(summary_file, quoting=QUOTE_MINIMAL)
+        csv_writer.writerow(BASELINE_SUMMARY_HEADER)
+        for baseline in baselines.values():
+            csv_writer.writerows(baseline.summary())
+    with open(output_stem + "_histograms.csv", 'w', newline = '') as histogram_file:
+        csv_writer = writer(histogram_file, quoting=QUOTE_MINIMAL)
+        csv_writer.writerow(["Phase", "Measure", "Value", "Count"])
+        for baseline in baselines.values():
+            for measure, histogram in baseline.histograms.items():
+                for value in numpy.flatnonzero(histogram.counts):
+                    csv_writer.writerow([baseline.training_phase, measure, value, histogram.counts[value]])
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description = "Chance-level (random walk) baselines of every training phase.")
+    parser.add_argument("--phases", nargs = "+", default = CONTROL_PANEL_PHASES,
+                        help = "Training phases (default: every phase in the control panel)")
+    parser.add_argument("--sessions", type = int, default = 1000, help = "Sessions simulated per phase")
+    parser.add_argument("--shard-sessions", type = int, default = 100,
+                        help = "Sessions simulated together by each worker at a time")
+    parser.add_argument("--reinforcers", type = int, default = 75, help = "Reinforcers per session")
+    parser.add_argument("--workers", type = int, help = "Worker processes (default: one per core)")
+    parser.add_argument("--seed", type = int, help = "Random seed (for repeatable baselines)")
+    parser.add_argument("--output", help = "Write <output>_summary.csv and <output>_histograms.csv")
+    arguments = parser.parse_args()
+    start_time = perf_counter()
+    baselines = run_baselines(arguments.phases, arguments.sessions, arguments.shard_sessions,
+                              arguments.seed, arguments.workers, arguments.reinforcers)
+    elapsed_time = perf_counter() - start_time
+    total_trials = sum(baseline.stats["Moves"].count for baseline in baselines.values())
+    print(f"{total_trials} trials in {arguments.sessions * len(arguments.phases)} sessions "
+          f"simulated in {elapsed_time:.1f} s")
+    for baseline in baselines.values():
+        for phase, measure, count, mean, sd, median, p90, p99, maximum in baseline.summary():
+            print(f"{phase:>9} {measure:>18} (n = {count}): mean {mean} (SD {sd}), "
+                  f"median {median}, 90% {p90}, 99% {p99}, max {maximum}")
+    if arguments.output:
+        write_baselines(baselines, arguments.output)
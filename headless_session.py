@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Headless (windowless) sessions for the P032a insight task.
+
+The experimental program normally needs a Tk window and a pigeon (or a
+human) to peck at it. For testing the whole program, or for finding out how
+it behaves over an entire session, MainScreen can instead be given a
+VirtualRoot (see MainScreen's "headless" argument). The VirtualRoot stands
+in for the Tk window and its canvas:
+    - Every root.after() callback is run in order on a virtual clock, which
+      jumps straight to the time of the next callback instead of waiting.
+      A 75-reinforcer session (with its ITIs, reinforcers, and TOs) then
+      takes milliseconds to run instead of an hour.
+    - The canvas (a HeadlessCanvas) keeps track of where each object is
+      and whether it is shown, but never draws anything.
+    - Whenever nothing is left to happen (i.e., the screen is waiting on a
+      peck), a simulated subject is asked what to peck next and how long it
+      takes to do so. The peck is then sent to whatever function is bound to
+      that tag, just as a real peck would be.
+
+Simulated subjects are any object with a respond(screen) method, which is
+passed the MainScreen and returns a (tag, latency in ms) pair, or None to end
+the session early (like pressing <Escape>). Two are provided here:
+RandomSubject, which pecks a random cursor every time, and
+ShortestPathSubject, which always takes a shortest path to the goal.
+
+Example usage (from the same folder as the experimental program):
+    python P032a_Experimental_Program_2022-03-09.py --simulate "7 TEST"
+    python P032a_Experimental_Program_2022-03-09.py --simulate "5 TEST" --subject shortest
+"""
+from heapq import heappop, heappush
+from itertools import count
+from random import Random
+
+from pathfinder import ParCache
+from trial_generator import CURSOR_STEPS
+
+
+class HeadlessEvent(object):
+    # Stands in for a tkinter event (only x and y are ever used)
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class HeadlessCanvas(object):
+    # Stands in for the tkinter Canvas used by the ArenaScene and
+    # MainScreen. Each object only keeps its coordinates, tags, and state
+    # ("normal" or "hidden"). Since nothing is drawn, the stacking order
+    # (tag_raise/tag_lower) is ignored. Objects are never re-tagged, so
+    # each tag's objects are listed once, when they are created.
+    def __init__(self):
+        self.items = {} # Object id --> {"coords", "tags", "state"}
+        self.tagged = {} # Tag --> list of object ids
+        self.item_ids = count(1)
+        self.bindings = {} # Tag --> function bound to a peck (<Button-1>) on it
+
+    def create_item(self, coords, options):
+        if len(coords) == 1: # Coordinates passed as a single list
+            coords = coords[0]
+        tags = options.get("tags", ())
+        if isinstance(tags, str):
+            tags = (tags,)
+        item = next(self.item_ids)
+        self.items[item] = {"coords": list(coords),
+                            "tags": set(tags),
+                            "state": options.get("state", "normal")}
+        for tag in tags:
+            self.tagged.setdefault(tag, []).append(item)
+        return item
+
+    def create_rectangle(self, *coords, **options):
+        return self.create_item(coords, options)
+
+    create_oval = create_arc = create_polygon = create_text = create_rectangle
+
+    def find_withtag(self, tag_or_id):
+        if tag_or_id == "all":
+            return list(self.items)
+        if tag_or_id in self.items:
+            return [tag_or_id]
+        return self.tagged.get(tag_or_id, [])
+
+    def coords(self, tag_or_id, *coords):
+        found = self.find_withtag(tag_or_id)
+        if not coords:
+            return list(self.items[found[0]]["coords"]) if found else []
+        if len(coords) == 1:
+            coords = coords[0]
+        for item in found:
+            self.items[item]["coords"] = list(coords)
+
+    def itemconfigure(self, tag_or_id, **options):
+        if "state" in options:
+            for item in self.find_withtag(tag_or_id):
+                self.items[item]["state"] = options["state"]
+
+    def move(self, tag_or_id, move_x, move_y):
+        for item in self.find_withtag(tag_or_id):
+            item_coords = self.items[item]["coords"]
+            item_coords[0::2] = [x + move_x for x in item_coords[0::2]]
+            item_coords[1::2] = [y + move_y for y in item_coords[1::2]]
+
+    def tag_raise(self, tag_or_id, above=None):
+        pass
+
+    def tag_lower(self, tag_or_id, below=None):
+        pass
+
+    def tag_bind(self, tag, sequence, function):
+        if sequence == "<Button-1>":
+            self.bindings[tag] = function
+
+    def pack(self, **options):
+        pass
+
+    def update_idletasks(self):
+        pass
+
+    def shown(self, tag_or_id):
+        # Returns the objects with this tag that are currently shown
+        return [item for item in self.find_withtag(tag_or_id)
+                if self.items[item]["state"] != "hidden"]
+
+    def peck(self, tag):
+        # A peck on the center of the first shown object with this tag. It
+        # is sent to the function bound to the tag; pecks on hidden objects
+        # (or tags with nothing bound) do nothing.
+        shown_items = self.shown(tag)
+        if not shown_items or tag not in self.bindings:
+            return
+        x1, y1, x2, y2 = self.items[shown_items[0]]["coords"][0:4]
+        self.bindings[tag](HeadlessEvent(int((x1 + x2) / 2), int((y1 + y2) / 2)))
+
+
+class VirtualRoot(object):
+    # Stands in for the Tk root window (see the top of this file). Callbacks
+    # are kept in a heap, ordered by the virtual time (in ns) they are due
+    # and then by the order they were scheduled (the same as Tk runs them).
+    # If time_limit (in virtual ms) is given, the session is ended (as if
+    # <Escape> was pressed) once it has run that long.
+    def __init__(self, subject, time_limit=None):
+        self.subject = subject
+        self.time_limit = time_limit
+        self.canvas = HeadlessCanvas()
+        self.screen = None # The MainScreen being run (set by MainScreen)
+        self.now_ns = 0
+        self.callbacks = [] # Heap of [due ns, order, function, args]
+        self.callback_order = count()
+        self.cancelled = set()
+        self.key_bindings = {}
+        self.callbacks_run = 0
+        self.pecks = 0
+        self.destroyed = False
+
+    def virtual_time_ns(self):
+        # The clock of a headless session (see SessionClock)
+        return self.now_ns
+
+    def after(self, delay, function, *args):
+        order = next(self.callback_order)
+        heappush(self.callbacks, [self.now_ns + int(delay * 1000000), order, function, args])
+        return f"after#{order}"
+
+    def after_idle(self, function, *args):
+        return self.after(0, function, *args)
+
+    def after_cancel(self, callback_id):
+        self.cancelled.add(int(callback_id.split("#")[1]))
+
+    def bind(self, sequence, function):
+        self.key_bindings[sequence] = function
+
+    def unbind(self, sequence):
+        self.key_bindings.pop(sequence, None)
+
+    def title(self, text):
+        pass
+
+    def update_idletasks(self):
+        pass
+
+    def destroy(self):
+        self.destroyed = True
+
+    def mainloop(self):
+        # Runs the session until the root is destroyed (i.e., exit_program)
+        while not self.destroyed:
+            if self.time_limit is not None and self.now_ns >= self.time_limit * 1000000:
+                self.time_limit = None
+                self.key_bindings["<Escape>"]("event")
+            elif self.callbacks:
+                due_ns, order, function, args = heappop(self.callbacks)
+                if order in self.cancelled:
+                    self.cancelled.discard(order)
+                    continue
+                self.now_ns = max(self.now_ns, due_ns)
+                self.callbacks_run += 1
+                function(*args)
+            else:
+                # Nothing left to happen until the subject pecks something
+                response = self.subject.respond(self.screen)
+                if response is None:
+                    self.key_bindings["<Escape>"]("event")
+                else:
+                    tag, latency = response
+                    self.pecks += 1
+                    self.after(latency, self.canvas.peck, tag)
+
+
+class RandomSubject(object):
+    # Pecks the pacman until the cursors appear, then pecks one of the
+    # cursors onscreen at random. Every response takes "latency" ms.
+    def __init__(self, rng=None, latency=500):
+        self.rng = rng if rng is not None else Random()
+        self.latency = latency
+
+    def respond(self, screen):
+        if not screen.ovals_shown:
+            return "pacman_tag", self.latency
+        return self.rng.choice(screen.ovals_shown), self.latency
+
+
+class ShortestPathSubject(RandomSubject):
+    # Pecks the pacman until the cursors appear, then pecks the cursor that
+    # moves the pacman along a shortest path to the banana (or the green dot,
+    # in phase 6), using the portals if that is shorter. In phases without
+    # a goal, or if none of the cursors onscreen are on a shortest path, it
+    # pecks a random cursor instead.
+    def __init__(self, rng=None, latency=500):
+        super().__init__(rng, latency)
+        self.par_cache = None
+
+    def respond(self, screen):
+        if not screen.ovals_shown:
+            return "pacman_tag", self.latency
+        goal = screen.goal_grid_location
+        if screen.training_phase == "6":
+            goal = screen.green_dot_grid_location
+        if goal is not None and screen.pacman_grid_location != goal:
+            if self.par_cache is None:
+                self.par_cache = ParCache(screen.trial_generator.columns, screen.trial_generator.rows)
+            path = self.par_cache.solve_trial(screen.pacman_grid_location,
+                                              goal,
+                                              screen.barrier_grid_locations,
+                                              screen.portal_grid_locations).path
+            if path is not None:
+                step = (path[1][0] - path[0][0], path[1][1] - path[0][1])
+                for tag in screen.ovals_shown:
+                    if CURSOR_STEPS[tag] == step:
+                        return tag, self.latency
+        return self.rng.choice(screen.ovals_shown), self.latency
+
+
+# The simulated subjects that can be chosen by name (e.g., from the command
+# line of the experimental program)
+SIMULATED_SUBJECTS = {"random": RandomSubject,
+                      "shortest": ShortestPathSubject}
@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pathfinding for the P032a insight task.
+
+This file finds the "par" of a trial: the minimum number of moves it takes
+the pacman to reach the banana goal, given the barriers and portals in the
+arena. It has no tkinter code in it, so it can be used outside of the
+experimental program (e.g., for designing trial sets or re-scoring data).
+
+Everything here works in grid units, the same as the experimental program:
+[x, y] where x is the column (0 = leftmost) and y is the row (0 = top) of
+the active arena. Portals sit just OUTSIDE the arena (x = -1 or x = columns
+for the left/right borders, and y = rows for the bottom border).
+
+For designing trial sets offline, batch_pars() finds the pars of thousands
+of layouts at once (this part requires NumPy).
+"""
+from collections import namedtuple, OrderedDict
+
+try:
+    import numpy
+except ModuleNotFoundError:
+    numpy = None
+
+# The result of solve_trial():
+#   par             - minimum number of moves from pacman to banana (using
+#                     the portals if there are any), or None if unreachable
+#   path            - the grid locations along one shortest path, starting
+#                     at the pacman and ending at the banana. A portal that
+#                     is moved into appears in the path, followed by the
+#                     arena location the pacman comes out at.
+#   nonportal_par   - minimum number of moves without using any portal
+#   portal_par      - minimum number of moves when portals can be used
+#                     (None for trials without portals)
+#   ideal_strategy  - "portal" if using a portal is strictly shorter than
+#                     not using one, else "nonportal"
+TrialSolution = namedtuple("TrialSolution",
+                           ["par", "path", "nonportal_par", "portal_par", "ideal_strategy"])
+
+
+def portal_entry_location(portal, columns, rows):
+    # Returns the arena grid location right next to a portal (e.g., a
+    # portal on the left border at [-1, 2] is entered from [0, 2]). When
+    # the pacman comes out of a portal, this is also where it ends up.
+    x, y = portal
+    return (min(max(x, 0), columns - 1), min(max(y, 0), rows - 1))
+
+
+# The neighbor_steps() of each grid width that has been searched
+NEIGHBOR_STEPS = {}
+
+
+def neighbor_steps(width):
+    # For working backwards along a shortest path (see
+    # ArenaGrid.shortest_path()). The N, E, S, and W neighbors of a cell are
+    # bits 0, width + 1, 2 * width, and width - 1 of the bits cut out around
+    # it. This returns a dictionary from every combination of those bits to
+    # the step (in grid positions) to the first of them that is set, in
+    # that order.
+    if width not in NEIGHBOR_STEPS:
+        offsets = [0, width + 1, 2 * width, width - 1]
+        steps = {}
+        for combination in range(1, 16):
+            set_offsets = [offset for bit, offset in enumerate(offsets) if combination >> bit & 1]
+            steps[sum(1 << offset for offset in set_offsets)] = set_offsets[0] - width
+        NEIGHBOR_STEPS[width] = steps
+    return NEIGHBOR_STEPS[width]
+
+
+class ArenaGrid(object):
+    # An occupancy grid of the arena for a single layout of barriers and
+    # portals. The grid is the arena plus a one-cell border all the way
+    # around it (where the portals sit), stored row by row in a bytearray
+    # with one byte per cell: OPEN, BARRIER, or PORTAL. It is built from the
+    # number of columns and rows in the arena, so it works for any arena
+    # size (e.g., the wider arenas of the wide-screen chambers).
+    #
+    # For searching, each type of cell is also kept as a "bitmask": a
+    # single (very long) integer with one bit per cell of the grid. Moving
+    # every location in a set one step in any direction is then just a bit
+    # shift (one cell left/right is a shift of 1, one row up/down is a shift
+    # of the grid width), so a whole step of the search happens at once.
+    OPEN = 0
+    BARRIER = 1
+    PORTAL = 2
+
+    def __init__(self, columns, rows, barriers=(), portals=None):
+        self.columns = columns
+        self.rows = rows
+        self.width = columns + 2 # Includes the left and right borders
+        self.height = rows + 2 # Includes the top and bottom borders
+        border_row = bytes([self.BARRIER]) * self.width
+        arena_row = bytes([self.BARRIER]) + bytes(columns) + bytes([self.BARRIER])
+        cells = self.cells = bytearray(border_row + arena_row * rows + border_row)
+        width, barrier = self.width, self.BARRIER
+        for x, y in barriers:
+            cells[y * width + x + width + 1] = barrier
+        # Each portal is stored with the arena location the pacman comes
+        # out at when it moves into that portal (i.e., next to the other)
+        self.portal_exits = []
+        if portals:
+            for portal, other_portal in [(portals[0], portals[1]), (portals[1], portals[0])]:
+                self.cells[self.index(portal)] = self.PORTAL
+                self.portal_exits.append((self.index(portal),
+                                          self.index(portal_entry_location(other_portal, columns, rows))))
+        self.open_mask = self.cell_mask(self.OPEN)
+        self.portal_mask = 0
+        for portal_index, _ in self.portal_exits:
+            self.portal_mask |= 1 << portal_index
+
+    def index(self, location):
+        # Converts an [x, y] grid location into its position in self.cells
+        return (location[1] + 1) * self.width + location[0] + 1
+
+    def location(self, index):
+        # Converts a position in self.cells back into an [x, y] location
+        return [index % self.width - 1, index // self.width - 1]
+
+    def cell_mask(self, cell_type):
+        # Returns a bitmask with a 1 for every cell of the given type. Bit n
+        # of the integer is self.cells[n].
+        table = bytearray(b"0" * 256)
+        table[cell_type] = ord("1")
+        return int(self.cells.translate(table)[::-1], 2)
+
+    def layer_offset(self, distance):
+        # The layers returned by search() alternate between two positions:
+        # the even layers are stored as they are, but the odd layers are
+        # stored shifted up by one row (self.width bits). This returns how
+        # far the bit of a cell is shifted in the layer at this distance.
+        return distance % 2 * self.width
+
+    def search(self, start, goal=None, use_portals=True):
+        # This is a breadth-first search (BFS) from the start location. It
+        # returns a list of bitmasks, where the bitmask at position n has a
+        # 1 for every location the pacman can first reach in n moves (see
+        # layer_offset() for where each layer's bits are). The search stops
+        # once it reaches the goal (if given) or has found every reachable
+        # location.
+        #
+        # Each step spreads the frontier to its four neighbors with only two
+        # shifts instead of four: the neighbors of a cell n, shifted up by
+        # one row, are n + {0, width - 1, width + 1, 2 * width}, which is
+        # {0, width - 1} + {0, width + 1}. So each layer comes out shifted up
+        # a row from the one before it, and the next step undoes that by
+        # shifting the other way. Shifts are the slowest part of the search
+        # (they copy the whole integer), so this saves much of its time.
+        #
+        # Rather than keeping a mask of every location visited so far, only
+        # the last two layers are left out of each new one. Every neighbor
+        # of a location n moves away is n - 1, n, or n + 1 moves away, so
+        # nothing earlier can be reached again.
+        #
+        # Moving into a portal takes a move, but being transported and
+        # coming out of the other portal happen automatically. So, whenever
+        # a portal is reached in n moves, the location next to the other
+        # portal is ALSO reached in n moves (if it wasn't reached before).
+        step = self.width
+        use_portals = use_portals and bool(self.portal_exits)
+        passable = self.open_mask | (self.portal_mask if use_portals else 0)
+        passable_masks = [passable, passable << step]
+        open_masks = [self.open_mask, self.open_mask << step]
+        portal_masks = [self.portal_mask, self.portal_mask << step]
+        # A portal whose exit is blocked by a barrier doesn't lead anywhere
+        teleports = [(portal_index, exit_index) for portal_index, exit_index in self.portal_exits
+                     if self.cells[exit_index] == self.OPEN]
+        goal_index = None if goal is None else self.index(goal)
+        frontier = 1 << self.index(start)
+        previous = 0
+        odd = 0 # Whether the frontier is an odd layer (shifted up a row)
+        teleported = False
+        in_portal = False # Whether the frontier has a portal in it
+        layers = [frontier]
+        while goal_index is None or not frontier >> (goal_index + odd * step) & 1:
+            moving = frontier & open_masks[odd] if in_portal else frontier # You can't walk out of a portal
+            if odd:
+                spread = moving | moving >> (step - 1)
+                spread |= spread >> (step + 1)
+            else:
+                spread = moving | moving << (step - 1)
+                spread |= spread << (step + 1)
+            odd ^= 1
+            # The layer before the frontier is already shifted the same way
+            # as the new one. Without portals, no neighbor of a location can
+            # be the same number of moves away, but a portal can bring the
+            # pacman out next to a location as far away as itself.
+            allowed = passable_masks[odd] ^ previous
+            if teleported:
+                allowed ^= frontier << step if odd else frontier >> step
+            previous, frontier = frontier, spread & allowed
+            in_portal = use_portals and bool(frontier & portal_masks[odd])
+            if in_portal:
+                offset = odd * step
+                for portal_index, exit_index in teleports:
+                    if frontier >> (portal_index + offset) & 1 and \
+                            not any(layer >> (exit_index + self.layer_offset(distance)) & 1
+                                    for distance, layer in enumerate(layers)):
+                        frontier |= 1 << (exit_index + offset)
+                        teleported = True
+            if not frontier:
+                break
+            layers.append(frontier)
+        return layers
+
+    def distances(self, start, use_portals=True):
+        # Returns a list with the number of moves it takes to get from the
+        # start to each position in self.cells (None if it can't be reached)
+        distance_list = [None] * len(self.cells)
+        for distance, layer in enumerate(self.search(start, None, use_portals)):
+            offset = self.layer_offset(distance) + 1
+            while layer:
+                lowest_bit = layer & -layer
+                distance_list[lowest_bit.bit_length() - offset] = distance
+                layer ^= lowest_bit
+        return distance_list
+
+    def path_from_distances(self, distance_list, goal):
+        # Rebuilds one shortest path to the goal from a list returned by
+        # distances(), by working backwards from the goal to a neighbor that
+        # is one move closer to the start (or to the portal it came out of)
+        index = self.index(goal)
+        if distance_list[index] is None:
+            return None
+        path = [index]
+        while distance_list[index] > 0:
+            distance = distance_list[index]
+            for neighbor in [index - self.width, index + 1, index + self.width, index - 1]:
+                if distance_list[neighbor] == distance - 1 and self.cells[neighbor] == self.OPEN:
+                    index = neighbor
+                    break
+            else: # No closer neighbor, so we got here through a portal
+                index = next(portal_index for portal_index, exit_index in self.portal_exits
+                             if exit_index == index and distance_list[portal_index] == distance)
+                path.append(index)
+                index = self.index(portal_entry_location(self.location(index), self.columns, self.rows))
+            path.append(index)
+        path.reverse()
+        return [self.location(i) for i in path]
+
+    def shortest_path(self, start, goal, use_portals=True):
+        # Returns the number of moves from the start to the goal and the
+        # list of locations along one shortest path, or (None, None) if the
+        # goal can't be reached. A portal that is moved into appears in the
+        # path, followed by the location the pacman comes out at.
+        layers = self.search(start, goal, use_portals)
+        index = self.index(goal)
+        distance = len(layers) - 1
+        if not layers[-1] >> (index + self.layer_offset(distance)) & 1:
+            return None, None
+        # Work backwards from the goal, one layer at a time, to a location
+        # that is one move closer to the start. Only the bits of the four
+        # neighbors of the current location are cut out of each layer (one
+        # shift and one AND), and the first of them in the layer is looked
+        # up in neighbor_steps(). The layer one move closer is an odd layer
+        # every other time, when its bits are shifted up a row (see
+        # layer_offset()).
+        path = [index]
+        width = self.width
+        steps = neighbor_steps(width)
+        neighbor_bits = (1 << 2 * width) | (1 << width + 1) | (1 << width - 1) | 1
+        while distance > 0:
+            step = steps.get(layers[distance - 1] >> (index if distance % 2 == 0 else index - width) & neighbor_bits)
+            if step is not None:
+                index += step
+                distance -= 1
+            else: # No closer neighbor, so we got here through a portal
+                index = next(portal_index for portal_index, exit_index in self.portal_exits
+                             if exit_index == index and
+                             layers[distance] >> (portal_index + self.layer_offset(distance)) & 1)
+                # From inside the portal, step back to where it was entered
+                for neighbor in [index - self.width, index + 1, index + self.width, index - 1]:
+                    if 0 <= neighbor < len(self.cells) and \
+                            layers[distance - 1] >> (neighbor + self.layer_offset(distance - 1)) & 1:
+                        path.append(index)
+                        index = neighbor
+                        distance -= 1
+                        break
+            path.append(index)
+        path.reverse()
+        return len(layers) - 1, [[i % width - 1, i // width - 1] for i in path] # See location()
+
+    def uses_portal(self, path):
+        # Whether a path (as returned by shortest_path()) moves into a portal
+        return any(self.cells[self.index(location)] == self.PORTAL for location in path)
+
+
+def shortest_path(start, goal, barriers, portals, columns, rows):
+    # Finds the minimum number of moves (and one shortest path) from start
+    # to goal in an arena of the given size; see ArenaGrid.shortest_path()
+    return ArenaGrid(columns, rows, barriers, portals).shortest_path(start, goal)
+
+
+def choose_solution(nonportal_par, nonportal_path, portal_par=None, portal_path=None):
+    # Puts together a TrialSolution from the shortest paths without and (for
+    # trials with portals) with the portals, picking the ideal strategy
+    if portal_par is not None and (nonportal_par is None or portal_par < nonportal_par):
+        return TrialSolution(portal_par, portal_path, nonportal_par, portal_par, "portal")
+    return TrialSolution(nonportal_par, nonportal_path, nonportal_par, portal_par, "nonportal")
+
+
+def solve_trial(pacman, banana, barriers, portals=None, columns=6, rows=3):
+    # Finds the par, shortest path, and ideal strategy of a trial from the
+    # grid locations of the pacman, banana, barriers, and (optionally) the
+    # two portals. The columns and rows are the size of the active arena
+    # (e.g., horizontal_moves_in_arena + 1 and vertical_moves_in_arena + 1
+    # in the experimental program).
+    #
+    # The search with the portals is done first. If its shortest path
+    # doesn't use a portal, then no path without the portals can be any
+    # shorter, so the same par and path are also the non-portal ones and
+    # only one search is needed.
+    arena_grid = ArenaGrid(columns, rows, barriers, portals)
+    if not portals:
+        return choose_solution(*arena_grid.shortest_path(pacman, banana, use_portals = False))
+    portal_par, portal_path = arena_grid.shortest_path(pacman, banana)
+    if portal_path is not None and not arena_grid.uses_portal(portal_path):
+        return choose_solution(portal_par, portal_path, portal_par, portal_path)
+    return choose_solution(*arena_grid.shortest_path(pacman, banana, use_portals = False),
+                           portal_par, portal_path)
+
+
+class LayoutDistances(object):
+    # The all-pairs distance table for one layout of barriers and portals:
+    # for every open location in the arena, the number of moves to every
+    # other location (one BFS per starting location), both without and
+    # with the portals. Building it takes 2 searches per arena location,
+    # but after that, the par of any pacman/banana pair is a lookup.
+    def __init__(self, columns, rows, barriers, portals):
+        self.arena_grid = ArenaGrid(columns, rows, barriers, portals)
+        self.has_portals = bool(portals)
+        self.nonportal_distances = {}
+        self.portal_distances = {}
+        for x in range(columns):
+            for y in range(rows):
+                index = self.arena_grid.index((x, y))
+                if self.arena_grid.cells[index] != ArenaGrid.OPEN:
+                    continue
+                self.nonportal_distances[index] = self.arena_grid.distances((x, y), use_portals = False)
+                if self.has_portals:
+                    self.portal_distances[index] = self.arena_grid.distances((x, y))
+
+    def solve(self, pacman, banana):
+        # Same as solve_trial(), from the table
+        nonportal_list = self.nonportal_distances[self.arena_grid.index(pacman)]
+        banana_index = self.arena_grid.index(banana)
+        solution_parts = [nonportal_list[banana_index],
+                          self.arena_grid.path_from_distances(nonportal_list, banana)]
+        if self.has_portals:
+            portal_list = self.portal_distances[self.arena_grid.index(pacman)]
+            solution_parts += [portal_list[banana_index],
+                               self.arena_grid.path_from_distances(portal_list, banana)]
+        return choose_solution(*solution_parts)
+
+
+class ParCache(object):
+    # Keeps the LayoutDistances tables of the most recently used layouts,
+    # so that the par of a layout that has been seen before (e.g., the
+    # fixed layouts of the "7 TEST" phase, or barrier phases that only have
+    # a few possible barrier configurations) isn't worked out again every
+    # trial. Layouts are keyed on the set of barriers plus the portal pair.
+    # When more than max_layouts are stored, the one used longest ago is
+    # dropped ("least recently used"). The hits and misses count how many
+    # trials were solved from a stored table vs. needed a new one.
+    def __init__(self, columns, rows, max_layouts=64):
+        self.columns = columns
+        self.rows = rows
+        self.max_layouts = max_layouts
+        self.layouts = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def layout_key(self, barriers, portals):
+        barrier_key = frozenset(tuple(barrier) for barrier in barriers)
+        portal_key = tuple(sorted(tuple(portal) for portal in portals)) if portals else None
+        return barrier_key, portal_key
+
+    def layout_distances(self, barriers, portals=None):
+        # Returns the LayoutDistances table of a layout, building it if it
+        # isn't already stored
+        key = self.layout_key(barriers, portals)
+        if key in self.layouts:
+            self.hits += 1
+            self.layouts.move_to_end(key)
+            return self.layouts[key]
+        self.misses += 1
+        self.layouts[key] = LayoutDistances(self.columns, self.rows, barriers, portals)
+        if len(self.layouts) > self.max_layouts:
+            self.layouts.popitem(last = False)
+        return self.layouts[key]
+
+    def solve_trial(self, pacman, banana, barriers, portals=None):
+        # Same as solve_trial() (for this cache's arena size)
+        return self.layout_distances(barriers, portals).solve(pacman, banana)
+
+
+def barrier_grids(barrier_lists, columns, rows):
+    # Converts a list of barrier lists (one per layout, in [x, y] grid
+    # locations) into the (layouts, rows, columns) array used by
+    # batch_pars(), which is True wherever there is a barrier. Requires
+    # NumPy.
+    if numpy is None:
+        raise ModuleNotFoundError("NumPy is required for batch pathfinding")
+    grids = numpy.zeros((len(barrier_lists), rows, columns), dtype = bool)
+    for layout, barriers in enumerate(barrier_lists):
+        for x, y in barriers:
+            grids[layout, y, x] = True
+    return grids
+
+
+def batch_pars(pacmans, bananas, barriers, portals=None):
+    # Finds the pars of many layouts at once (e.g., to design trial sets).
+    #   pacmans, bananas - (layouts, 2) arrays of [x, y] grid locations
+    #   barriers         - (layouts, rows, columns) array that is True
+    #                      wherever there is a barrier (see barrier_grids())
+    #   portals          - optional (layouts, 2, 2) array with the [x, y]
+    #                      locations of the two portals of each layout
+    # It returns two arrays of pars (-1 where the banana can't be reached):
+    # one without using the portals, and one using them (None if no
+    # portals were given). The ideal strategy of a layout is "portal" where
+    # the portal par is >= 0 and less than the non-portal par (or the
+    # non-portal par is -1). Requires NumPy.
+    #
+    # This is the same search as ArenaGrid.search(), except that every
+    # layout is a layer of one (layouts, rows + 2, columns + 2) array (the
+    # arena plus its border), and each move spreads all of the wavefronts at
+    # once by shifting the whole array one cell in each direction.
+    if numpy is None:
+        raise ModuleNotFoundError("NumPy is required for batch pathfinding")
+    pacmans, bananas = numpy.asarray(pacmans), numpy.asarray(bananas)
+    barriers = numpy.asarray(barriers, dtype = bool)
+    layouts, rows, columns = barriers.shape
+    open_cells = numpy.zeros((layouts, rows + 2, columns + 2), dtype = bool)
+    open_cells[:, 1:-1, 1:-1] = ~barriers
+    nonportal_pars = propagate_wavefronts(open_cells, open_cells, pacmans + 1, bananas + 1, None)
+    if portals is None:
+        return nonportal_pars, None
+    # Each portal is stored with the location the pacman comes out at,
+    # just like ArenaGrid (all shifted by one for the border)
+    portals = numpy.asarray(portals)
+    exits = numpy.stack([portals[:, 1, :].clip(0, [columns - 1, rows - 1]),
+                         portals[:, 0, :].clip(0, [columns - 1, rows - 1])], axis = 1)
+    passable = open_cells.copy()
+    layout_numbers = numpy.arange(layouts)
+    for portal in [0, 1]:
+        passable[layout_numbers, portals[:, portal, 1] + 1, portals[:, portal, 0] + 1] = True
+    portal_pars = propagate_wavefronts(passable, open_cells, pacmans + 1, bananas + 1,
+                                       [(portals[:, portal, :] + 1, exits[:, portal, :] + 1)
+                                        for portal in [0, 1]])
+    return nonportal_pars, portal_pars
+
+
+def propagate_wavefronts(passable, open_cells, starts, goals, teleports):
+    # The search for batch_pars(). passable and open_cells are (layouts,
+    # height, width) arrays that are True where the pacman can move into
+    # and move out of (i.e., portals are passable but not open), and starts
+    # and goals are [x, y] locations in the same (bordered) grid. teleports
+    # is a list of (portal locations, exit locations) array pairs, or None.
+    # Layouts are dropped from the arrays as soon as they are solved (or
+    # can't be), so later moves only spread the wavefronts still going.
+    teleports = teleports or []
+    active = numpy.arange(len(starts)) # Which layouts are still searching
+    frontier = numpy.zeros_like(passable)
+    frontier[active, starts[:, 1], starts[:, 0]] = True
+    unvisited = passable & ~frontier
+    pars = numpy.full(len(starts), -1)
+    moves = 0
+    while True:
+        layout_numbers = numpy.arange(len(active))
+        found = frontier[layout_numbers, goals[:, 1], goals[:, 0]]
+        pars[active[found]] = moves
+        searching = ~found & frontier.any(axis = (1, 2))
+        if not searching.all():
+            if not searching.any():
+                return pars
+            active, frontier, unvisited = active[searching], frontier[searching], unvisited[searching]
+            open_cells, goals = open_cells[searching], goals[searching]
+            teleports = [(portal_locations[searching], exit_locations[searching])
+                         for portal_locations, exit_locations in teleports]
+            layout_numbers = numpy.arange(len(active))
+        moving = frontier & open_cells
+        frontier = numpy.zeros_like(frontier)
+        frontier[:, 1:, :] |= moving[:, :-1, :]
+        frontier[:, :-1, :] |= moving[:, 1:, :]
+        frontier[:, :, 1:] |= moving[:, :, :-1]
+        frontier[:, :, :-1] |= moving[:, :, 1:]
+        frontier &= unvisited
+        for portal_locations, exit_locations in teleports:
+            through = layout_numbers[frontier[layout_numbers, portal_locations[:, 1], portal_locations[:, 0]]]
+            frontier[through, exit_locations[through, 1], exit_locations[through, 0]] |= \
+                unvisited[through, exit_locations[through, 1], exit_locations[through, 0]]
+        unvisited &= ~frontier
+        moves += 1
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Timing checks for pathfinder.py.
+
+The experimental arena is only 6 x 3, but the pathfinding is meant to work
+for much larger arenas as well. This times solve_trial() on large square
+arenas (100 x 100 by default), from corner to corner (the longest possible
+search) and between random locations, with and without barriers/portals.
+Each is timed in several rounds, and the fastest round is reported.
+
+It then times batch_pars() against calling solve_trial() once per layout,
+on a set of random layouts of the experimental 6 x 3 arena (this part is
+skipped if NumPy isn't installed), and checks that both give the same pars.
+
+Example usage (from the same folder as this script):
+    python pathfinder_benchmark.py
+    python pathfinder_benchmark.py --size 200 --repeats 50 --rounds 10 --batch 20000
+"""
+from argparse import ArgumentParser
+from random import Random
+from time import perf_counter
+
+from pathfinder import barrier_grids, batch_pars, numpy, solve_trial
+
+
+def time_layouts(layouts, size, repeats, rounds=5):
+    # Returns the mean time (in milliseconds) to solve each layout once, in
+    # the fastest of several rounds (of solving every layout "repeats"
+    # times). As with timeit, the fastest round is the one least slowed
+    # down by whatever else the computer was doing at the time.
+    round_times = []
+    for _ in range(rounds):
+        start_time = perf_counter()
+        for _ in range(repeats):
+            for pacman, banana, barriers, portals in layouts:
+                solve_trial(pacman, banana, barriers, portals, size, size)
+        round_times.append(perf_counter() - start_time)
+    return min(round_times) * 1000 / (repeats * len(layouts))
+
+
+def random_layouts(size, count, barrier_fraction, with_portals, rng):
+    # Builds random (pacman, banana, barriers, portals) layouts
+    layouts = []
+    for _ in range(count):
+        locations = rng.sample([[x, y] for x in range(size) for y in range(size)],
+                               2 + int(barrier_fraction * size * size))
+        portals = None
+        if with_portals:
+            portals = [[-1, rng.randrange(size)], [size, rng.randrange(size)]]
+        layouts.append((locations[0], locations[1], locations[2:], portals))
+    return layouts
+
+
+def compare_batch(count, rng):
+    # Times the scalar and batch pathfinding on the same random layouts of
+    # the 6 x 3 arena (with 0-6 barriers and a portal pair). It returns the
+    # scalar time, the time to convert the layouts into arrays, and the
+    # batch time (all in seconds), and whether every par matched
+    columns, rows = 6, 3
+    portal_locations = ([[-1, y] for y in range(rows)] + [[columns, y] for y in range(rows)] +
+                        [[x, rows] for x in range(columns)])
+    pacmans, bananas, barrier_lists, portal_pairs = [], [], [], []
+    for _ in range(count):
+        locations = rng.sample([[x, y] for x in range(columns) for y in range(rows)], 2 + rng.randint(0, 6))
+        pacmans.append(locations[0])
+        bananas.append(locations[1])
+        barrier_lists.append(locations[2:])
+        portal_pairs.append(rng.sample(portal_locations, 2))
+    start_time = perf_counter()
+    solutions = [solve_trial(pacman, banana, barriers, portals, columns, rows)
+                 for pacman, banana, barriers, portals in zip(pacmans, bananas, barrier_lists, portal_pairs)]
+    scalar_time = perf_counter() - start_time
+    start_time = perf_counter()
+    layout_arrays = [numpy.array(pacmans), numpy.array(bananas),
+                     barrier_grids(barrier_lists, columns, rows), numpy.array(portal_pairs)]
+    conversion_time = perf_counter() - start_time
+    start_time = perf_counter()
+    nonportal_pars, portal_pars = batch_pars(*layout_arrays)
+    batch_time = perf_counter() - start_time
+    matched = all((-1 if solution.nonportal_par is None else solution.nonportal_par) == nonportal_par and
+                  (-1 if solution.portal_par is None else solution.portal_par) == portal_par
+                  for solution, nonportal_par, portal_par in zip(solutions, nonportal_pars, portal_pars))
+    return scalar_time, conversion_time, batch_time, matched
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description = "Time solve_trial() on large arenas.")
+    parser.add_argument("--size", type = int, default = 100, help = "Columns (and rows) of the arena")
+    parser.add_argument("--repeats", type = int, default = 20, help = "Times to solve each layout per round")
+    parser.add_argument("--rounds", type = int, default = 5, help = "Rounds to time (the fastest is reported)")
+    parser.add_argument("--batch", type = int, default = 10000, help = "Number of layouts for the batch comparison")
+    arguments = parser.parse_args()
+    size, repeats = arguments.size, arguments.repeats
+    rng = Random(0)
+    checks = [("Open arena, corner to corner",
+               [([0, 0], [size - 1, size - 1], [], None)]),
+              ("Open arena, corner to corner with portals",
+               [([0, 0], [size - 1, size - 1], [], [[-1, 0], [size, size - 1]])]),
+              ("Random locations, no barriers", random_layouts(size, 20, 0, False, rng)),
+              ("Random locations, 20% barriers", random_layouts(size, 20, 0.2, False, rng)),
+              ("Random locations, 20% barriers with portals", random_layouts(size, 20, 0.2, True, rng))]
+    print(f"solve_trial() on a {size} x {size} arena:")
+    for description, layouts in checks:
+        print(f"  {description}: {time_layouts(layouts, size, repeats, arguments.rounds):.3f} ms")
+    if numpy is None:
+        print("NumPy isn't installed, so the batch comparison was skipped")
+    else:
+        scalar_time, conversion_time, batch_time, matched = compare_batch(arguments.batch, rng)
+        print(f"{arguments.batch} random 6 x 3 layouts (with portals):")
+        print(f"  solve_trial() one at a time: {scalar_time * 1000:.1f} ms")
+        print(f"  batch_pars(): {batch_time * 1000:.1f} ms ({scalar_time / batch_time:.1f}x faster), "
+              f"plus {conversion_time * 1000:.1f} ms to build the layout arrays")
+        print(f"  Same pars: {matched}")
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Random walk model (RWM) control simulations for the P032a insight task.
+
+The RWM is a simulated subject that, every time the cursors are onscreen,
+pecks one of them at random. Its data are the "chance" baseline the real
+subjects are compared against (e.g., the moves-over-par of 3.b TEST).
+
+Rather than simulating a simplified version of each phase, trials are laid
+out by the real TrialGenerator (for any training phase, including barrier
+and portal phases), and each move follows the same rules as
+MainScreen.build_oval(): only the cursors that aren't blocked by a border
+or barrier are shown (or just the one toward the banana/portal in 3.a, 3.c,
+and 6.a), moving into a portal comes out of the other one, and a trial ends
+in reinforcement or a TO exactly when the experimental program would end it.
+Times follow the program's own timing (the length of each move, pause,
+reinforcer, ITI, and TO), with every peck taking "latency" ms.
+
+Every session of every subject is simulated at once: each move of every
+session still running is made in a single step with NumPy arrays, so
+hundreds of sessions take about as long as one. The sessions are written
+as ordinary session data files (same columns as the experimental program,
+see session_data.py), one per subject and session, with each session on
+its own day, so they can be read into R (or session_store.py) the same way
+as real data. This requires NumPy.
+
+Example usage (from the same folder as this script):
+    python random_walk_model.py "3.b TEST" --subjects 10 --sessions 5
+    python random_walk_model.py "7 TEST" --subjects 8 --sessions 3 --seed 32 --output data/RWM
+"""
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from os import mkdir, path as os_path
+from time import perf_counter
+
+from pathfinder import ArenaGrid
+from session_data import SessionCSVWriter, TRIAL_LAYOUTS_HEADER, TRIAL_LAYOUTS_SUFFIX, format_offset_ns
+from trial_generator import CURSOR_DISTANCE, CURSOR_STEPS, GAP, LEFT, MOVE_DISTANCE, PACMAN_SIZE, SCREEN_HEIGHT, \
+    SCREEN_WIDTH, TOP, TRAINING_PHASES, TrialGenerator, session_rngs, trial_layout_row
+
+try:
+    import numpy
+except ModuleNotFoundError:
+    numpy = None
+
+# The experimental program's timing (in ms)
+MOVE_DURATION = 960 # 120 pixels, 2 pixels every 16 ms
+GOAL_PAUSE = 750 # Banana reached (or phases 2 and 6.a-6.c) --> reinforcement
+GREEN_DOT_PAUSE = 500 # Green dot reached --> reinforcement
+TO_PAUSE = 1000 # Par reached without the banana --> TO
+REINFORCER_DURATION = 3000
+TO_DURATION = 8000
+ITI_DURATION = 5000
+FIRST_ITI_DURATION = 30000
+
+# The EventType of each event code. Codes 1-4 are the cursor pecks, in the
+# same order as DIRECTION_STEPS.
+EVENT_TYPES = ["PacmanPecked", "north_oval_pacman", "east_oval_pacman",
+               "south_oval_pacman", "west_oval_pacman", "PortalActivated",
+               "BananaReached", "GreenDotReached", "reinforcement",
+               "TimeOutPeriod", "SessionEnds"]
+PACMAN_PECKED, PORTAL_ACTIVATED, BANANA_REACHED, GREEN_DOT_REACHED, REINFORCEMENT, \
+    TIME_OUT, SESSION_ENDS = [EVENT_TYPES.index(event_type) for event_type in
+                              ["PacmanPecked", "PortalActivated", "BananaReached", "GreenDotReached",
+                               "reinforcement", "TimeOutPeriod", "SessionEnds"]]
+DIRECTIONS = ["north", "east", "south", "west"]
+DIRECTION_STEPS = [CURSOR_STEPS[event_type] for event_type in EVENT_TYPES[1:5]]
+
+# How each phase ends a trial (see MainScreen.pacman_pressed() and
+# build_oval()). In all other phases, trials only end at the banana.
+PECK_REINFORCED_PHASES = ["1.a", "1.b"] # Reinforced for pecking the pacman
+ONE_MOVE_PHASES = ["2.a", "2.b"] # Reinforced after one move
+PAR_LIMITED_PHASES = ["3.b", "3.d", "4.a"] # TO once par is reached without the banana
+PORTAL_REINFORCED_PHASES = ["6.a", "6.b", "6.c"] # Reinforced after using a portal
+GREEN_DOT_PHASES = ["6"] # Reinforced at the green dot
+# Phases with only a single cursor, toward the banana (or the first portal)
+SINGLE_CURSOR_PHASES = {"3.a": "banana_direction",
+                        "3.c": "banana_direction",
+                        "6.a": "portal_direction"}
+
+
+class RandomWalkModel(object):
+    # Simulates "sessions" sessions of "subjects" random walk subjects in a
+    # training phase. Each session ends after "reinforcers" reinforcers (75
+    # in the experimental program). Everything random comes from the seed
+    # (an int, or a numpy.random.SeedSequence): the trial layouts of each 
+    # session come from their own TrialGenerator (seeded from it), and the
+    # cursor choices from a NumPy generator. If record_events is False, only
+    # the trial_table() is kept (e.g., for very large simulations).
+    def __init__(self, training_phase, subjects=10, sessions=3, seed=None,
+                 reinforcers=75, latency=500, columns=6, rows=3, record_events=True):
+        if numpy is None:
+            raise ModuleNotFoundError("NumPy is required for the random walk model")
+        if training_phase not in TRAINING_PHASES:
+            raise ValueError(f"Unknown training phase: {training_phase}")
+        self.training_phase = training_phase
+        self.subjects = subjects
+        self.sessions = sessions
+        self.seed = seed
+        self.reinforcers = reinforcers
+        self.latency = latency
+        self.record_events = record_events
+        self.columns = columns
+        self.rows = rows
+        self.width = columns + 2 # The grid includes a border (see ArenaGrid)
+        session_count = subjects * sessions
+        if isinstance(seed, numpy.random.SeedSequence):
+            seed_sequence = seed
+        else:
+            seed_sequence = numpy.random.SeedSequence(seed)
+        self.rng = numpy.random.default_rng(seed_sequence)
+        # Each session has its own session seed, as in the experimental
+        # program, so that its trials can be replayed (see replay_session.py)
+        self.session_seeds = [int(session_seed) for session_seed in seed_sequence.generate_state(session_count)]
+        self.trial_generators = [TrialGenerator(training_phase, session_rngs(session_seed)[0], columns, rows)
+                                 for session_seed in self.session_seeds]
+        self.trials = [[] for _ in range(session_count)] # TrialSpec of every trial, per session
+        self.layouts = {} # Layout key --> (cells, exits) arrays, see layout_arrays()
+        # The arena grid index of each direction's neighbor, relative to a
+        # location
+        self.neighbor_offsets = numpy.array([dy * self.width + dx for dx, dy in DIRECTION_STEPS])
+        # Current state of every session
+        cell_count = self.width * (rows + 2)
+        self.cells = numpy.full((session_count, cell_count), ArenaGrid.BARRIER, dtype = numpy.uint8)
+        self.exits = numpy.tile(numpy.arange(cell_count), (session_count, 1)) # Where each cell leads
+        self.pacman = numpy.zeros(session_count, dtype = numpy.int64)
+        self.goal = numpy.full(session_count, -1)
+        self.green_dot = numpy.full(session_count, -1)
+        self.par = numpy.full(session_count, -1)
+        self.only_direction = numpy.full(session_count, -1) # Single cursor phases
+        self.moves = numpy.zeros(session_count, dtype = numpy.int64)
+        self.portal_used = numpy.zeros(session_count, dtype = bool)
+        self.walking = numpy.zeros(session_count, dtype = bool) # Waiting on a cursor peck
+        self.time = numpy.zeros(session_count, dtype = numpy.int64) # Session time (ms)
+        self.trial_start = numpy.zeros(session_count, dtype = numpy.int64)
+        self.trial_number = numpy.ones(session_count, dtype = numpy.int64)
+        self.reinforcers_provided = numpy.zeros(session_count, dtype = numpy.int64)
+        # Every event is kept as columns of arrays, one array per step
+        self.event_columns = {column: [] for column in
+                              ["session", "time", "event", "x", "y", "pacman", "trial", "moves", "trial_start"]}
+        # One row per finished trial
+        self.trial_columns = {column: [] for column in
+                              ["session", "trial", "moves", "par", "reinforced", "portal_used"]}
+
+    def run(self):
+        # Runs every session to the end
+        starting = numpy.arange(len(self.trials))
+        self.time[:] = FIRST_ITI_DURATION
+        while True:
+            if starting.size:
+                starting = self.start_trials(starting)
+                continue
+            walking = numpy.flatnonzero(self.walking)
+            if not walking.size:
+                return self
+            starting = self.step(walking)
+
+    def layout_arrays(self, trial_generator, barriers, portals):
+        # The cells of the arena grid (OPEN, BARRIER, or PORTAL) and where
+        # moving into each cell takes the pacman (itself, or the other end of
+        # a portal) for a layout
+        key = trial_generator.par_cache.layout_key(barriers, portals)
+        if key not in self.layouts:
+            arena_grid = ArenaGrid(self.columns, self.rows, barriers, portals)
+            exits = numpy.arange(len(arena_grid.cells))
+            for portal_index, exit_index in arena_grid.portal_exits:
+                exits[portal_index] = exit_index
+            self.layouts[key] = (numpy.frombuffer(bytes(arena_grid.cells), dtype = numpy.uint8), exits)
+        return self.layouts[key]
+
+    def cell(self, location):
+        return (location[1] + 1) * self.width + location[0] + 1
+
+    def start_trials(self, sessions):
+        # Sets up the next trial of each of these sessions, and pecks the
+        # pacman. Returns the sessions whose trial already ended (i.e.,
+        # phases 1.a and 1.b) and need another trial.
+        for session in sessions:
+            trial_generator = self.trial_generators[session]
+            previous_pacman = None
+            if self.training_phase in ONE_MOVE_PHASES and self.trials[session]:
+                pacman_cell = int(self.pacman[session])
+                previous_pacman = [pacman_cell % self.width - 1, pacman_cell // self.width - 1]
+            trial = trial_generator.next_trial(previous_pacman)
+            self.trials[session].append(trial)
+            self.cells[session], self.exits[session] = self.layout_arrays(trial_generator, trial.barriers,
+                                                                          trial.portals)
+            self.pacman[session] = self.cell(trial.pacman)
+            self.goal[session] = -1 if trial.banana is None else self.cell(trial.banana)
+            self.green_dot[session] = -1 if trial.green_dot is None else self.cell(trial.green_dot)
+            self.par[session] = -1 if trial.par is None else trial.par
+            if self.training_phase in SINGLE_CURSOR_PHASES:
+                self.only_direction[session] = DIRECTIONS.index(getattr(trial, SINGLE_CURSOR_PHASES[self.training_phase]))
+        self.moves[sessions] = 0
+        self.portal_used[sessions] = False
+        self.trial_start[sessions] = self.time[sessions]
+        self.time[sessions] += self.latency
+        pacman_x, pacman_y = self.pacman_center(self.pacman[sessions])
+        self.log_events(sessions, PACMAN_PECKED, pacman_x, pacman_y)
+        if self.training_phase in PECK_REINFORCED_PHASES:
+            return self.end_trials(sessions, numpy.ones(len(sessions), dtype = bool), self.time[sessions])
+        self.walking[sessions] = True
+        return sessions[:0]
+
+    def step(self, sessions):
+        # Makes one move in each of these sessions (all waiting on a cursor
+        # peck). Returns the sessions whose trial ended and need another.
+        count = len(sessions)
+        rows = numpy.arange(count)
+        neighbors = self.pacman[sessions, None] + self.neighbor_offsets
+        shown = self.cells[sessions[:, None], neighbors] != ArenaGrid.BARRIER
+        only_direction = self.only_direction[sessions]
+        single = only_direction >= 0
+        shown[single] &= numpy.arange(4) == only_direction[single, None]
+        if not shown.any(axis = 1).all():
+            raise RuntimeError(f"No cursors to peck in phase {self.training_phase}")
+        # A random cursor of those shown (shown ones always score higher)
+        direction = (self.rng.random((count, 4)) + shown).argmax(axis = 1)
+        # Peck the cursor...
+        self.time[sessions] += self.latency
+        self.moves[sessions] += 1
+        pacman_x, pacman_y = self.pacman_center(self.pacman[sessions])
+        steps = numpy.array(DIRECTION_STEPS)[direction]
+        self.log_events(sessions, 1 + direction,
+                        pacman_x + steps[:, 0] * CURSOR_DISTANCE,
+                        pacman_y + steps[:, 1] * CURSOR_DISTANCE)
+        # ...then move (through the portal, if it was moved into)
+        destination = neighbors[rows, direction]
+        self.time[sessions] += MOVE_DURATION
+        through_portal = self.cells[sessions, destination] == ArenaGrid.PORTAL
+        if through_portal.any():
+            portal_sessions = sessions[through_portal]
+            self.log_events(portal_sessions, PORTAL_ACTIVATED)
+            self.portal_used[portal_sessions] = True
+            destination[through_portal] = self.exits[portal_sessions, destination[through_portal]]
+            self.time[portal_sessions] += MOVE_DURATION
+        self.pacman[sessions] = destination
+        # Finally, check whether the trial is over (in the same order as
+        # build_oval())
+        ended = destination == self.goal[sessions]
+        reinforced = ended.copy()
+        end_time = self.time[sessions] + GOAL_PAUSE
+        self.log_events(sessions[ended], BANANA_REACHED)
+        moves = self.moves[sessions]
+        if self.training_phase in ONE_MOVE_PHASES:
+            reinforced |= moves == 1
+        elif self.training_phase in PAR_LIMITED_PHASES:
+            timed_out = ~ended & (moves == self.par[sessions])
+            end_time[timed_out] += TO_PAUSE - GOAL_PAUSE
+            ended |= timed_out
+        elif self.training_phase in PORTAL_REINFORCED_PHASES:
+            reinforced |= self.portal_used[sessions]
+        elif self.training_phase in GREEN_DOT_PHASES:
+            green_dot_reached = destination == self.green_dot[sessions]
+            self.log_events(sessions[green_dot_reached], GREEN_DOT_REACHED)
+            end_time[green_dot_reached] += GREEN_DOT_PAUSE - GOAL_PAUSE
+            reinforced |= green_dot_reached
+        ended |= reinforced
+        self.walking[sessions[ended]] = False
+        return self.end_trials(sessions[ended], reinforced[ended], end_time[ended])
+
+    def end_trials(self, sessions, reinforced, end_time):
+        # Ends the trials of these sessions at end_time, with reinforcement
+        # or a TO, followed by the ITI. Returns the sessions that go on to
+        # another trial (the rest have all their reinforcers).
+        self.time[sessions] = end_time
+        self.log_events(sessions, numpy.where(reinforced, REINFORCEMENT, TIME_OUT))
+        for column, values in [("session", sessions), ("trial", self.trial_number[sessions]),
+                               ("moves", self.moves[sessions]), ("par", self.par[sessions]),
+                               ("reinforced", reinforced), ("portal_used", self.portal_used[sessions])]:
+            self.trial_columns[column].append(values)
+        self.reinforcers_provided[sessions] += reinforced
+        self.time[sessions] += numpy.where(reinforced, REINFORCER_DURATION, TO_DURATION)
+        self.trial_number[sessions] += 1
+        self.moves[sessions] = 0
+        finished = self.reinforcers_provided[sessions] >= self.reinforcers
+        self.log_events(sessions[finished], SESSION_ENDS)
+        continuing = sessions[~finished]
+        self.time[continuing] += ITI_DURATION
+        return continuing
+
+    def pacman_center(self, cells):
+        # The pixel coordinates of the center of the pacman at these cells
+        # (as in the PacmanXcord/PacmanYcord columns)
+        grid_x = cells % self.width - 1
+        grid_y = cells // self.width - 1
+        return (LEFT + GAP + MOVE_DISTANCE * grid_x + PACMAN_SIZE // 2,
+                TOP + GAP + MOVE_DISTANCE * grid_y + PACMAN_SIZE // 2)
+
+    def log_events(self, sessions, event, x=-1, y=-1):
+        # Logs an event for each of these sessions at their current time
+        # (x/y are the peck's coordinates, or -1 if it wasn't a peck)
+        count = len(sessions)
+        if not count or not self.record_events:
+            return
+        for column, values in [("session", sessions), ("time", self.time[sessions]), ("event", event),
+                               ("x", x), ("y", y), ("pacman", self.pacman[sessions]),
+                               ("trial", self.trial_number[sessions]), ("moves", self.moves[sessions]),
+                               ("trial_start", self.trial_start[sessions])]:
+            self.event_columns[column].append(numpy.broadcast_to(values, count))
+
+    def events(self):
+        # Returns every event as a dictionary of arrays, sorted by session
+        # (and in order within each session)
+        events = {column: numpy.concatenate(values) for column, values in self.event_columns.items()}
+        order = numpy.argsort(events["session"], kind = "stable")
+        return {column: values[order] for column, values in events.items()}
+
+    def trial_table(self):
+        # Returns every finished trial as a dictionary of arrays (session,
+        # trial, moves, par (-1 if none), reinforced, portal_used)
+        return {column: numpy.concatenate(values) for column, values in self.trial_columns.items()}
+
+    def session_rows(self, start_date):
+        # Yields (subject, session number, session start, rows) for each
+        # session, with rows in the columns of SESSION_DATA_HEADER. Session n
+        # of each subject is n - 1 days after start_date.
+        events = self.events()
+        session_ends = numpy.searchsorted(events["session"], numpy.arange(len(self.trials)), side = "right")
+        pacman_x, pacman_y = self.pacman_center(events["pacman"])
+        transformed_x = SCREEN_WIDTH // 2 - pacman_x + events["x"]
+        transformed_y = SCREEN_HEIGHT // 2 - pacman_y + events["y"]
+        columns = [events[column].tolist() for column in ["time", "event", "x", "y", "trial", "moves", "trial_start"]]
+        columns += [pacman_x.tolist(), pacman_y.tolist(), transformed_x.tolist(), transformed_y.tolist()]
+        row_start = 0
+        for session, row_end in enumerate(session_ends):
+            subject = f"RWM{session // self.sessions + 1:02d}"
+            session_number = session % self.sessions + 1
+            session_start = start_date + timedelta(days = session_number - 1)
+            trials = self.trials[session]
+            rows = []
+            for time, event, x, y, trial_number, moves, trial_start, center_x, center_y, \
+                    transformed_x, transformed_y in zip(*[column[row_start:row_end] for column in columns]):
+                trial = trials[min(trial_number, len(trials)) - 1] # SessionEnds is after the last trial
+                peck = x >= 0
+                rows.append([format_offset_ns(time * 1000000),
+                             EVENT_TYPES[event],
+                             x if peck else "NA",
+                             y if peck else "NA",
+                             transformed_x if peck else "NA",
+                             transformed_y if peck else "NA",
+                             center_x,
+                             center_y,
+                             trial_number,
+                             moves,
+                             trial.par,
+                             format_offset_ns((time - trial_start) * 1000000),
+                             subject,
+                             self.training_phase,
+                             session_start.date(),
+                             trial.insight_trial_type])
+            yield subject, session_number, session_start, rows
+            row_start = row_end
+
+    def write_csvs(self, data_folder_directory, start_date=None):
+        # Writes every session as a session data file in a folder per
+        # subject (data_folder_directory/<subject>/), named the same way as
+        # the experimental program's files, with its trial layouts file
+        # next to it. Returns the file paths (of the session data files).
+        if start_date is None:
+            start_date = datetime.now().replace(hour = 9, minute = 0, second = 0, microsecond = 0)
+        file_paths = []
+        for session, (subject, session_number, session_start, rows) in enumerate(self.session_rows(start_date)):
+            subject_directory = os_path.join(data_folder_directory, subject)
+            if not os_path.isdir(subject_directory):
+                mkdir(subject_directory)
+            file_path = os_path.join(subject_directory,
+                                     f"P032a_data_{subject}_{session_start.strftime('%Y-%m-%d_%H.%M.%S')}"
+                                     f"_phase-{self.training_phase}.csv")
+            metadata = {"SessionStart": session_start.isoformat(),
+                        "Clock": "random_walk_model",
+                        "Seed": self.seed,
+                        "SessionSeed": self.session_seeds[session],
+                        "Arena": f"{self.columns}x{self.rows}"}
+            data_file_writer = SessionCSVWriter(file_path, metadata = metadata, flush_every = 1000).open()
+            data_file_writer.write_rows(rows)
+            data_file_writer.close()
+            layout_file_writer = SessionCSVWriter(file_path[:-len(".csv")] + TRIAL_LAYOUTS_SUFFIX,
+                                                  header = TRIAL_LAYOUTS_HEADER, metadata = metadata,
+                                                  flush_every = 1000).open()
+            layout_file_writer.write_rows(trial_layout_row(trial) for trial in self.trials[session])
+            layout_file_writer.close()
+            file_paths.append(file_path)
+        return file_paths
+
+
+def summarize_trials(trial_table):
+    # Returns a few summary numbers of a trial_table(): the number of
+    # trials, the proportion reinforced, the mean moves per trial, the mean
+    # moves over par (of trials with a par that were reinforced), and the
+    # proportion of trials where a portal was used
+    reinforced = trial_table["reinforced"]
+    with_par = reinforced & (trial_table["par"] >= 0)
+    moves_over_par = trial_table["moves"][with_par] - trial_table["par"][with_par]
+    return (len(reinforced),
+            reinforced.mean(),
+            trial_table["moves"].mean(),
+            moves_over_par.mean() if moves_over_par.size else float("nan"),
+            trial_table["portal_used"].mean())
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description = "Simulate random walk model (RWM) sessions of a training phase.")
+    parser.add_argument("training_phase", help = 'Training phase (e.g., "3.b TEST")')
+    parser.add_argument("--subjects", type = int, default = 10, help = "Number of simulated subjects")
+    parser.add_argument("--sessions", type = int, default = 3, help = "Number of sessions per subject")
+    parser.add_argument("--reinforcers", type = int, default = 75, help = "Reinforcers per session")
+    parser.add_argument("--seed", type = int, help = "Random seed (for repeatable simulations)")
+    parser.add_argument("--output", help = "Folder to write the session data files to (one folder per subject)")
+    arguments = parser.parse_args()
+    start_time = perf_counter()
+    model = RandomWalkModel(arguments.training_phase, arguments.subjects, arguments.sessions,
+                            arguments.seed, arguments.reinforcers).run()
+    simulation_time = perf_counter() - start_time
+    trials, reinforced, moves, moves_over_par, portal_used = summarize_trials(model.trial_table())
+    print(f"{arguments.subjects * arguments.sessions} {arguments.training_phase} sessions simulated "
+          f"in {simulation_time:.2f} s: {trials} trials ({reinforced:.1%} reinforced), "
+          f"{moves:.2f} moves per trial, {moves_over_par:.2f} moves over par, "
+          f"portal used in {portal_used:.1%}")
+    if arguments.output:
+        start_time = perf_counter()
+        file_paths = model.write_csvs(arguments.output)
+        print(f"{len(file_paths)} session files written to {arguments.output} "
+              f"in {perf_counter() - start_time:.2f} s")
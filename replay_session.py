@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Session replay for the P032a insight task.
+
+Every session data file records its session seed (and the size of the
+arena) in its metadata line. The TrialGenerator takes all of its random
+numbers from that seed, so the layout of every trial of the session can be
+generated again, exactly as it was shown. This tool does that, and then
+re-applies the logged pecks (in order) to each layout, following the same
+rules as the experimental program (see MainScreen.build_oval() and
+pacman_arrived()), to work out where the pacman was throughout every trial.
+Nothing is drawn and no window (or tkinter) is needed, so a whole session
+replays in a few milliseconds.
+
+Along the way, the replay is checked against what was logged: each trial's
+par and insight trial type, the pacman's location at every peck, the move
+counter, and whether the banana (or green dot) was reached and a portal
+used. Any difference is reported as a "mismatch" (e.g., a file edited by
+hand, or written by an older version of the trial generator). Files from
+before sessions were seeded can't be replayed, and are skipped.
+
+Example usage (from the same folder as this script):
+    python replay_session.py data/
+    python replay_session.py data/P001/ --verbose
+    python replay_session.py data/ --output replayed_trials.csv
+"""
+from argparse import ArgumentParser
+from collections import namedtuple
+from csv import reader, writer, QUOTE_MINIMAL
+from glob import glob
+from itertools import groupby
+from os import path as os_path
+from time import perf_counter
+
+from pathfinder import ArenaGrid
+from session_data import METADATA_PREFIX, SESSION_DATA_HEADER, SIDECAR_SUFFIXES, \
+    read_session_metadata
+from session_store import SESSION_FILE_PATTERN, convert_value
+from trial_generator import CURSOR_STEPS, GAP, LEFT, MOVE_DISTANCE, PACMAN_SIZE, TOP, TrialGenerator, \
+    format_grid_locations, session_rngs
+
+# Only these columns of the session data are needed for a replay (in
+# this order in the rows of read_replay_rows())
+REPLAY_COLUMNS = ["EventType", "PacmanXcord", "PacmanYcord", "TrialNum", "MoveCounter",
+                  "TrialPar", "TrainingPhase", "InsightTrialType", "Subject", "Date"]
+EVENT_TYPE, PACMAN_X, PACMAN_Y, TRIAL_NUMBER, MOVE_COUNTER, TRIAL_PAR, TRAINING_PHASE, \
+    INSIGHT_TRIAL_TYPE, SUBJECT, DATE = range(len(REPLAY_COLUMNS))
+# Events that only happen while a trial is onscreen (pecks on the
+# background can also happen during the ITI, before the next trial appears)
+TRIAL_EVENTS = set(CURSOR_STEPS) | {"PacmanPecked", "BananaPeck", "GreenDotPeck",
+                                    "PortalActivated", "BananaReached", "GreenDotReached",
+                                    "reinforcement", "TimeOutPeriod"}
+DEFAULT_ARENA = "6x3" # Columns x rows (of the experimental program's arena)
+# The replayed trials .csv has one row per trial of every file
+REPLAY_TRIAL_HEADER = ["SessionFile", "TrialNum", "Pacman", "Banana", "Barriers", "Portals",
+                       "GreenDot", "Par", "Moves", "Path", "BananaReached", "PortalUsed",
+                       "Outcome", "Mismatches"]
+
+# One replayed trial:
+#   layout          - the TrialSpec generated again from the session seed
+#                     (or as it was logged; see replay_session())
+#   logged_par      - the TrialPar logged during the trial
+#   moves           - number of cursor pecks (moves) made
+#   path            - every grid location of the pacman, from the start of
+#                     the trial to where it was left (a portal moved into is
+#                     followed by the location the pacman came out at, as in
+#                     pathfinder.py)
+#   banana_reached, green_dot_reached, portal_used - True/False
+#   outcome         - "reinforcement", "TimeOutPeriod", or None (if the
+#                     session ended during the trial)
+#   mismatches      - list of differences between the replay and the log
+ReplayedTrial = namedtuple("ReplayedTrial",
+                           ["layout", "logged_par", "moves", "path", "banana_reached", "green_dot_reached",
+                            "portal_used", "outcome", "mismatches"])
+
+
+def read_replay_rows(file_path):
+    # Reads the metadata and the REPLAY_COLUMNS of every row of a session
+    # file. This is the same as session_store.read_session_file(), but only
+    # converts the columns a replay needs (most of the time of reading a
+    # file is spent converting its values, the times especially).
+    metadata = read_session_metadata(file_path)
+    column_indexes = [SESSION_DATA_HEADER.index(column) for column in REPLAY_COLUMNS]
+    rows = []
+    with open(file_path, newline = '') as data_file:
+        csv_reader = reader(data_file)
+        for line in csv_reader:
+            if line and not line[0].startswith(METADATA_PREFIX):
+                if line != SESSION_DATA_HEADER:
+                    raise ValueError(f"{file_path} does not have the session data header")
+                break
+        for line in csv_reader:
+            if len(line) == len(SESSION_DATA_HEADER): # Skips a row cut off by a crash
+                rows.append([convert_value(column, line[index])
+                             for column, index in zip(REPLAY_COLUMNS, column_indexes)])
+    return metadata, rows
+
+
+def pacman_center(location):
+    # The pixel coordinates of the center of the pacman at this grid
+    # location (as in the PacmanXcord/PacmanYcord columns)
+    return (LEFT + GAP + MOVE_DISTANCE * location[0] + PACMAN_SIZE // 2,
+            TOP + GAP + MOVE_DISTANCE * location[1] + PACMAN_SIZE // 2)
+
+
+def replay_trial(layout, trial_rows, columns, rows):
+    # Re-applies the logged events of one trial to its layout, and returns
+    # a ReplayedTrial
+    grid = ArenaGrid(columns, rows, layout.barriers, layout.portals)
+    portal_exits = dict(grid.portal_exits)
+    location = grid.index(layout.pacman)
+    center = pacman_center(layout.pacman)
+    path = [list(layout.pacman)]
+    moves = 0
+    portal_entries = 0
+    logged = {"PortalActivated": 0, "BananaReached": 0, "GreenDotReached": 0}
+    outcome = None
+    mismatches = []
+    logged_par = trial_rows[0][TRIAL_PAR]
+    if logged_par != layout.par:
+        mismatches.append(f"TrialPar {logged_par} (replayed {layout.par})")
+    if trial_rows[0][INSIGHT_TRIAL_TYPE] != layout.insight_trial_type:
+        mismatches.append(f"InsightTrialType {trial_rows[0][INSIGHT_TRIAL_TYPE]} "
+                          f"(replayed {layout.insight_trial_type})")
+    for row in trial_rows:
+        event_type = row[EVENT_TYPE]
+        if event_type in logged:
+            logged[event_type] += 1
+        elif event_type in ["reinforcement", "TimeOutPeriod"]:
+            outcome = event_type
+        if event_type != "PacmanPecked" and event_type not in CURSOR_STEPS:
+            continue
+        # Pecks on the pacman and cursors are logged with where the pacman
+        # was when they happened (i.e., before any move they make)
+        if (row[PACMAN_X], row[PACMAN_Y]) != center:
+            mismatches.append(f"{event_type} with the pacman at {row[PACMAN_X]}, {row[PACMAN_Y]} "
+                              f"(replayed {center[0]}, {center[1]})")
+        if event_type == "PacmanPecked":
+            continue
+        step_x, step_y = CURSOR_STEPS[event_type]
+        next_location = location + step_x + step_y * grid.width
+        if grid.cells[next_location] == ArenaGrid.BARRIER: # This cursor is never shown
+            mismatches.append(f"{event_type} into a barrier or border at move {moves + 1}")
+            continue
+        moves += 1
+        if row[MOVE_COUNTER] != moves:
+            mismatches.append(f"MoveCounter {row[MOVE_COUNTER]} (replayed {moves})")
+        if grid.cells[next_location] == ArenaGrid.PORTAL:
+            portal_entries += 1
+            path.append(grid.location(next_location))
+            next_location = portal_exits[next_location]
+        location = next_location
+        path.append(grid.location(location))
+        center = pacman_center(path[-1])
+    banana_reached = layout.banana is not None and path[-1] == list(layout.banana)
+    green_dot_reached = layout.green_dot is not None and path[-1] == list(layout.green_dot)
+    # The end of a trial can only be checked if the trial finished
+    if outcome is not None:
+        for event_type, replayed in [("PortalActivated", portal_entries),
+                                     ("BananaReached", int(banana_reached)),
+                                     ("GreenDotReached", int(green_dot_reached))]:
+            if logged[event_type] != replayed:
+                mismatches.append(f"{event_type} logged {logged[event_type]} times (replayed {replayed})")
+    return ReplayedTrial(layout, logged_par, moves, path, banana_reached, green_dot_reached,
+                         portal_entries > 0, outcome, mismatches)
+
+
+def replay_session(file_path, layouts=None):
+    # Replays a session data file, returning its metadata, its rows (see
+    # read_replay_rows()), and a list of ReplayedTrials (one for every trial
+    # that was shown). The layouts are generated again from the session 
+    # seed, unless they are passed in as a dictionary of trial number -->
+    # TrialSpec (e.g., as read from its trial layouts file; trials without
+    # a layout are left out). Raises a ValueError if the file has no
+    # session seed (and no layouts are passed in).
+    metadata, rows = read_replay_rows(file_path)
+    if layouts is None and "SessionSeed" not in metadata:
+        raise ValueError(f"{os_path.basename(file_path)} has no session seed")
+    if not rows:
+        return metadata, rows, []
+    columns, arena_rows = [int(size) for size in metadata.get("Arena", DEFAULT_ARENA).split("x")]
+    if layouts is None:
+        layout_rng = session_rngs(int(metadata["SessionSeed"]))[0]
+        trial_generator = TrialGenerator(rows[0][TRAINING_PHASE], layout_rng, columns, arena_rows)
+    replayed_trials = []
+    pacman_location = None # Where the pacman was left (see MainScreen.prepare_trial())
+    for trial_number, trial_rows in groupby(rows, key = lambda row: row[TRIAL_NUMBER]):
+        trial_rows = [row for row in trial_rows if row[EVENT_TYPE] in TRIAL_EVENTS]
+        if not trial_rows:
+            continue
+        if layouts is not None:
+            layout = layouts.get(trial_number)
+            if layout is None:
+                continue
+        else:
+            # Every trial is generated, in order, even those that were never
+            # shown (e.g., the trial after the session was ended early)
+            while trial_generator.trial_number < trial_number:
+                layout = trial_generator.next_trial(pacman_location)
+        replayed = replay_trial(layout, trial_rows, columns, arena_rows)
+        pacman_location = replayed.path[-1]
+        replayed_trials.append(replayed)
+    return metadata, rows, replayed_trials
+
+
+def find_session_files(paths):
+    # Returns every session file in these paths (files, or folders holding
+    # session files or subject folders of them), leaving out the sidecar
+    # files written next to them
+    file_paths = []
+    for file_or_folder in paths:
+        if os_path.isdir(file_or_folder):
+            file_paths += glob(os_path.join(file_or_folder, SESSION_FILE_PATTERN))
+            file_paths += glob(os_path.join(file_or_folder, "*", SESSION_FILE_PATTERN))
+        else:
+            file_paths.append(file_or_folder)
+    return sorted(set(file_path for file_path in file_paths if not file_path.endswith(SIDECAR_SUFFIXES)))
+
+
+def replayed_trial_rows(file_path, replayed_trials):
+    # Returns the rows of REPLAY_TRIAL_HEADER for a replayed session
+    trial_rows = []
+    for trial in replayed_trials:
+        layout = trial.layout
+        trial_rows.append([os_path.basename(file_path),
+                           layout.trial_number,
+                           format_grid_locations([layout.pacman]),
+                           format_grid_locations(None if layout.banana is None else [layout.banana]),
+                           format_grid_locations(layout.barriers),
+                           format_grid_locations(layout.portals),
+                           format_grid_locations(None if layout.green_dot is None else [layout.green_dot]),
+                           "NA" if layout.par is None else layout.par,
+                           trial.moves,
+                           format_grid_locations(trial.path),
+                           trial.banana_reached,
+                           trial.portal_used,
+                           trial.outcome or "NA",
+                           "; ".join(trial.mismatches)])
+    return trial_rows
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description = "Replay P032a sessions from their data files, without the GUI.")
+    parser.add_argument("paths", nargs = "+", help = "Session files, or folders of them (or of subject folders)")
+    parser.add_argument("--output", help = "Write every replayed trial to this .csv")
+    parser.add_argument("--verbose", action = "store_true", help = "Print every mismatch")
+    arguments = parser.parse_args()
+    start_time = perf_counter()
+    counts = {"files": 0, "skipped": 0, "trials": 0, "mismatches": 0}
+    output_file = None
+    if arguments.output:
+        output_file = open(arguments.output, 'w', newline = '')
+        csv_writer = writer(output_file, quoting = QUOTE_MINIMAL)
+        csv_writer.writerow(REPLAY_TRIAL_HEADER)
+    for file_path in find_session_files(arguments.paths):
+        try:
+            metadata, rows, replayed_trials = replay_session(file_path)
+        except ValueError as error:
+            print(f"Skipped {os_path.basename(file_path)}: {error}")
+            counts["skipped"] += 1
+            continue
+        mismatches = sum(len(trial.mismatches) for trial in replayed_trials)
+        counts["files"] += 1
+        counts["trials"] += len(replayed_trials)
+        counts["mismatches"] += mismatches
+        if mismatches or arguments.verbose:
+            print(f"{os_path.basename(file_path)}: {len(replayed_trials)} trials, {mismatches} mismatches")
+        if arguments.verbose:
+            for trial in replayed_trials:
+                for mismatch in trial.mismatches:
+                    print(f"    Trial {trial.layout.trial_number}: {mismatch}")
+        if output_file is not None:
+            csv_writer.writerows(replayed_trial_rows(file_path, replayed_trials))
+    if output_file is not None:
+        output_file.close()
+    print(f"Replayed {counts['trials']} trials of {counts['files']} sessions ({counts['skipped']} skipped) "
+          f"in {perf_counter() - start_time:.2f} s: {counts['mismatches']} mismatches")
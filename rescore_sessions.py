@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline re-scoring of P032a insight task sessions.
+
+The par of each trial (and whether using a portal was the shortest way to
+the banana) is logged as the pathfinder found it when the session was run.
+If the way par is found ever changes, the sessions already run can be
+re-scored with this tool. For each session file, it:
+    1. reads the layout of every trial from the trial layouts file next to
+       it (see TRIAL_LAYOUTS_HEADER in session_data.py). Sessions without
+       one are laid out again from their session seed instead (see
+       replay_session.py), and sessions with neither are skipped.
+    2. re-applies the logged pecks to each layout (as replay_session.py
+       does) to find the moves made, where the pacman went, and whether it
+       used a portal and reached the banana.
+    3. solves every layout again with the current pathfinder (pathfinder.py,
+       with a ParCache, so repeated layouts are only ever solved once) for
+       its par (with and without the portals) and one shortest path.
+From these, each trial's moves over par and "portal optimality" are found.
+A trial's portal use is optimal if the banana was reached with (or without)
+a portal exactly when that is the shortest way to it (when both ways are
+equally short, either is optimal).
+
+Session files are re-scored independently of each other, each by one of a
+pool of worker processes (a ProcessPoolExecutor, one worker per core by
+default), and only their rows of results are sent back, so the time taken
+falls in proportion to the number of cores. The results are written (in
+the order of the files) as two .csv tables:
+    <output>_trials.csv   - one row per trial (RESCORED_TRIAL_HEADER)
+    <output>_sessions.csv - one row per session (RESCORED_SESSION_HEADER)
+
+Example usage (from the same folder as this script):
+    python rescore_sessions.py data/ --output rescored
+    python rescore_sessions.py data/P001/ data/P002/ --output rescored --workers 4
+"""
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from csv import writer, QUOTE_MINIMAL
+from os import path as os_path
+from statistics import mean
+from time import perf_counter
+
+from pathfinder import ParCache
+from replay_session import DATE, SUBJECT, TRAINING_PHASE, find_session_files, replay_session
+from session_data import TRIAL_LAYOUTS_SUFFIX
+from trial_generator import format_grid_locations, read_trial_layouts
+
+# The re-scored trials .csv has one row per trial of every session file
+RESCORED_TRIAL_HEADER = ["SessionFile", "TrialNum", "InsightTrialType", "LoggedPar", "Par",
+                         "NonportalPar", "PortalPar", "IdealStrategy", "ShortestPath", "Moves",
+                         "BananaReached", "MovesOverPar", "PortalUsed", "PortalOptimal", "Outcome"]
+# The re-scored sessions .csv has one row per session file
+RESCORED_SESSION_HEADER = ["SessionFile", "Subject", "TrainingPhase", "Date", "Layouts", "Trials",
+                           "BananaReached", "MeanMovesOverPar", "AtPar", "PortalOptimal",
+                           "ParChanged", "Mismatches"]
+
+# Each worker process keeps its own ParCache for each arena size
+PAR_CACHES = {}
+
+
+def rescore_trial(trial, par_cache):
+    # Solves a ReplayedTrial's layout again, and returns a dictionary of its
+    # re-scored values (None where they don't apply)
+    layout = trial.layout
+    scores = {"Par": None, "NonportalPar": None, "PortalPar": None, "IdealStrategy": None,
+              "ShortestPath": None, "MovesOverPar": None, "PortalOptimal": None}
+    if layout.banana is None:
+        return scores
+    solution = par_cache.solve_trial(layout.pacman, layout.banana, layout.barriers, layout.portals)
+    scores.update({"Par": solution.par,
+                   "NonportalPar": solution.nonportal_par,
+                   "PortalPar": solution.portal_par,
+                   "IdealStrategy": solution.ideal_strategy,
+                   "ShortestPath": solution.path})
+    if trial.banana_reached and solution.par is not None:
+        scores["MovesOverPar"] = trial.moves - solution.par
+        if layout.portals is not None and solution.portal_par is not None:
+            if solution.portal_par == solution.nonportal_par:
+                scores["PortalOptimal"] = True
+            else:
+                scores["PortalOptimal"] = trial.portal_used == (solution.ideal_strategy == "portal")
+    return scores
+
+
+def rescore_file(file_path):
+    # Re-scores a single session file (in a worker process). Returns its
+    # rows of RESCORED_TRIAL_HEADER and its row of RESCORED_SESSION_HEADER,
+    # or None and the reason it was skipped.
+    layouts_path = file_path[:-len(".csv")] + TRIAL_LAYOUTS_SUFFIX
+    layouts = read_trial_layouts(layouts_path) if os_path.isfile(layouts_path) else None
+    try:
+        metadata, rows, replayed_trials = replay_session(file_path, layouts)
+    except ValueError as error:
+        return None, f"{error} (and no trial layouts file)"
+    if not replayed_trials:
+        return None, "no trials"
+    columns, arena_rows = [int(size) for size in metadata.get("Arena", "6x3").split("x")]
+    par_cache = PAR_CACHES.setdefault((columns, arena_rows), ParCache(columns, arena_rows))
+    file_name = os_path.basename(file_path)
+    trial_rows = []
+    moves_over_par, portal_optimal = [], []
+    par_changed = 0
+    for trial in replayed_trials:
+        scores = rescore_trial(trial, par_cache)
+        if scores["MovesOverPar"] is not None:
+            moves_over_par.append(scores["MovesOverPar"])
+        if scores["PortalOptimal"] is not None:
+            portal_optimal.append(scores["PortalOptimal"])
+        if trial.logged_par != scores["Par"]:
+            par_changed += 1
+        trial_rows.append([file_name,
+                           trial.layout.trial_number,
+                           trial.layout.insight_trial_type,
+                           trial.logged_par,
+                           scores["Par"],
+                           scores["NonportalPar"],
+                           scores["PortalPar"],
+                           scores["IdealStrategy"],
+                           format_grid_locations(scores["ShortestPath"]),
+                           trial.moves,
+                           trial.banana_reached,
+                           scores["MovesOverPar"],
+                           trial.portal_used,
+                           scores["PortalOptimal"],
+                           trial.outcome])
+    session_row = [file_name,
+                   rows[0][SUBJECT],
+                   rows[0][TRAINING_PHASE],
+                   rows[0][DATE],
+                   "logged" if layouts is not None else "seed",
+                   len(replayed_trials),
+                   len(moves_over_par),
+                   round(mean(moves_over_par), 4) if moves_over_par else None,
+                   round(moves_over_par.count(0) / len(moves_over_par), 4) if moves_over_par else None,
+                   round(mean(portal_optimal), 4) if portal_optimal else None,
+                   par_changed,
+                   sum(len(trial.mismatches) for trial in replayed_trials)]
+    # Missing values are written as "NA" (as in the session files)
+    return [["NA" if value is None else value for value in row] for row in trial_rows], \
+        ["NA" if value is None else value for value in session_row]
+
+
+def rescore_sessions(file_paths, output_stem, workers=None):
+    # Re-scores every session file across a pool of worker processes, and
+    # writes the two tables as the results come in (in the order of
+    # file_paths). Returns counts of the sessions, trials, and skips.
+    counts = {"sessions": 0, "trials": 0, "skipped": 0, "par_changed": 0}
+    with open(output_stem + "_trials.csv", 'w', newline = '') as trials_file, \
+            open(output_stem + "_sessions.csv", 'w', newline = '') as sessions_file:
+        trials_writer = writer(trials_file, quoting = QUOTE_MINIMAL)
+        sessions_writer = writer(sessions_file, quoting = QUOTE_MINIMAL)
+        trials_writer.writerow(RESCORED_TRIAL_HEADER)
+        sessions_writer.writerow(RESCORED_SESSION_HEADER)
+        with ProcessPoolExecutor(max_workers = workers) as executor:
+            for file_path, (trial_rows, session_row) in zip(file_paths,
+                                                            executor.map(rescore_file, file_paths, chunksize = 4)):
+                if trial_rows is None:
+                    print(f"Skipped {os_path.basename(file_path)}: {session_row}")
+                    counts["skipped"] += 1
+                    continue
+                trials_writer.writerows(trial_rows)
+                sessions_writer.writerow(session_row)
+                counts["sessions"] += 1
+                counts["trials"] += len(trial_rows)
+                counts["par_changed"] += session_row[RESCORED_SESSION_HEADER.index("ParChanged")]
+    return counts
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description = "Re-score P032a sessions (par, paths, and efficiency) from their data files.")
+    parser.add_argument("paths", nargs = "+", help = "Session files, or folders of them (or of subject folders)")
+    parser.add_argument("--output", default = "P032a_rescored",
+                        help = "Write <output>_trials.csv and <output>_sessions.csv (default: P032a_rescored)")
+    parser.add_argument("--workers", type = int, help = "Worker processes (default: one per core)")
+    arguments = parser.parse_args()
+    start_time = perf_counter()
+    counts = rescore_sessions(find_session_files(arguments.paths), arguments.output, arguments.workers)
+    print(f"Re-scored {counts['trials']} trials of {counts['sessions']} sessions ({counts['skipped']} skipped) "
+          f"in {perf_counter() - start_time:.2f} s: {counts['par_changed']} trials with a different par")
@@ -0,0 +1,653 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Session data recording for the P032a insight task.
+
+This file holds everything needed to get event data out of a running
+MainScreen session and onto disk. It is imported by the experimental program
+(and can be imported by any analysis or simulation scripts) so that every
+data file shares exactly the same column layout.
+"""
+from array import array
+from csv import writer, QUOTE_MINIMAL
+from datetime import date, datetime, timedelta
+from json import dump as json_dump, load as json_load
+from math import ceil, isnan
+from os import fsync, mkdir, replace, path as os_path
+from queue import Queue, Full
+from struct import pack
+from sys import byteorder
+from threading import Lock, Thread
+from time import perf_counter_ns
+# NumPy is only needed to READ the binary session files (see 
+# load_session_columns); the experimental program itself never needs it.
+try:
+    import numpy
+except ModuleNotFoundError:
+    numpy = None
+
+# These are the column headers of every session data .csv (in order). Each
+# event written by MainScreen.write_event_data() is a single row of these 16
+# values. This list is the single source of truth for the data layout, so any
+# new column should be added here and nowhere else.
+SESSION_DATA_HEADER = ["Time", "EventType", "Xcord", "Ycord",
+                       "TransformedXcord", "TransformedYcord",
+                       "PacmanXcord", "PacmanYcord",
+                       "TrialNum", "MoveCounter", "TrialPar",
+                       "TrialTime", "Subject", "TrainingPhase",
+                       "Date", "InsightTrialType"]
+
+# The in-memory event buffer stores each column as a typed array. Columns
+# that repeat the same few strings over and over (event types, phases, and
+# subject names) are "interned" as small integer codes. Integer columns use
+# NA_INT for missing values (e.g., "NA" x/y for events that aren't pecks).
+NA_INT = -2**31
+SESSION_DATA_TYPECODES = {"Time": "q", # Nanoseconds since session start
+                          "EventType": "H", # Interned code
+                          "Xcord": "i",
+                          "Ycord": "i",
+                          "TransformedXcord": "i",
+                          "TransformedYcord": "i",
+                          "PacmanXcord": "i",
+                          "PacmanYcord": "i",
+                          "TrialNum": "i",
+                          "MoveCounter": "i",
+                          "TrialPar": "i",
+                          "TrialTime": "q", # Nanoseconds since trial start
+                          "Subject": "H", # Interned code
+                          "TrainingPhase": "H", # Interned code
+                          "Date": "i", # Proleptic Gregorian ordinal
+                          "InsightTrialType": "d"} # NaN if not a 7 TEST trial
+INTERNED_COLUMNS = ["EventType", "Subject", "TrainingPhase"]
+# Missing values are written to the .csv as "NA" for the peck coordinates and
+# as an empty cell for everything else (matching the original data files).
+NA_AS_TEXT_COLUMNS = ["Xcord", "Ycord", "TransformedXcord", "TransformedYcord"]
+
+# The binary session format is a folder holding one NumPy ".npy" file per
+# column (plus a "schema.json" file describing them). Each .npy file is just
+# a small fixed-size header followed by the raw column values, so it can be
+# loaded without any parsing (and memory-mapped) by NumPy, or read by R 
+# (e.g., with RcppCNPy or reticulate). The dtypes of each column are below;
+# times are int64 nanoseconds, dates are days since 1970-01-01, and the
+# interned columns are small integer codes (with their dictionaries of 
+# values stored in the schema).
+NPY_HEADER_SIZE = 128
+NPY_BYTE_ORDER = "<" if byteorder == "little" else ">"
+SESSION_COLUMN_DTYPES = {"Time": "m8[ns]",
+                         "EventType": "u2",
+                         "Xcord": "i4",
+                         "Ycord": "i4",
+                         "TransformedXcord": "i4",
+                         "TransformedYcord": "i4",
+                         "PacmanXcord": "i4",
+                         "PacmanYcord": "i4",
+                         "TrialNum": "i4",
+                         "MoveCounter": "i4",
+                         "TrialPar": "i4",
+                         "TrialTime": "m8[ns]",
+                         "Subject": "u2",
+                         "TrainingPhase": "u2",
+                         "Date": "M8[D]",
+                         "InsightTrialType": "f8"}
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+# Session-wide information (e.g., the wall-clock time the session started)
+# is written once at the very top of each data file as a single "metadata"
+# line, starting with METADATA_PREFIX and made up of key=value pairs
+# separated by semicolons. For example:
+#   # SessionStart=2022-03-09T14:00:56.123456;Clock=perf_counter_ns
+# In R, these files can be read with read_csv(..., comment = "#") (see
+# README.md), or combined with session_store.py --export-csv.
+METADATA_PREFIX = "# "
+
+
+def format_session_metadata(metadata):
+    return METADATA_PREFIX + ";".join(f"{key}={value}" for key, value in metadata.items())
+
+
+def read_session_metadata(file_path):
+    # Returns the metadata written at the top of a session data file as a
+    # dictionary of strings (empty if the file doesn't have any).
+    with open(file_path, newline = '') as data_file:
+        first_line = data_file.readline().rstrip("\r\n")
+    if not first_line.startswith(METADATA_PREFIX):
+        return {}
+    metadata = {}
+    for pair in first_line[len(METADATA_PREFIX):].split(";"):
+        key, _, value = pair.partition("=")
+        metadata[key] = value
+    return metadata
+
+
+def format_offset_ns(offset_ns):
+    # Converts an integer number of nanoseconds into the "H:MM:SS.ffffff"
+    # text used in the Time and TrialTime columns of the .csv files.
+    return str(timedelta(microseconds = offset_ns // 1000))
+
+
+def parse_offset_ns(text):
+    # The reverse of format_offset_ns: converts the "H:MM:SS.ffffff" text of
+    # the Time and TrialTime columns back into an integer number of
+    # nanoseconds. It also accepts times without a fraction ("0:00:05") and
+    # with days ("1 day, 0:00:05.5"), both of which str(timedelta) can make.
+    days = 0
+    if "day" in text:
+        day_text, text = text.split(", ")
+        days = int(day_text.split(" ")[0])
+    hours, minutes, seconds = text.split(":")
+    whole_seconds, _, fraction = seconds.partition(".")
+    total_seconds = ((days * 24 + int(hours)) * 60 + int(minutes)) * 60 + int(whole_seconds)
+    return (total_seconds * 1000000 + int(fraction.ljust(6, "0") or 0)) * 1000
+
+
+def recover_session_csv(file_path):
+    # This function repairs a session .csv that was cut off mid-write (for
+    # example, if the chamber computer crashed or lost power during a
+    # session). Because rows are only ever appended to the end of the file,
+    # the only damage a crash can do is leave a partially written last row.
+    # That partial row is truncated away, leaving every complete row before
+    # it intact. It returns the number of complete data rows (not counting
+    # the header) left in the file.
+    with open(file_path, 'rb+') as data_file:
+        contents = data_file.read()
+        # Find the end of the last complete line; anything after it is a
+        # partial row that never finished being written
+        last_newline = contents.rfind(b"\n")
+        if last_newline + 1 != len(contents):
+            print(f"\nWARNING: Partial row found at the end of {os_path.basename(file_path)}; it has been removed.")
+            data_file.truncate(last_newline + 1)
+            contents = contents[:last_newline + 1]
+    # Subtract the header (and metadata line, if they exist)
+    lines = contents.split(b"\n")[:-1]
+    data_lines = [line for line in lines if not line.startswith(METADATA_PREFIX.encode())]
+    return max(len(data_lines) - 1, 0)
+
+
+class SessionClock(object):
+    # The SessionClock is the single source of time for a session. It uses
+    # the computer's monotonic, high-resolution performance counter (which
+    # never jumps backwards or forwards if the wall clock is adjusted), and
+    # measures everything as an integer number of nanoseconds since the 
+    # start of the session and since the start of the current trial. The 
+    # wall-clock time is only read once, at the start of the session, so 
+    # that the session can be anchored to a real date/time (see 
+    # session_metadata()).
+    # Any other function returning integer ns can be used as the clock
+    # instead (e.g., the virtual clock of a headless session; see
+    # headless_session.py).
+    def __init__(self, clock=perf_counter_ns):
+        self.clock = clock
+        self.start_session()
+
+    def start_session(self):
+        self.session_start_ns = self.clock()
+        self.session_start_time = datetime.now() # Wall-clock "anchor"
+        self.trial_start_ns = self.session_start_ns
+        return self.session_start_time
+
+    def start_trial(self):
+        self.trial_start_ns = self.clock()
+
+    def read(self):
+        # Reads the clock ONCE and returns both the session and trial time
+        # of "now" (in ns), so the two are always from the same instant.
+        now_ns = self.clock()
+        return now_ns - self.session_start_ns, now_ns - self.trial_start_ns
+
+    def wall_time(self, session_ns):
+        # Converts a session time (in ns) back into a wall-clock datetime
+        return self.session_start_time + timedelta(microseconds = session_ns // 1000)
+
+    def session_metadata(self):
+        return {"SessionStart": self.session_start_time.isoformat(),
+                "Clock": self.clock.__name__}
+
+
+# The onset metrics sidecar (written next to the session .csv, see
+# OnsetTimer) has one row per stage and measure, with its percentiles in ms.
+# Its name is the session file's, ending in ONSET_METRICS_SUFFIX instead.
+ONSET_METRICS_SUFFIX = "_onset-metrics.csv"
+ONSET_METRICS_HEADER = ["Stage", "Measure", "Count", "Median", "P90", "P99", "Max"]
+ONSET_MEASURES = ["CallbackLatency", "DrawTime", "OnsetLatency"]
+
+# The layout of every trial (where everything was placed, in grid units, and
+# the par it was given; see trial_generator.trial_layout_row()) is written 
+# once per trial to another sidecar file, ending in TRIAL_LAYOUTS_SUFFIX, so
+# that sessions can be re-scored later (see rescore_sessions.py).
+TRIAL_LAYOUTS_SUFFIX = "_layouts.csv"
+TRIAL_LAYOUTS_HEADER = ["TrialNum", "Pacman", "Banana", "Barriers", "Portals", "GreenDot",
+                        "Par", "IdealStrategy", "BananaDirection", "PortalDirection",
+                        "InsightTrialType"]
+# Sidecar files sit next to the session files (and share the start of their
+# names), but aren't session files themselves
+SIDECAR_SUFFIXES = (ONSET_METRICS_SUFFIX, TRIAL_LAYOUTS_SUFFIX)
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list (e.g., fraction = 0.9
+    # for the 90th percentile)
+    return sorted_values[max(ceil(fraction * len(sorted_values)), 1) - 1]
+
+
+class OnsetTimer(object):
+    # The OnsetTimer measures how long it takes each stage of a trial (e.g.,
+    # "set_up_trial" or "ITI") to actually get onto the screen. For every
+    # stage it keeps three times, all on the SessionClock:
+    #   - scheduled: when the stage was supposed to start (the time
+    #     root.after() was called plus its delay; see schedule())
+    #   - callback: when the stage's function actually started (start())
+    #   - drawn: when everything the stage drew was on the screen (drawn(),
+    #     called right after update_idletasks())
+    # From these, each stage gets a CallbackLatency (callback - scheduled), a
+    # DrawTime (drawn - callback), and an OnsetLatency (drawn - scheduled).
+    # Stages that are called directly (not through root.after()) are treated
+    # as scheduled for the moment they started.
+    def __init__(self, clock):
+        self.clock = clock
+        self.scheduled_ns = {} # Stage --> when it is scheduled to start
+        self.callback_ns = {} # Stage --> when it actually started
+        self.samples = {} # Stage --> list of [callback latency, draw time, onset latency]
+
+    def schedule(self, stage, delay):
+        # Called when a stage is scheduled to start in "delay" ms
+        self.scheduled_ns[stage] = self.clock.read()[0] + delay * 1000000
+
+    def start(self, stage):
+        now_ns = self.clock.read()[0]
+        self.callback_ns[stage] = now_ns
+        self.scheduled_ns.setdefault(stage, now_ns)
+
+    def drawn(self, stage):
+        # Records a stage as finished drawing and returns its measures (ns)
+        now_ns = self.clock.read()[0]
+        scheduled_ns = self.scheduled_ns.pop(stage)
+        callback_ns = self.callback_ns.pop(stage)
+        sample = [callback_ns - scheduled_ns, now_ns - callback_ns, now_ns - scheduled_ns]
+        self.samples.setdefault(stage, []).append(sample)
+        return sample
+
+    def summary(self):
+        # Returns the percentiles of every stage/measure as rows of the
+        # onset metrics sidecar (in ms)
+        summary_rows = []
+        for stage, samples in self.samples.items():
+            for index, measure in enumerate(ONSET_MEASURES):
+                values = sorted(sample[index] / 1000000 for sample in samples)
+                summary_rows.append([stage, measure, len(values)] +
+                                    [round(percentile(values, fraction), 3) for fraction in [0.5, 0.9, 0.99, 1]])
+        return summary_rows
+
+    def write_csv(self, file_path):
+        with open(file_path, 'w', newline = '') as metrics_file:
+            csv_writer = writer(metrics_file, quoting=QUOTE_MINIMAL)
+            csv_writer.writerow(ONSET_METRICS_HEADER)
+            csv_writer.writerows(self.summary())
+
+
+class SessionCSVWriter(object):
+    # The SessionCSVWriter is an append-only "sink" for the rows of a single
+    # session's data. Instead of re-writing the whole session every trial,
+    # the header is written once when the file is opened and each row is
+    # then written exactly once. Rows are collected and handed to the file in
+    # batches (every flush_every rows), and the file is forced onto the disk
+    # (fsync) at the end of each trial so that at most one trial of data
+    # can be lost in a crash.
+    def __init__(self, file_path, header=SESSION_DATA_HEADER, flush_every=25,
+                 metadata=None):
+        self.file_path = file_path
+        self.header = list(header)
+        self.metadata = metadata # Written above the header of a new file
+        self.flush_every = flush_every # Number of rows batched before they are written
+        self.pending_rows = [] # Rows waiting to be written in the next batch
+        self.rows_written = 0 # Number of data rows written (header not included)
+        self.data_file = None
+        self.csv_writer = None
+
+    def open(self):
+        # This opens the data file in append mode. If the file already exists
+        # (e.g., a session is being resumed), any partial row left over from
+        # a crash is first removed and writing continues after the last
+        # complete row. Otherwise, a new file is made and the header is
+        # written. Note that a FileNotFoundError is raised if the folder
+        # does not exist so that the caller can pick another location.
+        file_exists = os_path.isfile(self.file_path) and os_path.getsize(self.file_path) > 0
+        if file_exists:
+            self.rows_written = recover_session_csv(self.file_path)
+        self.data_file = open(self.file_path, 'a', newline = '')
+        self.csv_writer = writer(self.data_file, quoting=QUOTE_MINIMAL)
+        if not file_exists:
+            if self.metadata:
+                self.data_file.write(format_session_metadata(self.metadata) + "\r\n")
+            self.csv_writer.writerow(self.header)
+            self.flush(sync = True)
+        return self
+
+    def write_row(self, row):
+        # Adds a single row to the next batch. Once the batch is full, it is
+        # written to the file.
+        self.pending_rows.append(row)
+        if len(self.pending_rows) >= self.flush_every:
+            self.flush()
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.write_row(row)
+
+    def flush(self, sync=False):
+        # Writes any pending rows to the file. If sync is True (i.e., at the
+        # end of a trial), the operating system is also told to put the data
+        # onto the disk before moving on.
+        if self.data_file is None:
+            return
+        if self.pending_rows:
+            self.csv_writer.writerows(self.pending_rows)
+            self.rows_written += len(self.pending_rows)
+            self.pending_rows = []
+        self.data_file.flush()
+        if sync:
+            fsync(self.data_file.fileno())
+
+    def close(self):
+        if self.data_file is not None:
+            self.flush(sync = True)
+            self.data_file.close()
+            self.data_file = None
+
+
+class SessionEventBuffer(object):
+    # The SessionEventBuffer holds the most recent events of a session in a
+    # small, fixed-size set of typed columns instead of a growing list of
+    # Python lists (with a datetime/date object in every row). When the
+    # buffer is full, or whenever spill_to_disk() is called (e.g., at the end
+    # of each trial), the buffer is passed to the "spill" function (which
+    # writes its rows() or raw typed columns to the data files) and then
+    # emptied. This way the memory used by the session data stays the same
+    # no matter how long the session runs. If no spill function is given
+    # (e.g., data isn't being recorded), spilled rows are simply discarded.
+    def __init__(self, capacity=256, spill=None):
+        self.capacity = capacity # Max number of rows held in memory
+        self.spill = spill
+        self.columns = {}
+        for column in SESSION_DATA_HEADER:
+            self.columns[column] = array(SESSION_DATA_TYPECODES[column])
+        # Each interned column has a lookup of value --> code and a list of
+        # values (where the index is the code) to turn codes back into strings
+        self.codes = {}
+        self.values = {}
+        for column in INTERNED_COLUMNS:
+            self.codes[column] = {}
+            self.values[column] = []
+        self.total_events = 0 # Number of events appended over the session
+
+    def __len__(self):
+        return len(self.columns["Time"])
+
+    def intern(self, column, value):
+        # Returns the small-integer code for a string value in an interned
+        # column, adding it to the lookup the first time it is seen.
+        try:
+            return self.codes[column][value]
+        except KeyError:
+            code = len(self.values[column])
+            self.codes[column][value] = code
+            self.values[column].append(value)
+            return code
+
+    def append(self, row):
+        # Adds one event row (in SESSION_DATA_HEADER order) to the buffer,
+        # then spills the buffer if it has reached capacity. Time and
+        # TrialTime should be integer nanoseconds and Date a date object.
+        for column, value in zip(SESSION_DATA_HEADER, row):
+            if column in INTERNED_COLUMNS:
+                value = self.intern(column, value)
+            elif column == "Date":
+                value = value.toordinal()
+            elif column == "InsightTrialType":
+                value = float("nan") if value is None else float(value)
+            elif value is None or value == "NA":
+                value = NA_INT
+            self.columns[column].append(value)
+        self.total_events += 1
+        if len(self) >= self.capacity:
+            self.spill_to_disk()
+
+    def rows(self):
+        # Yields each buffered event as a row of .csv-ready values, in the
+        # same format the data files have always used (e.g., times as
+        # "H:MM:SS.ffffff" strings).
+        columns = [self.columns[column] for column in SESSION_DATA_HEADER]
+        for values in zip(*columns):
+            row = []
+            for column, value in zip(SESSION_DATA_HEADER, values):
+                if column in INTERNED_COLUMNS:
+                    value = self.values[column][value]
+                elif column in ["Time", "TrialTime"]:
+                    value = format_offset_ns(value)
+                elif column == "Date":
+                    value = date.fromordinal(value)
+                elif column == "InsightTrialType":
+                    value = None if isnan(value) else value
+                elif value == NA_INT:
+                    value = "NA" if column in NA_AS_TEXT_COLUMNS else None
+                row.append(value)
+            yield row
+
+    def clear(self):
+        for column in SESSION_DATA_HEADER:
+            del self.columns[column][:]
+
+    def spill_to_disk(self):
+        # Hands the buffered rows to the spill function and empties the
+        # buffer.
+        if len(self) and self.spill is not None:
+            self.spill(self)
+        self.clear()
+
+
+class BackgroundEventLogger(object):
+    # The BackgroundEventLogger moves all of the "slow" parts of recording an
+    # event (formatting the row, echoing it to the console, and writing it to
+    # the disk) off of the tkinter main thread and onto a separate writer
+    # thread. The main thread only has to capture the raw values of an event
+    # and drop them in a queue, so canvas callbacks don't wait on I/O (unless
+    # the writer thread falls far behind, or the data are being flushed).
+    #   - handle_event is called (on the writer thread) with each raw event
+    #     passed to log(), in the order they were logged.
+    #   - handle_flush is called (on the writer thread) with the value passed
+    #     to flush(), after every event logged before it has been handled.
+    # Logging an event normally only waits for the queue itself. If the queue
+    # ever fills up (max_queued events waiting), log() waits for the writer
+    # thread to make room rather than losing the event; these waits are
+    # counted in events_waited. Events are only ever lost if they are logged
+    # after close() or if handle_event raises an error, and these are counted
+    # in events_dropped. flush() and close() always wait for their turn in
+    # the queue (and close() for the writer thread to finish).
+    # The counters are shared by both threads, so they are only changed
+    # while holding counter_lock.
+    def __init__(self, handle_event, handle_flush, max_queued=10000):
+        self.handle_event = handle_event
+        self.handle_flush = handle_flush
+        self.event_queue = Queue(maxsize = max_queued)
+        self.counter_lock = Lock()
+        self.events_queued = 0 # Number of events put in the queue
+        self.events_waited = 0 # Number of events that had to wait for room
+        self.events_dropped = 0 # Number of events lost (logged late or error)
+        self.closed = False
+        self.writer_thread = Thread(target = self.run,
+                                    name = "BackgroundEventLogger",
+                                    daemon = True)
+        self.writer_thread.start()
+
+    def count(self, counter):
+        # Adds one to one of the counters (from either thread)
+        with self.counter_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def log(self, *raw_event):
+        if self.closed:
+            self.count("events_dropped")
+            return
+        try:
+            self.event_queue.put_nowait((False, raw_event))
+        except Full:
+            # The writer thread has fallen behind, so we wait for it
+            self.count("events_waited")
+            self.event_queue.put((False, raw_event))
+        self.count("events_queued")
+
+    def flush(self, flush_argument=None):
+        if not self.closed:
+            self.event_queue.put((True, flush_argument))
+
+    def events_waiting(self):
+        # The number of events that have been logged but not yet written
+        return self.event_queue.qsize()
+
+    def close(self, flush_argument=None):
+        # This drains the queue: every event logged so far is handled, the
+        # final flush is performed, and the writer thread is stopped. It
+        # blocks until all of that is finished (so it should only be called
+        # when the session is over).
+        if self.closed:
+            return
+        self.flush(flush_argument)
+        self.closed = True
+        self.event_queue.put(None) # Tells the writer thread to stop
+        self.writer_thread.join()
+
+    def run(self):
+        # This is the loop run by the writer thread
+        while True:
+            queued_item = self.event_queue.get()
+            if queued_item is None:
+                break
+            is_flush, value = queued_item
+            try:
+                if is_flush:
+                    self.handle_flush(value)
+                else:
+                    self.handle_event(*value)
+            except Exception as error:
+                # An error should never silently kill the writer thread, or
+                # every event after it would be lost
+                print(f"\nERROR: Event could not be written ({error!r})")
+                if not is_flush:
+                    self.count("events_dropped")
+
+
+def npy_header(dtype, length):
+    # Builds the header of a version 1.0 .npy file holding a one-dimensional
+    # array of "length" values. The header is always padded out to 
+    # NPY_HEADER_SIZE bytes, so that it can be re-written in place as the
+    # length of the column grows.
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (
+        NPY_BYTE_ORDER + dtype, length)
+    header = header.ljust(NPY_HEADER_SIZE - 11) + "\n"
+    return b"\x93NUMPY\x01\x00" + pack("<H", len(header)) + header.encode("latin1")
+
+
+class SessionColumnWriter(object):
+    # The SessionColumnWriter is the binary counterpart of SessionCSVWriter.
+    # It writes the same 16 columns, but into a folder of .npy files (one per
+    # column; see SESSION_COLUMN_DTYPES) instead of a single .csv. Columns
+    # are appended to straight from the typed arrays of a 
+    # SessionEventBuffer, so nothing is ever turned into text. The .npy 
+    # headers and the schema.json file are brought up to date every time
+    # the files are synced (i.e., at the end of each trial), so the folder is
+    # always loadable up to the last completed trial.
+    def __init__(self, directory, metadata=None):
+        self.directory = directory
+        self.metadata = metadata or {}
+        self.column_files = {}
+        self.rows_written = 0
+        self.dictionaries = {} # Values of each interned column (index = code)
+
+    def open(self):
+        if not os_path.isdir(self.directory):
+            mkdir(self.directory)
+        for column in SESSION_DATA_HEADER:
+            column_file = open(os_path.join(self.directory, column + ".npy"), 'wb')
+            column_file.write(npy_header(SESSION_COLUMN_DTYPES[column], 0))
+            self.column_files[column] = column_file
+        return self
+
+    def write_columns(self, columns):
+        # Appends the values of each column (typed arrays, in the format 
+        # held by SessionEventBuffer) to the end of each column file.
+        for column in SESSION_DATA_HEADER:
+            values = columns[column]
+            if column == "Date": # Ordinal --> days since 1970-01-01
+                values = array("q", [ordinal - EPOCH_ORDINAL for ordinal in values])
+            values.tofile(self.column_files[column])
+        self.rows_written += len(columns["Time"])
+
+    def write_schema(self):
+        schema = {"rows": self.rows_written,
+                  "metadata": self.metadata,
+                  "columns": []}
+        for column in SESSION_DATA_HEADER:
+            column_schema = {"name": column,
+                             "file": column + ".npy",
+                             "dtype": NPY_BYTE_ORDER + SESSION_COLUMN_DTYPES[column]}
+            if column in INTERNED_COLUMNS:
+                column_schema["dictionary"] = list(self.dictionaries.get(column, []))
+            elif SESSION_DATA_TYPECODES[column] == "i":
+                column_schema["missing"] = NA_INT
+            elif column == "InsightTrialType":
+                column_schema["missing"] = "NaN"
+            schema["columns"].append(column_schema)
+        # The schema is written to a temporary file first and then swapped 
+        # in, so a crash can never leave a half-written schema behind
+        schema_path = os_path.join(self.directory, "schema.json")
+        with open(schema_path + ".tmp", 'w') as schema_file:
+            json_dump(schema, schema_file, indent = 1)
+        replace(schema_path + ".tmp", schema_path)
+
+    def flush(self, sync=False, dictionaries=None):
+        # Writes any buffered bytes to the column files. If sync is True (at
+        # the end of a trial), the .npy headers and schema are also updated
+        # and everything is forced onto the disk. The dictionaries of the
+        # interned columns (SessionEventBuffer.values) should be passed in
+        # so that the schema can decode them.
+        if not self.column_files:
+            return
+        if dictionaries is not None:
+            self.dictionaries = dictionaries
+        for column, column_file in self.column_files.items():
+            if sync: # Bring the header up to date with the new length
+                column_file.seek(0)
+                column_file.write(npy_header(SESSION_COLUMN_DTYPES[column], self.rows_written))
+                column_file.seek(0, 2)
+            column_file.flush()
+            if sync:
+                fsync(column_file.fileno())
+        if sync:
+            self.write_schema()
+
+    def close(self, dictionaries=None):
+        if self.column_files:
+            self.flush(sync = True, dictionaries = dictionaries)
+            for column_file in self.column_files.values():
+                column_file.close()
+            self.column_files = {}
+
+
+def load_session_columns(directory, decode=False):
+    # Loads a binary session folder written by SessionColumnWriter and 
+    # returns a dictionary of column name --> NumPy array. The arrays are
+    # memory-mapped, so nothing is read from the disk until it is used. If
+    # decode is True, the interned columns (e.g., EventType) are returned as
+    # arrays of strings instead of integer codes. Requires NumPy.
+    if numpy is None:
+        raise ModuleNotFoundError("NumPy is required to load binary session data")
+    with open(os_path.join(directory, "schema.json")) as schema_file:
+        schema = json_load(schema_file)
+    columns = {}
+    for column_schema in schema["columns"]:
+        values = numpy.load(os_path.join(directory, column_schema["file"]),
+                            mmap_mode = 'r')[:schema["rows"]]
+        if decode and "dictionary" in column_schema:
+            values = numpy.asarray(column_schema["dictionary"], dtype = object)[values]
+        columns[column_schema["name"]] = values
+    return columns
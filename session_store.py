@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Session data store for the P032a insight task.
+
+This is a companion tool to the experimental program. Every session writes
+its own .csv (data/<subject>/P032a_data_*.csv), and over the course of the
+experiment there are thousands of them. Rather than re-reading every file
+for every analysis, this tool ingests the session files into a single SQLite
+database, indexed by subject, training phase, date, and trial number.
+
+Only new or changed files are read each time it is run: the modification
+time and size of every file are recorded (along with a hash of its
+contents), so re-running it over an unchanged data folder is nearly
+instant. Files that were only moved or renamed are recognized by their hash
+and are not read again. Files that have been deleted are removed from the
+store, and copies of a file already in the store (e.g., a backup of a
+subject's folder inside the data folder) are recorded without storing their
+rows a second time, so every session appears in the store only once.
+
+Example usage (from the same folder as this script):
+    python session_store.py data/
+    python session_store.py data/ --store P032a_sessions.sqlite --export-csv combined.csv
+
+The exported .csv has the same columns as the session files (plus the name
+of the session file each row came from), so it can be read into R just like
+the original combined data.
+"""
+from argparse import ArgumentParser
+from csv import reader, writer, QUOTE_MINIMAL
+from glob import glob
+from hashlib import sha1
+from os import stat, path as os_path
+import sqlite3
+
+from session_data import SESSION_DATA_HEADER, METADATA_PREFIX, SIDECAR_SUFFIXES, \
+    format_offset_ns, parse_offset_ns, read_session_metadata
+
+DEFAULT_STORE_NAME = "P032a_sessions.sqlite"
+SESSION_FILE_PATTERN = "P032a_data_*.csv"
+
+# Each column of the session data and the type it is stored as in the
+# database. Times are stored as integer nanoseconds (see parse_offset_ns),
+# so they can be compared and subtracted without any text parsing.
+STORE_COLUMN_TYPES = {"Time": "INTEGER",
+                      "EventType": "TEXT",
+                      "Xcord": "INTEGER",
+                      "Ycord": "INTEGER",
+                      "TransformedXcord": "INTEGER",
+                      "TransformedYcord": "INTEGER",
+                      "PacmanXcord": "INTEGER",
+                      "PacmanYcord": "INTEGER",
+                      "TrialNum": "INTEGER",
+                      "MoveCounter": "INTEGER",
+                      "TrialPar": "INTEGER",
+                      "TrialTime": "INTEGER",
+                      "Subject": "TEXT",
+                      "TrainingPhase": "TEXT",
+                      "Date": "TEXT",
+                      "InsightTrialType": "REAL"}
+
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS session_files (
+    file_id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE,
+    mtime_ns INTEGER,
+    size INTEGER,
+    content_hash TEXT,
+    session_start TEXT,
+    rows INTEGER
+);
+CREATE INDEX IF NOT EXISTS session_files_hash ON session_files (content_hash);
+CREATE TABLE IF NOT EXISTS events (
+    file_id INTEGER REFERENCES session_files (file_id),
+    %s
+);
+CREATE INDEX IF NOT EXISTS events_lookup ON events (Subject, TrainingPhase, Date, TrialNum);
+CREATE INDEX IF NOT EXISTS events_file ON events (file_id);
+""" % ",\n    ".join(f"{column} {STORE_COLUMN_TYPES[column]}" for column in SESSION_DATA_HEADER)
+
+
+def open_store(store_path):
+    connection = sqlite3.connect(store_path)
+    connection.executescript(STORE_SCHEMA)
+    return connection
+
+
+def hash_file(file_path):
+    file_hash = sha1()
+    with open(file_path, 'rb') as data_file:
+        for block in iter(lambda: data_file.read(1 << 20), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def convert_value(column, text):
+    # Converts a single .csv cell into the value stored in the database.
+    # Missing values ("NA" or empty cells) are stored as NULL.
+    if text in ("", "NA", "None"):
+        return None
+    column_type = STORE_COLUMN_TYPES[column]
+    if column in ["Time", "TrialTime"]:
+        return parse_offset_ns(text)
+    elif column_type == "INTEGER":
+        return int(float(text))
+    elif column_type == "REAL":
+        return float(text)
+    return text
+
+
+def read_session_file(file_path):
+    # Reads a session .csv and returns its metadata (the "# key=value" line
+    # at the top of newer files, if any) and a list of converted rows. The
+    # column header must match SESSION_DATA_HEADER exactly. Rows with the
+    # wrong number of cells (e.g., a row cut off by a crash) are skipped.
+    metadata = read_session_metadata(file_path)
+    rows = []
+    with open(file_path, newline = '') as data_file:
+        csv_reader = reader(data_file)
+        header = None
+        for line in csv_reader:
+            if header is None:
+                if line and line[0].startswith(METADATA_PREFIX):
+                    continue
+                header = line
+                if header != SESSION_DATA_HEADER:
+                    raise ValueError(f"{file_path} does not have the session data header")
+                continue
+            if len(line) != len(SESSION_DATA_HEADER):
+                print(f"WARNING: Skipped an incomplete row in {os_path.basename(file_path)}")
+                continue
+            rows.append([convert_value(column, text) for column, text in zip(SESSION_DATA_HEADER, line)])
+    return metadata, rows
+
+
+def ingest_file(connection, file_path, file_stat, content_hash, file_id=None):
+    # (Re-)reads a single session file into the store. Any rows already in
+    # the store from an older version of the file are replaced.
+    metadata, rows = read_session_file(file_path)
+    if file_id is None:
+        cursor = connection.execute(
+            "INSERT INTO session_files (path, mtime_ns, size, content_hash, session_start, rows) VALUES (?, ?, ?, ?, ?, ?)",
+            (file_path, file_stat.st_mtime_ns, file_stat.st_size, content_hash, metadata.get("SessionStart"), len(rows)))
+        file_id = cursor.lastrowid
+    else:
+        connection.execute("DELETE FROM events WHERE file_id = ?", (file_id,))
+        connection.execute(
+            "UPDATE session_files SET mtime_ns = ?, size = ?, content_hash = ?, session_start = ?, rows = ? WHERE file_id = ?",
+            (file_stat.st_mtime_ns, file_stat.st_size, content_hash, metadata.get("SessionStart"), len(rows), file_id))
+    connection.executemany(
+        "INSERT INTO events (file_id, %s) VALUES (?%s)" % (", ".join(SESSION_DATA_HEADER), ", ?" * len(SESSION_DATA_HEADER)),
+        ([file_id] + row for row in rows))
+    return len(rows)
+
+
+def update_store(data_folder, store_path):
+    # This is the main function of the tool. It looks through the data folder
+    # (and any subject folders within it) for session files and ingests any
+    # that are new or have changed since the last time it was run. Files in
+    # the store that no longer exist are removed from it (along with their
+    # rows). It returns a dictionary counting what happened to each file.
+    # Every session's rows are only stored once: a file with the same
+    # contents as another file already in the store (e.g., a backup copy in
+    # another folder) is recorded as a copy, with its rows left as NULL and
+    # no events of its own. If the file holding the events is later deleted,
+    # one of its copies takes its place (and its events).
+    connection = open_store(store_path)
+    known_files = {}
+    for file_id, file_path, mtime_ns, size, content_hash in connection.execute(
+            "SELECT file_id, path, mtime_ns, size, content_hash FROM session_files"):
+        known_files[file_path] = (file_id, mtime_ns, size, content_hash)
+    counts = {"unchanged": 0, "moved": 0, "new": 0, "updated": 0, "copies": 0, "removed": 0, "skipped": 0, "rows": 0}
+    file_paths = sorted(set(glob(os_path.join(data_folder, SESSION_FILE_PATTERN)) +
+                            glob(os_path.join(data_folder, "*", SESSION_FILE_PATTERN))))
+    # The sidecar files next to each session file (its onset metrics and
+    # trial layouts) match the pattern too, but aren't session data
+    file_paths = [os_path.abspath(file_path) for file_path in file_paths
+                  if not file_path.endswith(SIDECAR_SUFFIXES)]
+    found_paths = set(file_paths)
+    for file_path in file_paths:
+        file_stat = stat(file_path)
+        known = known_files.get(file_path)
+        # The quickest check: the same file with the same time and size
+        if known is not None and known[1:3] == (file_stat.st_mtime_ns, file_stat.st_size):
+            counts["unchanged"] += 1
+            continue
+        content_hash = hash_file(file_path)
+        if known is not None and known[3] == content_hash: # Touched, but the same
+            connection.execute("UPDATE session_files SET mtime_ns = ? WHERE file_id = ?",
+                               (file_stat.st_mtime_ns, known[0]))
+            counts["unchanged"] += 1
+            continue
+        if known is None:
+            # A file we have already read might have been moved/renamed (its
+            # old path is gone) or copied (its old path is still there)
+            holder = connection.execute(
+                "SELECT file_id, path FROM session_files WHERE content_hash = ? AND rows IS NOT NULL",
+                (content_hash,)).fetchone()
+            if holder is not None:
+                if holder[1] not in found_paths and not os_path.exists(holder[1]):
+                    connection.execute("UPDATE session_files SET path = ?, mtime_ns = ?, size = ? WHERE file_id = ?",
+                                       (file_path, file_stat.st_mtime_ns, file_stat.st_size, holder[0]))
+                    counts["moved"] += 1
+                else:
+                    connection.execute(
+                        "INSERT INTO session_files (path, mtime_ns, size, content_hash, session_start, rows) "
+                        "SELECT ?, ?, ?, content_hash, session_start, NULL FROM session_files WHERE file_id = ?",
+                        (file_path, file_stat.st_mtime_ns, file_stat.st_size, holder[0]))
+                    counts["copies"] += 1
+                continue
+        try:
+            with connection: # Each file is its own transaction
+                counts["rows"] += ingest_file(connection, file_path, file_stat, content_hash,
+                                              None if known is None else known[0])
+        except ValueError as error:
+            # Any other .csv that happens to match the pattern (e.g., a 
+            # sidecar file whose suffix isn't in SIDECAR_SUFFIXES) is left
+            # out rather than stopping the whole update
+            print(f"WARNING: Skipped {os_path.basename(file_path)} ({error})")
+            counts["skipped"] += 1
+            continue
+        counts["updated" if known is not None else "new"] += 1
+    # Files that have been deleted (and weren't found again above as moved)
+    # are removed from the store. If one held the events of a session that
+    # still has a copy, the copy takes over the file's entry instead.
+    for file_id, file_path, content_hash, rows in connection.execute(
+            "SELECT file_id, path, content_hash, rows FROM session_files").fetchall():
+        if file_path in found_paths or os_path.exists(file_path):
+            continue
+        with connection:
+            copies = [] if rows is None else [copy for copy in connection.execute(
+                "SELECT file_id, path, mtime_ns, size FROM session_files WHERE content_hash = ? AND rows IS NULL",
+                (content_hash,)) if copy[1] in found_paths or os_path.exists(copy[1])]
+            if copies:
+                copy = copies[0]
+                connection.execute("DELETE FROM session_files WHERE file_id = ?", (copy[0],))
+                connection.execute("UPDATE session_files SET path = ?, mtime_ns = ?, size = ? WHERE file_id = ?",
+                                   (copy[1], copy[2], copy[3], file_id))
+            else:
+                connection.execute("DELETE FROM events WHERE file_id = ?", (file_id,))
+                connection.execute("DELETE FROM session_files WHERE file_id = ?", (file_id,))
+        counts["removed"] += 1
+    # A copy whose session's events are no longer in the store (because the
+    # file holding them was changed or removed) is read in its own right
+    for file_id, file_path, content_hash in connection.execute(
+            "SELECT file_id, path, content_hash FROM session_files WHERE rows IS NULL").fetchall():
+        if connection.execute("SELECT 1 FROM session_files WHERE content_hash = ? AND rows IS NOT NULL",
+                              (content_hash,)).fetchone() is not None:
+            continue
+        with connection:
+            counts["rows"] += ingest_file(connection, file_path, stat(file_path), content_hash, file_id)
+        counts["updated"] += 1
+    connection.commit()
+    connection.close()
+    return counts
+
+
+def export_csv(store_path, csv_path):
+    # Writes every row in the store into a single combined .csv, in the same
+    # format as the session files (times as "H:MM:SS.ffffff" text), with an
+    # extra SessionFile column naming the file each row came from.
+    connection = open_store(store_path)
+    query = "SELECT session_files.path, %s FROM events JOIN session_files USING (file_id) ORDER BY events.rowid" % (
+        ", ".join("events." + column for column in SESSION_DATA_HEADER))
+    with open(csv_path, 'w', newline = '') as combined_file:
+        csv_writer = writer(combined_file, quoting = QUOTE_MINIMAL)
+        csv_writer.writerow(SESSION_DATA_HEADER + ["SessionFile"])
+        for row in connection.execute(query):
+            values = list(row[1:])
+            for column in ["Time", "TrialTime"]:
+                index = SESSION_DATA_HEADER.index(column)
+                if values[index] is not None:
+                    values[index] = format_offset_ns(values[index])
+            for column in ["Xcord", "Ycord", "TransformedXcord", "TransformedYcord"]:
+                index = SESSION_DATA_HEADER.index(column)
+                if values[index] is None:
+                    values[index] = "NA"
+            csv_writer.writerow(values + [os_path.basename(row[0])])
+    connection.close()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description = "Ingest P032a session .csv files into an indexed SQLite store.")
+    parser.add_argument("data_folder", help = "Folder holding the session files (or subject folders of them)")
+    parser.add_argument("--store", default = None,
+                        help = f"Path of the SQLite store (default: {DEFAULT_STORE_NAME} in the data folder)")
+    parser.add_argument("--export-csv", default = None,
+                        help = "Also write every row in the store to this combined .csv")
+    arguments = parser.parse_args()
+    store_path = arguments.store or os_path.join(arguments.data_folder, DEFAULT_STORE_NAME)
+    counts = update_store(arguments.data_folder, store_path)
+    print(f"{counts['new']} new, {counts['updated']} updated, {counts['moved']} moved, "
+          f"{counts['copies']} copied, {counts['removed']} removed, {counts['skipped']} skipped, "
+          f"{counts['unchanged']} unchanged session files ({counts['rows']} rows ingested)")
+    if arguments.export_csv:
+        export_csv(store_path, arguments.export_csv)
+        print(f"Combined data written to {arguments.export_csv}")
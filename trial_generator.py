@@ -0,0 +1,534 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Trial generation for the P032a insight task.
+
+This file decides the layout of every trial: where the pacman, banana,
+barriers, portals, and green dot are placed (in grid units), along with the
+trial's par. It has no tkinter code in it, so trials can be generated and
+checked without opening a window (e.g., to look over a whole session's
+worth of trials before running it). The experimental program asks a
+TrialGenerator for each trial and then just draws what it is given.
+
+Grid locations are [x, y] lists, the same as the experimental program and
+pathfinder.py: x is the column (0 = leftmost) and y is the row (0 = top) of
+the active arena, and portals sit just outside of it.
+
+Every session has its own seed (recorded in its data file as "SessionSeed"),
+and its trials are laid out by a TrialGenerator given session_rngs(seed)[0],
+so the trials of any recorded session can be generated again exactly (see
+replay_session.py).
+
+Example usage:
+    from random import Random
+    generator = TrialGenerator("5 TEST", Random(32))
+    for trial in generator.generate(1000):
+        print(trial.pacman, trial.banana, trial.barriers, trial.par)
+"""
+from collections import namedtuple
+from csv import reader
+from random import Random, SystemRandom
+
+from pathfinder import ParCache
+from session_data import METADATA_PREFIX, TRIAL_LAYOUTS_HEADER
+
+# These are the phases the generator knows about (see the description at
+# the top of the experimental program for what each of them is)
+TRAINING_PHASES = ["1.a", "1.b", "2.a", "2.b", "3.a", "3.b", "3.b TEST",
+                   "3.c", "3.d", "3.d TEST", "4.a", "4.a TEST", "4.b",
+                   "5.a", "5.b", "5.c", "5.d", "5 TEST",
+                   "6.a", "6.b", "6.c", "6", "7 TEST"]
+# The phases offered by the experimental program's control panel, with their
+# descriptions (the phase itself is the part before the colon)
+TRAINING_PHASE_NAMES = ["1.a: Fixed pacman position",
+                        "1.b: Variable pacman position",
+                        "2.a: Single cursor",
+                        "2.b: Multiple cursors",
+                        "3.a: Single cursor, one move",
+                        "3.b: Multiple cursors, one move",
+                        "3.b TEST",
+                        "3.c: Single cursor, two moves",
+                        "3.d: Multiple cursors, two moves",
+                        "3.d TEST",
+                        "4.a: Diagnal",
+                        "4.a TEST",
+                        "4.b: Random locations",
+                        "5.a: Left single barrier",
+                        "5.b: Right single barrier",
+                        "5.c: Left double barrier",
+                        "5.d: Right double barrier",
+                        "5 TEST",
+                        # "6.a: Portal training, one move",
+                        # "6.b: Portal training, multiple moves",
+                        # "6.c: Portal training, barrier (OPTIONAL)",
+                        "6: Portal, green dot",
+                        "7 TEST: Insight"
+                        ]
+# Phases without a banana goal (and so without a par)
+NO_BANANA_PHASES = ["1.a", "1.b", "2.a", "2.b", "6.a", "6.b", "6.c", "6"]
+# Phases with portals
+PORTAL_PHASES = ["6.a", "6.b", "6.c", "6", "7 TEST"]
+
+# The grid steps (x, y) of the banana from the pacman in each direction
+# (north is up the screen, i.e. a smaller y)
+DIRECTION_STEPS = {"north": (0, -1), "east": (1, 0), "south": (0, 1), "west": (-1, 0),
+                   "northeast": (1, -1), "southeast": (1, 1),
+                   "southwest": (-1, 1), "northwest": (-1, -1)}
+# The grid step (x, y) of the pacman for each cursor tag (and so for each
+# cursor's EventType in the session data)
+CURSOR_STEPS = {"north_oval_pacman": (0, -1),
+                "east_oval_pacman": (1, 0),
+                "south_oval_pacman": (0, 1),
+                "west_oval_pacman": (-1, 0)}
+
+# The geometry of the experimental program's arena (see MainScreen) in
+# pixels, which turns grid locations into the peck and pacman coordinates
+# of the session data
+SCREEN_WIDTH, SCREEN_HEIGHT = 800, 600
+LEFT, RIGHT, BOTTOM, TOP = 65, 65, 60, 225 # The depths of the borders
+MOVE_DISTANCE, PACMAN_SIZE, GAP = 120, 60, 8
+CURSOR_DISTANCE = 53 # From the center of the pacman to the center of a cursor
+
+# A list of all the objects in "preset" insight levels (7 TEST)
+INSIGHT_TRIAL_LAYOUTS = [{"Trial Type": 7.1,
+                          "Pacman Grid Location":[0,2],
+                          "Banana Grid Location": [5,0],
+                          "Barrier Grid Matrix":[[1,2],[4,0],[4,1], [4,2]],
+                          "Portal Grid Matrix":[[2,3],[6,1]]},
+                         {"Trial Type": 7.2,
+                          "Pacman Grid Location":[5,0],
+                          "Banana Grid Location": [0,2],
+                          "Barrier Grid Matrix":[[1,2], [3,0],[3,1],[3,2]],
+                          "Portal Grid Matrix":[[2,3],[6,2]]},
+                         {"Trial Type": 7.3,
+                          "Pacman Grid Location":[2,2],
+                          "Banana Grid Location": [5,0],
+                          "Barrier Grid Matrix":[[1,2], [4,0],[4,1],[4,2]],
+                          "Portal Grid Matrix":[[0,3],[6,1]]},
+                         {"Trial Type": 7.4,
+                          "Pacman Grid Location":[5,0],
+                          "Banana Grid Location": [2,2],
+                          "Barrier Grid Matrix":[[1,2], [3,0],[3,1],[3,2]],
+                          "Portal Grid Matrix":[[0,3],[6,2]]},
+                         {"Trial Type": 7.5,
+                          "Pacman Grid Location":[2,1],
+                          "Banana Grid Location": [5,2],
+                          "Barrier Grid Matrix":[[1,2],[3,1],[3,2]],
+                          "Portal Grid Matrix":[[0,3],[-1,0]]}
+                         ]
+
+# Everything about a single trial:
+#   trial_number       - trial number within the session (starts at 1)
+#   pacman, banana     - grid locations (banana is None if there isn't one)
+#   barriers           - list of barrier grid locations
+#   portals            - the two portal grid locations, or None
+#   green_dot          - grid location of the green dot (phase 6), or None
+#   par                - minimum moves from pacman to banana, or None
+#   ideal_strategy     - "portal" or "nonportal" (see pathfinder.py)
+#   path               - one shortest path from pacman to banana, or None
+#   banana_direction   - direction of the banana from the pacman (phases 3
+#                        and 4.a), e.g. "north" or "southwest", or None
+#   portal_direction   - direction of the first portal from the pacman
+#                        (phases 6.a and 6), or None
+#   insight_trial_type - the preset layout's "Trial Type" (7 TEST), or None
+TrialSpec = namedtuple("TrialSpec",
+                       ["trial_number", "pacman", "banana", "barriers", "portals",
+                        "green_dot", "par", "ideal_strategy", "path",
+                        "banana_direction", "portal_direction", "insight_trial_type"])
+
+
+def format_grid_locations(locations):
+    # Converts a list of grid locations into text (e.g., for a .csv): each
+    # location as "x:y", separated by spaces (e.g., "2:0 2:1"). None (e.g.,
+    # no portals) is "NA".
+    if locations is None:
+        return "NA"
+    return " ".join(f"{x}:{y}" for x, y in locations)
+
+
+def parse_grid_locations(text):
+    # The reverse of format_grid_locations()
+    if text in ("NA", None):
+        return None
+    return [[int(value) for value in location.split(":")] for location in text.split()]
+
+
+def trial_layout_row(trial):
+    # Returns the row of a TrialSpec in a trial layouts file (see
+    # TRIAL_LAYOUTS_HEADER in session_data.py). The path isn't written, as
+    # it can always be found again from the layout.
+    return [trial.trial_number,
+            format_grid_locations([trial.pacman]),
+            format_grid_locations(None if trial.banana is None else [trial.banana]),
+            format_grid_locations(trial.barriers),
+            format_grid_locations(trial.portals),
+            format_grid_locations(None if trial.green_dot is None else [trial.green_dot]),
+            "NA" if trial.par is None else trial.par,
+            trial.ideal_strategy or "NA",
+            trial.banana_direction or "NA",
+            trial.portal_direction or "NA",
+            "NA" if trial.insight_trial_type is None else trial.insight_trial_type]
+
+
+def read_trial_layouts(file_path):
+    # Reads a trial layouts file, returning a dictionary of trial number -->
+    # TrialSpec (with no path). Rows cut off by a crash are skipped.
+    layouts = {}
+    with open(file_path, newline = '') as layouts_file:
+        for line in reader(layouts_file):
+            if not line or line[0].startswith(METADATA_PREFIX) or line == TRIAL_LAYOUTS_HEADER:
+                continue
+            if len(line) != len(TRIAL_LAYOUTS_HEADER):
+                continue
+            trial_number, pacman, banana, barriers, portals, green_dot, par, ideal_strategy, \
+                banana_direction, portal_direction, insight_trial_type = [None if value == "NA" else value
+                                                                          for value in line]
+            single_locations = [parse_grid_locations(text) for text in [pacman, banana, green_dot]]
+            pacman, banana, green_dot = [None if locations is None else locations[0]
+                                         for locations in single_locations]
+            layouts[int(trial_number)] = TrialSpec(int(trial_number), pacman, banana,
+                                                   parse_grid_locations(barriers),
+                                                   parse_grid_locations(portals), green_dot,
+                                                   None if par is None else int(par), ideal_strategy,
+                                                   None, banana_direction, portal_direction,
+                                                   None if insight_trial_type is None else float(insight_trial_type))
+    return layouts
+
+
+def new_session_seed():
+    # Returns a new (unpredictable) seed for a session
+    return SystemRandom().getrandbits(32)
+
+
+def session_rngs(seed):
+    # Returns the two random.Randoms of a session with this seed: the first
+    # lays out the trials (it is given to the TrialGenerator), and the second
+    # makes any choices during the trials (the cursor shown in 2.a). They
+    # are separate streams so that the trial layouts never depend on how 
+    # many choices were made during the trials, or vice versa.
+    return Random(seed), Random(f"{seed}:cursors")
+
+
+class TrialGenerator(object):
+    # Generates the trials of a single training phase. All randomness comes
+    # from the rng passed to it (a random.Random), so two generators given
+    # the same phase and the same seed produce the same trials. The columns
+    # and rows are the size of the active arena (horizontal_moves_in_arena +
+    # 1 and vertical_moves_in_arena + 1 in the experimental program).
+    def __init__(self, training_phase, rng=None, columns=6, rows=3):
+        if training_phase not in TRAINING_PHASES:
+            raise ValueError(f"Unknown training phase: {training_phase}")
+        self.training_phase = training_phase
+        self.rng = rng if rng is not None else Random()
+        self.columns = columns
+        self.rows = rows
+        # The last grid location along each axis (i.e., the number of
+        # horizontal/vertical moves possible in the arena)
+        self.max_x = columns - 1
+        self.max_y = rows - 1
+        self.trial_number = 0 # Number of the last trial generated
+        self.par_cache = ParCache(columns, rows)
+        # The preset insight layouts are shown in order for the first two
+        # rounds, then randomly (see place_barriers())
+        self.insight_trial_layouts = list(INSIGHT_TRIAL_LAYOUTS)
+        # Rather than placing things randomly and trying again until they
+        # fit, every valid banana/portal placement for this phase and arena
+        # is listed up front, and one is chosen from the list directly. If a
+        # list is ever empty, choose_from() raises an error instead of
+        # trying forever.
+        self.banana_candidates = self.candidate_banana_locations()
+        self.portal_candidates = {}
+        if self.training_phase in ["6.a", "6.b", "6"]:
+            self.portal_candidates[None] = self.candidate_portal_pairs()
+        elif self.training_phase == "6.c": # One list per barrier column
+            for barrier_x in range(1, self.max_x):
+                self.portal_candidates[barrier_x] = self.candidate_portal_pairs(barrier_x)
+
+    def generate(self, count):
+        # Yields the next "count" trials
+        for _ in range(count):
+            yield self.next_trial()
+
+    def next_trial(self, pacman_location=None):
+        # Returns the TrialSpec of the next trial. In phases 2.a and 2.b, the
+        # pacman starts each trial where it was left at the end of the
+        # prior trial, which is passed in as pacman_location (if it isn't,
+        # the pacman is placed randomly).
+        self.trial_number += 1
+        trial = {"banana": None, "portals": None, "green_dot": None,
+                 "banana_direction": None, "portal_direction": None,
+                 "insight_trial_type": None}
+        self.place_barriers(trial)
+        self.place_portals(trial)
+        self.place_pacman(trial, pacman_location)
+        if self.training_phase not in NO_BANANA_PHASES:
+            self.place_banana(trial)
+        if self.training_phase == "6":
+            trial["green_dot"] = self.choose_from(trial["possible_green_dots"], "green dot locations")
+        par = ideal_strategy = path = None
+        if trial["banana"] is not None:
+            solution = self.par_cache.solve_trial(trial["pacman"], trial["banana"],
+                                                  trial["barriers"], trial["portals"])
+            par, ideal_strategy, path = solution.par, solution.ideal_strategy, solution.path
+        return TrialSpec(self.trial_number, trial["pacman"], trial["banana"],
+                         trial["barriers"], trial["portals"], trial["green_dot"],
+                         par, ideal_strategy, path, trial["banana_direction"],
+                         trial["portal_direction"], trial["insight_trial_type"])
+
+    def rand_grid_location(self):
+        # This just returns a random x/y location on the grid of active space.
+        return [self.rng.randint(0, self.max_x), self.rng.randint(0, self.max_y)]
+
+    def choose_from(self, candidates, description):
+        # Chooses randomly from a list of candidate placements. If there are
+        # none, no layout can work (e.g., the arena is too small), so an
+        # error is raised rather than trying forever.
+        if not candidates:
+            raise ValueError(f"No possible {description} in phase {self.training_phase} "
+                             f"({self.columns} x {self.rows} arena)")
+        return self.rng.choice(candidates)
+
+    def candidate_banana_locations(self):
+        # For phases 3.a through 4.a TEST, the banana is a set number of
+        # steps from the pacman in a random direction (one step N/E/S/W in
+        # 3.a and 3.b, two steps in 3.c and 3.d, or one step diagonally in
+        # 4.a). This lists, for every pacman location, each direction whose
+        # banana location falls inside the arena, along with that location.
+        if self.training_phase in ["3.a","3.b","3.b TEST"]:
+            number_of_steps = 1
+            directions = ["north", "east", "south", "west"]
+        elif self.training_phase in ["3.c", "3.d", "3.d TEST"]:
+            number_of_steps = 2
+            directions = ["north", "east", "south", "west"]
+        elif self.training_phase in ["4.a","4.a TEST"]:
+            number_of_steps = 1
+            directions = ["northeast", "southeast", "southwest", "northwest"]
+        else:
+            return {}
+        banana_candidates = {}
+        for x in range(self.columns):
+            for y in range(self.rows):
+                banana_candidates[(x, y)] = []
+                for direction in directions:
+                    banana_location = [x + DIRECTION_STEPS[direction][0] * number_of_steps,
+                                       y + DIRECTION_STEPS[direction][1] * number_of_steps]
+                    if 0 <= banana_location[0] <= self.max_x and 0 <= banana_location[1] <= self.max_y:
+                        banana_candidates[(x, y)].append((direction, banana_location))
+        return banana_candidates
+
+    def candidate_portal_pairs(self, barrier_x=None):
+        # First, we determine every border location that a portal could
+        # potentially be built. We are only using the l/r/bottom borders
+        # (because the pigeons could not reach the top of the screen), and
+        # because our arena is 3 x 6 moves, we have a matrix of 12 possible
+        # xy coordinates (3*2 + 6), as follows:
+        #               [[-1,0],[-1,1], [-1,2],
+        #         [0,3],[1,3], [2,3], [3,3], [4,3], [5,3],
+        #                 [6,0],[6,1], [6,2]]
+        # We can create this matrix by:
+        possible_portal_location_matrix = []
+        for y in list(range(0, self.max_y)):
+            possible_portal_location_matrix.append([-1, y])
+            possible_portal_location_matrix.append([self.max_x + 1, y])
+        for x in list(range(0, self.max_x)):
+            if self.training_phase == "6.c":
+                if x != barrier_x:
+                    possible_portal_location_matrix.append([x, self.max_y + 1])
+            elif self.training_phase == "6":
+                if x in [0, self.max_x]:
+                    possible_portal_location_matrix.append([x, self.max_y + 1])
+            else:
+                possible_portal_location_matrix.append([x, self.max_y + 1])
+        # The first portal can be anywhere (as long as there is somewhere
+        # the second can go). Then, for each first portal, we list where
+        # the second portal can be:
+        #   6.a/6.b - not adjacent to the first (more than 1 or 2 grid
+        #             units away along either axis)
+        #   6.c     - on the other side of the barrier column
+        #   6       - not in the same or a neighboring column
+        second_portals = {}
+        for choice1 in possible_portal_location_matrix:
+            second_portals[tuple(choice1)] = []
+            for choice2 in possible_portal_location_matrix:
+                if choice2 == choice1:
+                    continue
+                if self.training_phase in ["6.a", "6.b"]: # No barriers
+                    min_portal_dist = 1 if self.training_phase == "6.a" else 2
+                    allowed = (choice2[0] > choice1[0] + min_portal_dist) or (choice2[0] < choice1[0] - min_portal_dist) or (choice2[1] > choice1[1] + min_portal_dist) or (choice2[1] < choice1[1] - min_portal_dist)
+                elif self.training_phase in ["6.c"]: # When barriers exist, should be on either side
+                    allowed = (choice1[0] < barrier_x and choice2[0] > barrier_x) or (choice1[0] > barrier_x and choice2[0] < barrier_x)
+                else:
+                    allowed = choice2[0] != choice1[0]  and choice2[0] -1 != choice1[0] and choice2[0] +1 != choice1[0]
+                if allowed:
+                    second_portals[tuple(choice1)].append(choice2)
+        first_portals = [choice1 for choice1 in possible_portal_location_matrix if second_portals[tuple(choice1)]]
+        return first_portals, second_portals
+
+    def place_barriers(self, trial):
+        # 1) BARRIERS
+        barrier_grid_coords = []
+        # In 5.a, 5.b (single), 6.a, and 6.b, there is at least one barrier
+        # built somewhere in the "middle" of the arena (e.g., x location
+        # between 2 and 5) and in any y location. First, the initial barrier
+        # is built...
+        if self.training_phase in ["5.a", "5.b", "5.c", "5.d", "5 TEST"]:
+            barrier_grid_coords.append([self.rng.randint(1, self.max_x - 1),
+                                        self.rng.randint(0, self.max_y)])
+        # Next, in 5.c and 5.d, there will be an additional barrier vertically
+        # aligned with the first barrier. It is either above or below (but
+        # the x-grid location) the first barrier. In the 5 TEST phase, there
+        # is a 50:50 chance of a second barrier being built.
+        if self.training_phase in ["5.c", "5.d"] or (self.training_phase == "5 TEST" and self.rng.choice([True, False])):
+            y_locations = list(range(0, self.max_y + 1)) # All possible vertical locations
+            y_locations.remove(barrier_grid_coords[0][1]) # Remove the vertical location of the existing barrier
+            barrier_grid_coords.append([barrier_grid_coords[0][0],
+                                        self.rng.choice(y_locations)]) # Add new barrier to list
+        elif self.training_phase == "6.c":
+            xcord = self.rng.randint(1, self.max_x - 1)
+            for ycord in list(range(0, self.max_y + 1)):
+                barrier_grid_coords.append([xcord, ycord])
+        # Next, if the training phase is 7 TEST then the barrier should be completely
+        # blocking access to the banana. The preset layouts are cycled
+        # through in order for the first two rounds, then chosen randomly.
+        elif self.training_phase in ["7 TEST"]:
+            if self.trial_number <= len(self.insight_trial_layouts)*2:
+                object_location_dict = self.insight_trial_layouts.pop(0)
+                self.insight_trial_layouts.append(object_location_dict)
+            else:
+                object_location_dict = self.rng.choice(self.insight_trial_layouts)
+            trial["insight_layout"] = object_location_dict
+            trial["insight_trial_type"] = object_location_dict["Trial Type"]
+            barrier_grid_coords = [list(b) for b in object_location_dict["Barrier Grid Matrix"]]
+        # In phase 6, the whole arena starts off filled with barriers (some
+        # are removed once the pacman and portals are placed)
+        elif self.training_phase in ["6"]:
+            for r in list(range(0, self.max_y + 1)):
+                for c in list(range(0, self.max_x + 1)):
+                    barrier_grid_coords.append([c, r])
+        trial["barriers"] = barrier_grid_coords
+
+    def place_portals(self, trial):
+        ## 2) Portals
+        if self.training_phase not in PORTAL_PHASES:
+            return
+        barrier_grid_coords = trial["barriers"]
+        if self.training_phase == "7 TEST":
+            trial["portals"] = [list(p) for p in trial["insight_layout"]["Portal Grid Matrix"]]
+            return
+        # Both portals are chosen from the lists made by
+        # candidate_portal_pairs(), the first portal from anywhere it can
+        # go and the second from where it can go given the first
+        barrier_x = barrier_grid_coords[0][0] if self.training_phase == "6.c" else None
+        first_portals, second_portals = self.portal_candidates[barrier_x]
+        choice1 = list(self.choose_from(first_portals, "portal locations"))
+        choice2 = list(self.choose_from(second_portals[tuple(choice1)], "second portal locations"))
+        trial["portals"] = [choice1, choice2] # This should always be two elements long
+
+    def place_pacman(self, trial, pacman_location):
+        ## 3) PACMAN
+        barrier_grid_coords = trial["barriers"]
+        portal_grid_locations = trial["portals"]
+        if self.training_phase == "1.a":
+            # If the training phase is 1.a, then the pacman should just be
+            # centered in the middle of the screen.
+            pacman_grid_location = [2, 1]
+        elif self.training_phase in ["2.a", "2.b"]:
+            # If the training phase is 2.a or 2.b, the pacman is built in the
+            # same location it was after moving in the prior trial. First trial
+            # is in a random location.
+            if self.trial_number == 1 or pacman_location is None:
+                pacman_grid_location = self.rand_grid_location()
+            else:
+                pacman_grid_location = list(pacman_location)
+        # Next up are phases built in relation to barriers
+        elif self.training_phase in ["5.a", "5.c"]: # Pacman is built LEFT of barrier(s)
+            pacman_grid_location = [barrier_grid_coords[0][0] - 1,
+                                    self.rng.randint(0, self.max_y)]
+        elif self.training_phase in ["5.b", "5.d"]: # Pacman is built RIGHT of barrier(s)
+            pacman_grid_location = [barrier_grid_coords[0][0] + 1,
+                                    self.rng.randint(0, self.max_y)]
+        elif self.training_phase in ["5 TEST", "6.c"]:
+            if self.rng.choice([True, False]):
+                trial["pacman_LR"] = "Left"
+                pacman_grid_location = [self.rng.randint(0, barrier_grid_coords[0][0]-1),
+                                        self.rng.randint(0, self.max_y)]
+            else:
+                trial["pacman_LR"] = "Right"
+                pacman_grid_location = [self.rng.randint(barrier_grid_coords[0][0]+1, self.max_x),
+                                        self.rng.randint(0, self.max_y)]
+        # For 6.a, the pacman should be in front of portal choice number one
+        elif self.training_phase in ["6.a", "6"]:
+            if portal_grid_locations[0][0] < 0: # Portal is on left barrier
+                pacman_grid_location = [0, portal_grid_locations[0][1]]
+                trial["portal_direction"] = "west"
+            elif portal_grid_locations[0][0] > self.max_x: # Portal on right barrier
+                pacman_grid_location = [self.max_x, portal_grid_locations[0][1]]
+                trial["portal_direction"] = "east"
+            elif portal_grid_locations[0][1] > self.max_y: # horizontal portal
+                pacman_grid_location = [portal_grid_locations[0][0], self.max_y]
+                trial["portal_direction"] = "south"
+            # In phase 6, the barriers around the pacman and the second
+            # portal are removed. Those spaces are where the green dot can go.
+            if self.training_phase in ["6"]:
+                barrier_grid_coords.remove(pacman_grid_location)
+                barriers_to_remove = [[pacman_grid_location[0]+1, pacman_grid_location[1]],
+                                      [pacman_grid_location[0]-1, pacman_grid_location[1]],
+                                      [pacman_grid_location[0], pacman_grid_location[1]-1],
+                                      [pacman_grid_location[0], pacman_grid_location[1]+1],
+                                      [portal_grid_locations[1][0] +1, portal_grid_locations[1][1]],
+                                      [portal_grid_locations[1][0] -1, portal_grid_locations[1][1]],
+                                      [portal_grid_locations[1][0], portal_grid_locations[1][1] - 1],
+                                      [portal_grid_locations[1][0], portal_grid_locations[1][1] + 1]
+                                      ]
+                trial["possible_green_dots"] = []
+                for b in barriers_to_remove:
+                    if b in barrier_grid_coords:
+                        barrier_grid_coords.remove(b)
+                        trial["possible_green_dots"].append(b)
+        elif self.training_phase == "7 TEST":
+            pacman_grid_location = list(trial["insight_layout"]["Pacman Grid Location"])
+        # These base coordinates are randomly determined (for 6.b)
+        else:
+            pacman_grid_location = self.rand_grid_location()
+        trial["pacman"] = pacman_grid_location
+
+    def place_banana(self, trial):
+        # 4) BANANA
+        barrier_grid_coords = trial["barriers"]
+        # For training phases without a barrier:
+        if self.training_phase in ["3.a", "3.b", "3.c", "3.d", "4.a",
+                                   "3.b TEST", "3.d TEST", "4.a TEST"]:
+            # This function then determines the goal (banana) coordinates for
+            # this trial and phase number
+            banana_direction, banana_grid_location = self.choose_from(
+                self.banana_candidates[tuple(trial["pacman"])], "banana locations")
+            trial["banana_direction"] = banana_direction
+            banana_grid_location = list(banana_grid_location)
+        elif self.training_phase in ["4.b"]:
+            # In 4.b, banana is in a random place (that is not the pacman).
+            # One of the other locations is picked by number (skipping over
+            # the pacman's), rather than picking again if it hits the pacman.
+            if self.columns * self.rows < 2:
+                self.choose_from([], "banana locations")
+            pacman_number = trial["pacman"][1] * self.columns + trial["pacman"][0]
+            banana_number = self.rng.randrange(self.columns * self.rows - 1)
+            if banana_number >= pacman_number:
+                banana_number += 1
+            banana_grid_location = [banana_number % self.columns, banana_number // self.columns]
+        # Next up are phases when the banana is built in relation to barriers
+        elif self.training_phase in ["5.a", "5.c"]: # Banana is built RIGHT of barrier(s)
+            banana_grid_location = [barrier_grid_coords[0][0] + 1,
+                                    self.rng.randint(0, self.max_y)]
+        elif self.training_phase in ["5.b", "5.d"]: # Banana is built LEFT of barrier(s)
+            banana_grid_location = [barrier_grid_coords[0][0] - 1,
+                                    self.rng.randint(0, self.max_y)]
+        elif self.training_phase in ["5 TEST"]: # Banana can be L or R, depending on pacman
+            if trial["pacman_LR"] == "Left": # Build banana right
+                banana_grid_location = [self.rng.randint(barrier_grid_coords[0][0]+1, self.max_x),
+                                        self.rng.randint(0, self.max_y)]
+            else: # Left
+                banana_grid_location = [self.rng.randint(0, barrier_grid_coords[0][0]-1),
+                                        self.rng.randint(0, self.max_y)]
+        elif self.training_phase == "7 TEST":
+            banana_grid_location = list(trial["insight_layout"]["Banana Grid Location"])
+        trial["banana"] = banana_grid_location